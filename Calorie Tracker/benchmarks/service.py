@@ -0,0 +1,202 @@
+"""Load-tests the headless service layer with synthetic users and years of
+logs and reports latency percentiles per operation.
+
+    python benchmarks/service.py sqlite [--path FILE]
+    python benchmarks/service.py postgres
+
+The PostgreSQL run uses the usual DB_* settings. It creates its own
+"bench_" users and removes them, with their logs, when it is done."""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.helpers import calculate_calories, close_pool, get_connection, initialize_database
+from helpers.importer import MEAL_TYPES
+from helpers.local_store import LocalStore, timestamp
+from helpers.rollup import rebuild
+from helpers.service import LocalService, PostgresService
+
+FOODS = [
+    ("Apple", 52), ("Banana", 89), ("Bread", 265), ("Rice", 130), ("Chicken", 239),
+    ("Salmon", 208), ("Egg", 155), ("Oats", 389), ("Yogurt", 59), ("Cheese", 402),
+    ("Pasta", 131), ("Potato", 77), ("Broccoli", 34), ("Almonds", 579), ("Milk", 42),
+]
+
+
+def synthetic_logs(rng, user_id, years, logs_per_day):
+    """Yields (user_id, food_name, quantity, calories_per_100g,
+    total_calories, meal_type, date) rows, one to twice logs_per_day a day,
+    with some days skipped"""
+    today = date.today()
+    for offset in range(years * 365, -1, -1):
+        if rng.random() < 0.1:
+            continue
+        day = today - timedelta(days=offset)
+        for _ in range(rng.randint(1, logs_per_day * 2)):
+            food_name, calories = rng.choice(FOODS)
+            quantity = rng.randint(20, 400)
+            yield (
+                user_id, food_name, quantity, calories,
+                calculate_calories(quantity, calories), rng.choice(MEAL_TYPES), day
+            )
+
+
+def seed_sqlite(path, users, years, logs_per_day, rng):
+    store = LocalStore(path)
+    user_ids = list(range(1, users + 1))
+    count = 0
+    for user_id in user_ids:
+        store.cache_user(f"bench_{user_id}", user_id, "", 2000)
+        updated_at = timestamp()
+        rows = [
+            (str(uuid.uuid4()), *row[:6], str(row[6]), updated_at)
+            for row in synthetic_logs(rng, user_id, years, logs_per_day)
+        ]
+        store.merge(rows, [])
+        count += len(rows)
+    return LocalService(store), user_ids, count, store.close
+
+
+def seed_postgres(users, years, logs_per_day, rng):
+    from psycopg2.extras import execute_values
+
+    initialize_database()
+    prefix = f"bench_{os.getpid()}_"
+    user_ids = []
+    count = 0
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        for number in range(users):
+            cursor.execute(
+                "INSERT INTO users (username, password, daily_goal) VALUES (%s, %s, %s) RETURNING id",
+                (f"{prefix}{number}", "", 2000)
+            )
+            user_id = cursor.fetchone()[0]
+            user_ids.append(user_id)
+            rows = list(synthetic_logs(rng, user_id, years, logs_per_day))
+            execute_values(
+                cursor,
+                """INSERT INTO calorie_logs (user_id, food_name, quantity,
+                calories_per_100g, total_calories, meal_type, date) VALUES %s""",
+                rows,
+                page_size=1000
+            )
+            count += len(rows)
+        conn.commit()
+        for user_id in user_ids:
+            rebuild(conn, user_id)
+
+    def cleanup():
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            for table in ("daily_totals", "calorie_logs", "calorie_log_deletions"):
+                cursor.execute(f"DELETE FROM {table} WHERE user_id = ANY(%s)", (user_ids,))
+            cursor.execute("DELETE FROM users WHERE id = ANY(%s)", (user_ids,))
+            conn.commit()
+        close_pool()
+
+    return PostgresService(), user_ids, count, cleanup
+
+
+def measure(samples, name, operation):
+    start = time.perf_counter()
+    result = operation()
+    samples.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+    return result
+
+
+def run(service, user_ids, operations, rng, export_dir):
+    """Runs every operation operations times against random users and
+    returns the latencies in milliseconds by operation name"""
+    samples = {}
+    today = date.today()
+    week = [str(today - timedelta(days=i)) for i in range(6, -1, -1)]
+
+    for number in range(operations):
+        user_id = rng.choice(user_ids)
+        food_name, calories = rng.choice(FOODS)
+        day = str(today - timedelta(days=rng.randint(0, 30)))
+
+        log_id, _ = measure(samples, "add_log", lambda: service.add_log(
+            user_id, food_name, rng.randint(20, 400), calories, rng.choice(MEAL_TYPES), day
+        ))
+        measure(samples, "edit_log", lambda: service.edit_log(
+            log_id, food_name, rng.randint(20, 400), calories, rng.choice(MEAL_TYPES)
+        ))
+        measure(samples, "remove_log", lambda: service.remove_log(log_id))
+
+        meal = [(name, rng.randint(20, 400), calories) for name, calories in rng.sample(FOODS, 5)]
+        measure(samples, "add_logs (meal of 5)", lambda: service.add_logs(
+            user_id, meal, rng.choice(MEAL_TYPES), day
+        ))
+
+        _, next_page = measure(samples, "list_logs", lambda: service.list_logs(user_id))
+        measure(samples, "list_logs (page 2)", lambda: service.list_logs(user_id, next_page))
+        measure(samples, "daily_totals (7 days)", lambda: service.daily_totals(user_id, week))
+        measure(samples, "food_totals", lambda: service.food_totals(user_id))
+        measure(samples, "daily_series", lambda: service.daily_series(user_id, today))
+        measure(samples, "set_goal", lambda: service.set_goal(user_id, rng.randint(1500, 3000)))
+
+        # Exports are far slower than the rest, so fewer are run
+        if number % 10 == 0:
+            path = os.path.join(export_dir, f"export_{number}.csv")
+            measure(samples, "export_logs (csv)", lambda: service.export_logs(user_id, path))
+            os.remove(path)
+
+    return samples
+
+
+def report(samples):
+    print(f"{'operation':<24}{'runs':>6}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}  (ms)")
+    for name, values in samples.items():
+        if len(values) > 1:
+            percentiles = statistics.quantiles(values, n=100, method="inclusive")
+            p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+        else:
+            p50 = p90 = p99 = values[0]
+        print(f"{name:<24}{len(values):>6}{p50:>10.2f}{p90:>10.2f}{p99:>10.2f}{max(values):>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("backend", choices=["sqlite", "postgres"])
+    parser.add_argument("--path", default=":memory:", help="SQLite file (default: in memory)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--logs-per-day", type=int, default=4)
+    parser.add_argument("--operations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    if args.backend == "sqlite":
+        service, user_ids, count, cleanup = seed_sqlite(
+            args.path, args.users, args.years, args.logs_per_day, rng
+        )
+    else:
+        service, user_ids, count, cleanup = seed_postgres(
+            args.users, args.years, args.logs_per_day, rng
+        )
+    print(f"Seeded {count} logs for {len(user_ids)} users in {time.perf_counter() - start:.1f} s")
+
+    try:
+        with tempfile.TemporaryDirectory() as export_dir:
+            # One untimed round first, so one-off costs such as lazy imports
+            # and pool connections are not counted
+            run(service, user_ids, 1, rng, export_dir)
+            report(run(service, user_ids, args.operations, rng, export_dir))
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Measures how long the app takes from a cold interpreter to the login
+screen. Every run starts a fresh Python process so nothing is cached.
+
+    python benchmarks/startup.py [--runs N]
+
+Without a display only the import of main is timed."""
+import os
+import sys
+import time
+import json
+import argparse
+import statistics
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child process and prints its timings, in seconds, as JSON
+CHILD = """
+import json, time
+start = time.perf_counter()
+import main
+timings = {"import": time.perf_counter() - start}
+
+import tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError:
+    root = None
+
+if root is not None:
+    app = main.CaloriesCalculator(root)
+    root.update()
+    timings["login_screen"] = time.perf_counter() - start
+    root.destroy()
+
+print(json.dumps(timings))
+"""
+
+
+def run_once():
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    # Includes interpreter startup, which the in-process timings miss
+    timings["process"] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    for name in ("import", "login_screen", "process"):
+        values = [run[name] * 1000 for run in runs if name in run]
+        if not values:
+            print(f"{name:>12}: skipped (no display)")
+            continue
+        print(
+            f"{name:>12}: median {statistics.median(values):7.1f} ms"
+            f"  min {min(values):7.1f} ms  max {max(values):7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
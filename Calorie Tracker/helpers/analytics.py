@@ -0,0 +1,159 @@
+import numpy as np
+
+# Analytics over a user's calories per day. The totals are loaded once from
+# the daily_totals rollup into a gap-free array with one entry per day, so
+# every statistic below is a handful of vectorized operations even for
+# years of history.
+
+# Days within this fraction of the goal count as on target
+GOAL_TOLERANCE = 0.1
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# numpy weeks start on Thursday (the 1970 epoch); count from a Monday instead
+_MONDAY = np.datetime64("1969-12-29", "D")
+
+
+class DailySeries:
+    """Calories per day from the first to the last logged day, with zeros
+    for days without logs"""
+
+    def __init__(self, days, totals):
+        self.days = days
+        self.totals = totals
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def logged(self):
+        """Mask of the days with at least one log entry"""
+        return self.totals > 0
+
+
+def load_series(conn, user_id, end=None):
+    """Reads the user's daily totals into a DailySeries running until end
+    (a date) or the last logged day"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """SELECT date, SUM(total_calories) 
+        FROM daily_totals 
+        WHERE user_id=%s 
+        GROUP BY date 
+        ORDER BY date""",
+        (user_id,)
+    )
+    return make_series(cursor.fetchall(), end)
+
+
+def make_series(rows, end=None):
+    """Builds a DailySeries from (date, total) rows, extended with empty
+    days until end if given"""
+    if not rows:
+        return DailySeries(np.array([], dtype="datetime64[D]"), np.array([], dtype=float))
+
+    dates, totals = zip(*rows)
+    dates = np.array(dates, dtype="datetime64[D]")
+    first = dates.min()
+    last = max(dates.max(), np.datetime64(end, "D")) if end is not None else dates.max()
+
+    series = np.zeros((last - first).astype(int) + 1)
+    np.add.at(series, (dates - first).astype(int), np.array(totals, dtype=float))
+    return DailySeries(first + np.arange(len(series)), series)
+
+
+def rolling_mean(series, window):
+    """Mean intake over each day and the window - 1 days before it, counting
+    only logged days. NaN where the window holds no logged day."""
+    sums = np.cumsum(np.insert(series.totals, 0, 0.0))
+    counts = np.cumsum(np.insert(series.logged, 0, False).astype(int))
+    ends = np.arange(1, len(series) + 1)
+    starts = np.maximum(ends - window, 0)
+
+    window_sums = sums[ends] - sums[starts]
+    window_counts = counts[ends] - counts[starts]
+    return np.divide(
+        window_sums, window_counts,
+        out=np.full(len(series), np.nan), where=window_counts > 0
+    )
+
+
+def buckets(series, unit):
+    """Groups the days into weeks ("W", starting on Monday) or months ("M").
+    Returns the first day of each bucket, its total and its mean over the
+    logged days (0 for buckets without logs)."""
+    if unit == "W":
+        keys = (series.days - _MONDAY).astype(int) // 7
+        starts = _MONDAY + np.unique(keys) * 7
+    elif unit == "M":
+        months = series.days.astype("datetime64[M]")
+        keys = months.astype(int)
+        starts = np.unique(months).astype("datetime64[D]")
+    else:
+        raise ValueError(f"Unknown bucket unit: {unit}")
+
+    _, index = np.unique(keys, return_inverse=True)
+    totals = np.bincount(index, weights=series.totals)
+    logged_days = np.bincount(index, weights=series.logged)
+    means = np.divide(totals, logged_days, out=np.zeros_like(totals), where=logged_days > 0)
+    return starts, totals, means
+
+
+def streaks(mask):
+    """Returns the longest run of True values and the run ending at the
+    last value"""
+    if not len(mask):
+        return 0, 0
+
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.diff(padded)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if not len(starts):
+        return 0, 0
+
+    lengths = ends - starts
+    current = lengths[-1] if ends[-1] == len(mask) else 0
+    return int(lengths.max()), int(current)
+
+
+def goal_adherence(series, goal, tolerance=GOAL_TOLERANCE):
+    """Compares the logged days against a daily goal"""
+    totals = series.totals[series.logged]
+    difference = totals - goal
+    on_target = np.abs(difference) <= goal * tolerance
+
+    on_target_days = np.zeros(len(series), dtype=bool)
+    on_target_days[series.logged] = on_target
+
+    return {
+        "days": len(totals),
+        "on_target": int(on_target.sum()),
+        "deficit_days": int((difference < -goal * tolerance).sum()),
+        "surplus_days": int((difference > goal * tolerance).sum()),
+        "total_deficit": float(np.clip(-difference, 0, None).sum()),
+        "total_surplus": float(np.clip(difference, 0, None).sum()),
+        "mean_difference": float(difference.mean()) if len(totals) else 0.0,
+        "adherence": float(on_target.mean()) if len(totals) else 0.0,
+        "longest_on_target_streak": streaks(on_target_days)[0],
+    }
+
+
+def summarize(series, goal=None):
+    """Collects the headline statistics of a series"""
+    totals = series.totals[series.logged]
+    longest, current = streaks(series.logged)
+
+    summary = {
+        "logged_days": len(totals),
+        "mean": float(totals.mean()) if len(totals) else 0.0,
+        "percentiles": dict(zip(
+            PERCENTILES,
+            np.percentile(totals, PERCENTILES).tolist() if len(totals) else [0.0] * len(PERCENTILES)
+        )),
+        "longest_logging_streak": longest,
+        "current_logging_streak": current,
+    }
+    if goal:
+        summary["goal"] = goal_adherence(series, goal)
+    return summary
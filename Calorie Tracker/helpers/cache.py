@@ -0,0 +1,31 @@
+class DailyTotalsCache:
+    """Caches the calories logged per user and day. version changes with
+    every invalidation, so totals read before one are not stored."""
+
+    def __init__(self):
+        self._totals = {}
+        self.version = 0
+
+    def get(self, user_id, days):
+        """Returns the cached totals for the given days, or None if any
+        of them is missing"""
+        try:
+            return [self._totals[(user_id, day)] for day in days]
+        except KeyError:
+            return None
+
+    def store(self, user_id, totals, version=None):
+        """Stores a mapping of day -> total for a user, unless the cache was
+        invalidated since version was read"""
+        if version is not None and version != self.version:
+            return
+        for day, total in totals.items():
+            self._totals[(user_id, day)] = total
+
+    def invalidate(self, user_id, day):
+        self._totals.pop((user_id, day), None)
+        self.version += 1
+
+    def clear(self):
+        self._totals.clear()
+        self.version += 1
@@ -0,0 +1,130 @@
+from bisect import bisect_left
+from datetime import timedelta
+
+# Rows fetched per round trip when loading the whole catalog
+LOAD_BATCH_SIZE = 5000
+
+# Refreshes look this far behind the last one, so rows committed by a
+# transaction that started before it are not missed. Re-applying a row is
+# harmless.
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+
+class FoodCatalog:
+    """In-memory prefix index over food_data. Names are kept casefolded in
+    a sorted list, so a prefix lookup is a binary search followed by a scan
+    over the matches only."""
+
+    def __init__(self, rows=(), loaded_at=None):
+        """rows are (id, name, calories) tuples"""
+        self.loaded_at = loaded_at
+        self._foods = {food_id: (name, calories) for food_id, name, calories in rows}
+        # Parallel sorted lists; ids break ties between equal names
+        keys = sorted((name.casefold(), food_id) for food_id, (name, _) in self._foods.items())
+        self._keys = [key for key, _ in keys]
+        self._ids = [food_id for _, food_id in keys]
+
+    def __len__(self):
+        return len(self._foods)
+
+    def search(self, prefix, limit=10):
+        """Returns up to limit (name, calories) pairs whose name starts with
+        prefix, ignoring case, in alphabetical order"""
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+
+        matches = []
+        index = bisect_left(self._keys, prefix)
+        while index < len(self._keys) and len(matches) < limit and self._keys[index].startswith(prefix):
+            matches.append(self._foods[self._ids[index]])
+            index += 1
+        return matches
+
+    def lookup(self, name):
+        """Returns (id, calories) of a food with exactly this name, ignoring
+        case, or None"""
+        key = name.strip().casefold()
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            food_id = self._ids[index]
+            return food_id, self._foods[food_id][1]
+        return None
+
+    def _remove(self, food_id):
+        food = self._foods.pop(food_id, None)
+        if food is None:
+            return
+
+        key = food[0].casefold()
+        index = bisect_left(self._keys, key)
+        while self._ids[index] != food_id:
+            index += 1
+        del self._keys[index]
+        del self._ids[index]
+
+    def apply(self, changed, deleted, loaded_at):
+        """Applies rows added or updated and ids deleted since the last load"""
+        for food_id, name, calories in changed:
+            self._remove(food_id)
+            self._foods[food_id] = (name, calories)
+            key = name.casefold()
+            index = bisect_left(self._keys, key)
+            # Keep equal names ordered by id, like the initial sort
+            while index < len(self._keys) and self._keys[index] == key and self._ids[index] < food_id:
+                index += 1
+            self._keys.insert(index, key)
+            self._ids.insert(index, food_id)
+
+        for food_id in deleted:
+            self._remove(food_id)
+
+        self.loaded_at = loaded_at
+
+
+def _server_time(cursor):
+    cursor.execute("SELECT now()")
+    return cursor.fetchone()[0]
+
+
+def load_catalog(conn):
+    """Reads the whole food_data table into a new FoodCatalog"""
+    loaded_at = _server_time(conn.cursor())
+
+    rows = []
+    cursor = conn.cursor(name="load_food_catalog")
+    try:
+        cursor.itersize = LOAD_BATCH_SIZE
+        cursor.execute("SELECT id, name, calories FROM food_data")
+        while True:
+            batch = cursor.fetchmany(LOAD_BATCH_SIZE)
+            if not batch:
+                break
+            rows.extend(batch)
+    finally:
+        cursor.close()
+    conn.rollback()
+
+    return FoodCatalog(rows, loaded_at)
+
+
+def fetch_catalog_changes(conn, since):
+    """Returns the rows changed and the ids deleted since a previous load,
+    along with the time to pass to FoodCatalog.apply"""
+    cursor = conn.cursor()
+    loaded_at = _server_time(cursor)
+    since = since - REFRESH_OVERLAP
+
+    cursor.execute(
+        "SELECT id, name, calories FROM food_data WHERE updated_at > %s",
+        (since,)
+    )
+    changed = cursor.fetchall()
+    cursor.execute(
+        "SELECT id FROM food_data_deletions WHERE deleted_at > %s",
+        (since,)
+    )
+    deleted = [row[0] for row in cursor.fetchall()]
+    conn.rollback()
+
+    return changed, deleted, loaded_at
@@ -0,0 +1,192 @@
+import tkinter as tk
+import numpy as np
+from matplotlib import dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from helpers.analytics import rolling_mean
+
+# Charts are built once and their data is swapped in place on every update,
+# so showing a chart again only costs a redraw. Long series are downsampled
+# to about one point per horizontal pixel before drawing.
+
+# Foods shown individually in the bar chart; the rest are grouped
+TOP_FOODS = 20
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of a series to threshold
+    points, keeping the points that shape the line the most"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # The first and last points are always kept; the rest are split into
+    # threshold - 2 buckets and one point is chosen from each
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    sampled = np.empty(threshold, dtype=int)
+    sampled[0] = 0
+    sampled[-1] = n - 1
+
+    selected = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+
+        # Pick the point forming the largest triangle with the previously
+        # selected point and the average of the next bucket
+        areas = np.abs(
+            (x[selected] - next_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (next_y - y[selected])
+        )
+        selected = start + int(np.argmax(areas))
+        sampled[i + 1] = selected
+
+    return x[sampled], y[sampled]
+
+
+def downsample(x, y, width):
+    """Drops gaps (NaN) and reduces a series to about width points"""
+    keep = ~np.isnan(y)
+    return lttb(x[keep], y[keep], width)
+
+
+def top_n(labels, values, n=TOP_FOODS):
+    """Returns the n largest values with their labels, largest first, plus
+    one "Other" entry holding the sum of the rest"""
+    values = np.asarray(values, dtype=float)
+    if len(values) <= n:
+        order = np.argsort(-values, kind="stable")
+        return [labels[i] for i in order], values[order].tolist()
+
+    top = np.argpartition(-values, n)[:n]
+    top = top[np.argsort(-values[top], kind="stable")]
+    rest = np.ones(len(values), dtype=bool)
+    rest[top] = False
+
+    others = int(rest.sum())
+    return (
+        [labels[i] for i in top] + [f"Other ({others} food{'s' if others != 1 else ''})"],
+        values[top].tolist() + [float(values[rest].sum())]
+    )
+
+
+class ChartWindow:
+    """A window holding one figure. Closing it only hides it, so the figure
+    and canvas are reused the next time the chart is shown."""
+
+    def __init__(self, root, title):
+        self.root = root
+        self.title = title
+        self.figure = Figure(figsize=(7, 4), dpi=100)
+        self.ax = self.figure.add_subplot(111)
+        self.window = None
+        self.canvas = None
+
+    def plot_width(self):
+        """Width of the plotting area in pixels"""
+        return max(int(self.ax.get_window_extent().width), 100)
+
+    def show(self):
+        if self.window is None or not self.window.winfo_exists():
+            self.window = tk.Toplevel(self.root)
+            self.window.title(self.title)
+            self.window.protocol("WM_DELETE_WINDOW", self.window.withdraw)
+            self.canvas = FigureCanvasTkAgg(self.figure, master=self.window)
+            self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        else:
+            self.window.deiconify()
+            self.window.lift()
+        self.canvas.draw_idle()
+
+    def close(self):
+        """Destroys the window, if it was ever shown"""
+        if self.window is not None and self.window.winfo_exists():
+            self.window.destroy()
+        self.window = None
+        self.canvas = None
+
+
+class FoodChart(ChartWindow):
+    """Horizontal bars of the calories per food, top foods first"""
+
+    def __init__(self, root, size=TOP_FOODS):
+        super().__init__(root, "Calorie Intake")
+        self.size = size
+        # One bar per top food plus one for the grouped remainder
+        slots = np.arange(size + 1)
+        self.bars = self.ax.barh(slots, np.zeros(len(slots)), color="skyblue")
+        self.ax.set_yticks(slots)
+        self.ax.invert_yaxis()
+        self.ax.set_xlabel("Calories")
+        self.ax.set_title("Calorie Intake")
+        self.figure.subplots_adjust(left=0.3)
+
+    def update(self, data):
+        """data is a list of (food name, calories) pairs"""
+        food_names, calories = zip(*data)
+        labels, values = top_n(list(food_names), calories, self.size)
+
+        for index, bar in enumerate(self.bars):
+            bar.set_width(values[index] if index < len(values) else 0)
+        self.ax.set_yticklabels(labels + [""] * (len(self.bars) - len(labels)))
+        self.ax.set_xlim(0, max(values) * 1.05 or 1)
+
+
+class TrendChart(ChartWindow):
+    """Daily totals with rolling averages and the daily goal"""
+
+    def __init__(self, root):
+        super().__init__(root, "Calorie Intake Trend")
+        ax = self.ax
+        self.daily, = ax.plot([], [], marker="o", linestyle="", alpha=0.4, label="Daily total")
+        self.week, = ax.plot([], [], label="7-day average")
+        self.month, = ax.plot([], [], label="30-day average")
+        self.goal = ax.axhline(0, color="gray", linestyle="--", label="Daily goal", visible=False)
+        ax.xaxis_date()
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Total Calories")
+        ax.set_title("Calorie Intake Trend")
+        ax.legend()
+        self.figure.autofmt_xdate()
+
+    def update(self, series, goal=None):
+        """series is an analytics.DailySeries"""
+        x = mdates.date2num(series.days)
+        width = self.plot_width()
+        logged = series.logged
+
+        self.daily.set_data(*downsample(x[logged], series.totals[logged], width))
+        self.week.set_data(*downsample(x, rolling_mean(series, 7), width))
+        self.month.set_data(*downsample(x, rolling_mean(series, 30), width))
+        self.goal.set_visible(bool(goal))
+        if goal:
+            self.goal.set_ydata([goal, goal])
+
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+
+class DashboardChart:
+    """The dashboard's line chart, embedded in the main window. The caller
+    grids and hides its widget instead of destroying it."""
+
+    def __init__(self, master):
+        self.figure = Figure(figsize=(5, 3), dpi=100)
+        self.ax = self.figure.add_subplot(111)
+        self.line, = self.ax.plot([], [], marker="o")
+        self.ax.set_title("Daily Calorie Intake (Last 7 Days)")
+        self.ax.set_xlabel("Date")
+        self.ax.set_ylabel("Total Calories")
+        self.figure.subplots_adjust(bottom=0.3)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.widget = self.canvas.get_tk_widget()
+
+    def update(self, days, totals):
+        positions = np.arange(len(days))
+        self.line.set_data(positions, totals)
+        self.ax.set_xticks(positions, days, rotation=45, fontsize=10)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.canvas.draw_idle()
@@ -0,0 +1,138 @@
+import csv
+import gzip
+import itertools
+from datetime import date
+from importlib.util import find_spec
+
+# Parquet and Arrow output are only offered when pyarrow is installed. It is
+# imported by the export itself, as loading it at startup is slow.
+HAS_PYARROW = find_spec("pyarrow") is not None
+
+# Rows fetched from the server per round trip; memory use is bounded by this
+BATCH_SIZE = 2000
+
+COLUMNS = [
+    "Food Name",
+    "Quantity (g)",
+    "Calories per 100g",
+    "Total Calories",
+    "Meal Type",
+    "Date"
+]
+
+EXTENSIONS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+
+def available_formats():
+    if not HAS_PYARROW:
+        return ["csv", "csv.gz"]
+    return list(EXTENSIONS)
+
+
+def fetch_batches(conn, user_id, start=None, end=None, batch_size=BATCH_SIZE):
+    """Yields the user's logs, oldest first, in lists of at most batch_size
+    rows read through a server-side cursor. start and end are optional
+    inclusive date bounds."""
+    conditions = ["user_id=%s"]
+    params = [user_id]
+    if start is not None:
+        conditions.append("date >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("date <= %s")
+        params.append(end)
+
+    # A named cursor keeps the result on the server instead of in memory
+    cursor = conn.cursor(name="export_logs")
+    try:
+        cursor.itersize = batch_size
+        cursor.execute(
+            f"""SELECT food_name, 
+            quantity, 
+            calories_per_100g, 
+            total_calories, 
+            meal_type, 
+            date 
+            FROM calorie_logs 
+            WHERE {" AND ".join(conditions)} 
+            ORDER BY date, id""",
+            params
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _write_csv(batches, path, compress):
+    opener = gzip.open if compress else open
+    with opener(path, "wt", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(COLUMNS)
+        for rows in batches:
+            writer.writerows(rows)
+
+
+def _arrow_schema(pyarrow):
+    return pyarrow.schema([
+        ("food_name", pyarrow.string()),
+        ("quantity", pyarrow.int32()),
+        ("calories_per_100g", pyarrow.int32()),
+        ("total_calories", pyarrow.int32()),
+        ("meal_type", pyarrow.string()),
+        ("date", pyarrow.date32()),
+    ])
+
+
+def _write_columnar(batches, path, fmt):
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    schema = _arrow_schema(pyarrow)
+    if fmt == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+    else:
+        writer = pyarrow.ipc.new_file(path, schema)
+
+    with writer:
+        for rows in batches:
+            columns = [list(column) for column in zip(*rows)]
+            columns[5] = [
+                day if isinstance(day, date) else date.fromisoformat(day)
+                for day in columns[5]
+            ]
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(columns, schema=schema))
+
+
+def write_logs(batches, path, fmt="csv"):
+    """Writes batches of log rows to path and returns the number of rows.
+    Nothing is written when there are no rows."""
+    if fmt not in available_formats():
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    first = next(batches, None)
+    if first is None:
+        return 0
+
+    count = 0
+
+    def counted():
+        nonlocal count
+        for rows in itertools.chain([first], batches):
+            count += len(rows)
+            yield rows
+
+    if fmt in ("csv", "csv.gz"):
+        _write_csv(counted(), path, compress=fmt == "csv.gz")
+    else:
+        _write_columnar(counted(), path, fmt)
+    return count
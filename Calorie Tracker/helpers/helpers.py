@@ -1,9 +1,27 @@
 import os
+import time
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import extensions, pool
 from dotenv import load_dotenv
+from helpers.instrumentation import InstrumentedCursor
+from helpers.migrations import migrate
 
 load_dotenv()
 
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", 1))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", 5))
+# Connections idle for longer than this are pinged before being handed out
+HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_SECONDS", 30))
+# Give up on an unreachable server quickly instead of hanging
+CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(POOL_MAX_SIZE)
+_last_used = {}
+
 
 def calculate_bmr(weight: float, height: float, sex: str, age: int) -> int:
     """Calculates the bmr of the user"""
@@ -30,51 +48,105 @@ def calculate_calories(food_quantity: int, calories_per_100_g: int) -> int:
     return round((food_quantity / 100) * calories_per_100_g)
 
 
-def get_connection():
-    return psycopg2.connect(
+def _create_pool():
+    return pool.ThreadedConnectionPool(
+        POOL_MIN_SIZE,
+        POOL_MAX_SIZE,
         dbname=os.getenv("DB_NAME"),
         user=os.getenv("USER"),
         password=os.getenv("PASSWORD"),
         host=os.getenv("HOST"),
-        port=os.getenv("PORT")
+        port=os.getenv("PORT"),
+        connect_timeout=CONNECT_TIMEOUT,
+        # Times every statement for the query stats
+        cursor_factory=InstrumentedCursor
     )
 
+
+def get_pool():
+    """Returns the shared connection pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = _create_pool()
+        return _pool
+
+
+def close_pool():
+    """Closes every pooled connection"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
+
+
+def _is_healthy(conn):
+    """Checks a pooled connection before handing it out"""
+    if conn.closed:
+        return False
+
+    if conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+
+    last_used = _last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < HEALTH_CHECK_INTERVAL:
+        return True
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _discard(connection_pool, conn):
+    _last_used.pop(id(conn), None)
+    connection_pool.putconn(conn, close=True)
+
+
+@contextmanager
+def get_connection():
+    """Borrows a connection from the pool for the duration of a with block.
+    The connection always goes back to the pool, rolled back if the block
+    raised, and broken connections are replaced instead of reused."""
+    connection_pool = get_pool()
+    _pool_slots.acquire()
+
+    try:
+        conn = connection_pool.getconn()
+        # Each stale connection is replaced by a fresh one, which is healthy
+        for _ in range(POOL_MAX_SIZE):
+            if _is_healthy(conn):
+                break
+            _discard(connection_pool, conn)
+            conn = connection_pool.getconn()
+
+        broken = False
+        try:
+            yield conn
+        except BaseException:
+            if not conn.closed:
+                # A failed rollback must not hide the error being handled
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            raise
+        finally:
+            if broken or conn.closed:
+                _discard(connection_pool, conn)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+                connection_pool.putconn(conn)
+    finally:
+        _pool_slots.release()
+
+
 def initialize_database():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(100) UNIQUE NOT NULL,
-            password VARCHAR(200) NOT NULL,
-            daily_goal INTEGER DEFAULT 0
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS calorie_logs (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(id),
-            food_name VARCHAR(100) NOT NULL,
-            quantity INTEGER NOT NULL,
-            calories_per_100g INTEGER NOT NULL,
-            total_calories INTEGER NOT NULL,
-            meal_type VARCHAR(50) NOT NULL,
-            date DATE NOT NULL
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS food_data (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL,
-            calories REAL NOT NULL,
-            protein REAL,
-            carbs REAL,
-            fat REAL
-        )
-    """)
-
-    conn.commit()
-    conn.close()
+    """Brings the database schema up to date"""
+    with get_connection() as conn:
+        migrate(conn)
@@ -0,0 +1,167 @@
+import os
+import io
+import csv
+from datetime import date
+from helpers.export import COLUMNS
+from helpers.helpers import calculate_calories
+
+MEAL_TYPES = ("Breakfast", "Lunch", "Dinner", "Snack", "Other")
+
+# Only this many rejected rows are kept for the summary; the rejects file
+# written next to the import lists all of them
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportReport:
+    """Outcome of an import"""
+
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.rejects_path = None
+
+    def reject(self, line_number, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, reason))
+
+
+def parse_row(row):
+    """Validates a CSV row in the export layout and returns the values for
+    calorie_logs. Raises ValueError with the reason for invalid rows."""
+    if len(row) != len(COLUMNS):
+        raise ValueError(f"expected {len(COLUMNS)} columns, got {len(row)}")
+
+    food_name, quantity, calories_per_100g, _, meal_type, day = (value.strip() for value in row)
+
+    if not food_name or len(food_name) > 100:
+        raise ValueError("food name must be 1 to 100 characters")
+    try:
+        quantity = int(quantity)
+        calories_per_100g = int(calories_per_100g)
+    except ValueError:
+        raise ValueError("quantity and calories per 100g must be whole numbers")
+    if quantity <= 0 or calories_per_100g < 0:
+        raise ValueError("quantity must be positive and calories not negative")
+    if meal_type not in MEAL_TYPES:
+        raise ValueError(f"unknown meal type '{meal_type}'")
+    try:
+        day = date.fromisoformat(day)
+    except ValueError:
+        raise ValueError(f"invalid date '{day}'")
+
+    # Totals are recomputed rather than trusted, as add_item does
+    total_calories = calculate_calories(quantity, calories_per_100g)
+    return food_name, quantity, calories_per_100g, total_calories, meal_type, day.isoformat()
+
+
+class _CopyStream:
+    """Read-only file object that renders rows as CSV on demand, so COPY
+    streams an import of any size in constant memory"""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self._pending += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+
+        if size < 0:
+            data, self._pending = self._pending, ""
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+def _valid_rows(reader, report, rejects):
+    for row in reader:
+        if not any(value.strip() for value in row):
+            continue
+        try:
+            yield parse_row(row)
+        except ValueError as error:
+            report.reject(reader.line_num, str(error))
+            rejects.writerow([reader.line_num, str(error), *row])
+
+
+def import_logs(conn, user_id, path):
+    """Loads a CSV file in the export layout into the user's logs in one
+    transaction and returns an ImportReport. Valid rows are copied into a
+    staging table with COPY, then moved into calorie_logs and daily_totals
+    with one statement each. Invalid rows are skipped and written to
+    <path>.rejected.csv with their line number and reason."""
+    report = ImportReport()
+    rejects_path = f"{path}.rejected.csv"
+    rejects_file = None
+
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as lines:
+            reader = csv.reader(lines)
+            header = next(reader, None)
+            if header is None or [name.strip() for name in header] != COLUMNS:
+                raise ValueError("The file does not have the exported log columns: " + ", ".join(COLUMNS))
+
+            with open(rejects_path, "w", newline="") as rejects_file:
+                rejects = csv.writer(rejects_file)
+                rejects.writerow(["Line", "Reason", *COLUMNS])
+
+                cursor = conn.cursor()
+                cursor.execute("""
+                    CREATE TEMP TABLE import_staging (
+                        food_name VARCHAR(100) NOT NULL,
+                        quantity INTEGER NOT NULL,
+                        calories_per_100g INTEGER NOT NULL,
+                        total_calories INTEGER NOT NULL,
+                        meal_type VARCHAR(50) NOT NULL,
+                        date DATE NOT NULL
+                    ) ON COMMIT DROP
+                """)
+                cursor.copy_expert(
+                    """COPY import_staging 
+                    (food_name, quantity, calories_per_100g, total_calories, meal_type, date) 
+                    FROM STDIN WITH (FORMAT csv)""",
+                    _CopyStream(_valid_rows(reader, report, rejects))
+                )
+
+        cursor.execute("""
+            INSERT INTO calorie_logs
+            (user_id, food_name, quantity, calories_per_100g, total_calories, meal_type, date)
+            SELECT %s, food_name, quantity, calories_per_100g, total_calories, meal_type, date
+            FROM import_staging
+        """, (user_id,))
+        report.imported = cursor.rowcount
+
+        # One rollup refresh for the whole import instead of one per row
+        cursor.execute("""
+            INSERT INTO daily_totals
+            (user_id, date, food_name, meal_type, total_calories, entries)
+            SELECT %s, date, food_name, meal_type, SUM(total_calories), COUNT(*)
+            FROM import_staging
+            GROUP BY date, food_name, meal_type
+            ON CONFLICT (user_id, date, food_name, meal_type) DO UPDATE
+            SET total_calories = daily_totals.total_calories + EXCLUDED.total_calories,
+            entries = daily_totals.entries + EXCLUDED.entries
+        """, (user_id,))
+        conn.commit()
+    except BaseException:
+        # A failed import is rolled back, so its rejects file would describe
+        # rows that were never loaded
+        if rejects_file is not None:
+            os.remove(rejects_path)
+        raise
+
+    if report.rejected:
+        report.rejects_path = rejects_path
+    else:
+        os.remove(rejects_path)
+    return report
@@ -0,0 +1,188 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from psycopg2 import extensions
+
+# Every statement sent through the connection pool or the local store is
+# timed here. Statements are grouped by their text, with literals replaced
+# by "?", and by the lines of app code that ran them, so a screen issuing
+# the same query once per row shows up as one entry with a large count.
+
+# Statements slower than this are logged
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+# How many slow statements are kept for the summary
+SLOW_QUERY_HISTORY = 100
+
+logger = logging.getLogger(__name__)
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THIS_FILE = os.path.abspath(__file__)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Multi-row VALUES lists, as built by execute_values, collapse to one row
+_VALUE_ROWS = re.compile(r"(\(\?(?:,\s*\?)*\))(?:\s*,\s*\(\?(?:,\s*\?)*\))+")
+
+
+def normalize(statement):
+    """Returns the statement on one line with its literals replaced by ?"""
+    if isinstance(statement, bytes):
+        statement = statement.decode("utf-8", "replace")
+    elif not isinstance(statement, str):
+        # psycopg2.sql objects only render against a connection
+        statement = repr(statement)
+    statement = _LITERALS.sub("?", " ".join(statement.split()))
+    return _VALUE_ROWS.sub(r"\1, ...", statement)
+
+
+def redact(params):
+    """Replaces parameter values with their type names"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {name: type(value).__name__ for name, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+def call_site(depth=2):
+    """Returns the innermost frames of app code on the stack, as
+    "path:line function" joined by " < ", skipping this module and anything
+    outside the app directory"""
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < depth:
+        path = os.path.abspath(frame.f_code.co_filename)
+        if path != _THIS_FILE and path.startswith(_APP_DIR) and "site-packages" not in path:
+            frames.append(f"{os.path.relpath(path, _APP_DIR)}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return " < ".join(frames) or "unknown"
+
+
+class QueryStats:
+    """Per-statement counters shared by every thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.slow = deque(maxlen=SLOW_QUERY_HISTORY)
+
+    def record(self, statement, params, seconds, rows):
+        statement = normalize(statement)
+        site = call_site()
+        milliseconds = seconds * 1000
+
+        with self._lock:
+            entry = self._stats.get((statement, site))
+            if entry is None:
+                entry = self._stats[(statement, site)] = {
+                    "statement": statement,
+                    "call_site": site,
+                    "calls": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                }
+            entry["calls"] += 1
+            entry["total_ms"] += milliseconds
+            entry["max_ms"] = max(entry["max_ms"], milliseconds)
+            # Row counts are unknown (-1) for SELECTs on SQLite and server-side cursors
+            if rows is not None and rows >= 0:
+                entry["rows"] += rows
+
+            if milliseconds >= SLOW_QUERY_MS:
+                self.slow.append({
+                    "statement": statement,
+                    "call_site": site,
+                    "ms": round(milliseconds, 2),
+                    "params": redact(params),
+                    "at": datetime.now().isoformat(timespec="seconds"),
+                })
+
+        if milliseconds >= SLOW_QUERY_MS:
+            logger.warning(
+                "Slow query (%.1f ms) at %s: %s params=%s",
+                milliseconds, site, statement, redact(params)
+            )
+
+    def summary(self):
+        """Returns the statements, slowest in total first"""
+        with self._lock:
+            entries = [dict(entry) for entry in self._stats.values()]
+        for entry in entries:
+            entry["mean_ms"] = entry["total_ms"] / entry["calls"]
+        return sorted(entries, key=lambda entry: entry["total_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.slow.clear()
+
+    def export_json(self, path):
+        with self._lock:
+            slow = list(self.slow)
+        with open(path, "w") as f:
+            json.dump({
+                "generated_at": datetime.now().isoformat(timespec="seconds"),
+                "slow_query_ms": SLOW_QUERY_MS,
+                "statements": self.summary(),
+                "slow_queries": slow,
+            }, f, indent=2)
+
+
+STATS = QueryStats()
+
+
+class InstrumentedCursor(extensions.cursor):
+    """psycopg2 cursor that records every statement in STATS. For
+    server-side cursors only the execute is timed, not the fetches."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            STATS.record(query, vars, time.perf_counter() - start, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            STATS.record(query, None, time.perf_counter() - start, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            STATS.record(sql, None, time.perf_counter() - start, self.rowcount)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that records every statement in STATS"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        cursor = None
+        try:
+            cursor = super().execute(sql, parameters)
+            return cursor
+        finally:
+            rows = cursor.rowcount if cursor is not None else None
+            STATS.record(sql, parameters, time.perf_counter() - start, rows)
+
+    def executemany(self, sql, parameters):
+        start = time.perf_counter()
+        cursor = None
+        try:
+            cursor = super().executemany(sql, parameters)
+            return cursor
+        finally:
+            rows = cursor.rowcount if cursor is not None else None
+            STATS.record(sql, None, time.perf_counter() - start, rows)
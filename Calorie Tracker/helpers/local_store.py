@@ -0,0 +1,279 @@
+import uuid
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from helpers.instrumentation import InstrumentedConnection
+
+# The local store is a SQLite copy of the logged-in user's calorie logs. The
+# app reads and writes it directly; sync.py pushes the rows marked dirty to
+# PostgreSQL and pulls the rows changed there. Each row carries the time of
+# its last change, and the newest change wins when both sides edited a row.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    uuid TEXT UNIQUE NOT NULL,
+    user_id INTEGER NOT NULL,
+    food_name TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    calories_per_100g INTEGER NOT NULL,
+    total_calories INTEGER NOT NULL,
+    meal_type TEXT NOT NULL,
+    date TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    dirty INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS logs_user_date_idx ON logs (user_id, date, seq);
+CREATE INDEX IF NOT EXISTS logs_dirty_idx ON logs (user_id, dirty);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    id INTEGER NOT NULL,
+    password TEXT NOT NULL,
+    daily_goal INTEGER
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id INTEGER PRIMARY KEY,
+    pulled_at TEXT
+);
+"""
+
+_LOG_COLUMNS = "uuid, user_id, food_name, quantity, calories_per_100g, total_calories, meal_type, date, updated_at"
+
+
+def timestamp(moment=None):
+    """Formats a time as UTC ISO text, which sorts in time order"""
+    moment = moment or datetime.now(timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+class LocalStore:
+    """SQLite store shared by the Tk thread and the sync thread"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, factory=InstrumentedConnection)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _write(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).rowcount
+
+    # Credentials, so users can log in while offline
+
+    def cache_user(self, username, user_id, password_hash, daily_goal):
+        self._write(
+            """INSERT INTO users (username, id, password, daily_goal) VALUES (?, ?, ?, ?)
+            ON CONFLICT (username) DO UPDATE
+            SET id=excluded.id, password=excluded.password, daily_goal=excluded.daily_goal""",
+            (username, user_id, password_hash, daily_goal)
+        )
+
+    def cached_user(self, username):
+        """Returns (id, password, daily_goal) like the users query, or None"""
+        rows = self._query("SELECT id, password, daily_goal FROM users WHERE username=?", (username,))
+        return rows[0] if rows else None
+
+    # Logs
+
+    def add_log(self, user_id, food_name, quantity, calories_per_100g, total_calories, meal_type, day):
+        """Stores a new log entry to be pushed and returns its uuid"""
+        log_uuid = str(uuid.uuid4())
+        self._write(
+            f"""INSERT INTO logs ({_LOG_COLUMNS}, dirty)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)""",
+            (log_uuid, user_id, food_name, quantity, calories_per_100g,
+             total_calories, meal_type, str(day), timestamp())
+        )
+        return log_uuid
+
+    def add_logs(self, user_id, items, meal_type, day):
+        """Stores several entries in one transaction. items are (food_name,
+        quantity, calories_per_100g, total_calories). Returns their uuids."""
+        updated_at = timestamp()
+        rows = [
+            (str(uuid.uuid4()), user_id, *item[:4], meal_type, str(day), updated_at)
+            for item in items
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"""INSERT INTO logs ({_LOG_COLUMNS}, dirty)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)""",
+                rows
+            )
+        return [row[0] for row in rows]
+
+    def get_log(self, log_uuid):
+        """Returns (food_name, quantity, calories_per_100g) of an entry"""
+        rows = self._query(
+            "SELECT food_name, quantity, calories_per_100g FROM logs WHERE uuid=? AND NOT deleted",
+            (log_uuid,)
+        )
+        return rows[0] if rows else None
+
+    def update_log(self, log_uuid, food_name, quantity, calories_per_100g, total_calories, meal_type):
+        """Edits an entry and returns its date, or None if it is gone"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT date FROM logs WHERE uuid=? AND NOT deleted", (log_uuid,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                """UPDATE logs SET food_name=?, quantity=?, calories_per_100g=?,
+                total_calories=?, meal_type=?, updated_at=?, dirty=1 WHERE uuid=?""",
+                (food_name, quantity, calories_per_100g, total_calories,
+                 meal_type, timestamp(), log_uuid)
+            )
+            return row[0]
+
+    def delete_log(self, log_uuid):
+        """Marks an entry deleted and returns its date, or None if it is gone.
+        The row stays as a tombstone until the deletion is pushed."""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT date FROM logs WHERE uuid=? AND NOT deleted", (log_uuid,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE logs SET deleted=1, updated_at=?, dirty=1 WHERE uuid=?",
+                (timestamp(), log_uuid)
+            )
+            return row[0]
+
+    def list_logs(self, user_id, page_end, limit):
+        """Returns a page of (uuid, food_name, quantity, total_calories,
+        meal_type, date) rows, newest first, and the key of the next page.
+        page_end is None for the first page, which starts at today."""
+        if page_end is None:
+            condition, params = "date <= ?", (str(datetime.now().date()),)
+        else:
+            condition, params = "(date < ? OR (date = ? AND seq < ?))", (page_end[0], page_end[0], page_end[1])
+
+        rows = self._query(
+            f"""SELECT uuid, food_name, quantity, total_calories, meal_type, date, seq
+            FROM logs WHERE user_id=? AND NOT deleted AND {condition}
+            ORDER BY date DESC, seq DESC LIMIT ?""",
+            (user_id, *params, limit)
+        )
+        next_page = (rows[-1][5], rows[-1][6]) if rows else None
+        return [row[:6] for row in rows], next_page
+
+    def daily_totals(self, user_id, days):
+        """Returns the calories logged on each of the given days"""
+        rows = self._query(
+            """SELECT date, SUM(total_calories) FROM logs
+            WHERE user_id=? AND NOT deleted AND date BETWEEN ? AND ?
+            GROUP BY date""",
+            (user_id, min(days), max(days))
+        )
+        by_day = dict(rows)
+        return [int(by_day.get(day, 0)) for day in days]
+
+    def totals_by_day(self, user_id):
+        """Returns (date, total) rows for every logged day, oldest first"""
+        return self._query(
+            """SELECT date, SUM(total_calories) FROM logs
+            WHERE user_id=? AND NOT deleted GROUP BY date ORDER BY date""",
+            (user_id,)
+        )
+
+    def food_totals(self, user_id):
+        """Returns (food_name, total) rows over all of the user's logs"""
+        return self._query(
+            """SELECT food_name, SUM(total_calories) FROM logs
+            WHERE user_id=? AND NOT deleted GROUP BY food_name""",
+            (user_id,)
+        )
+
+    def log_batches(self, user_id, start=None, end=None, batch_size=2000):
+        """Yields the user's logs, oldest first, in lists of at most
+        batch_size rows laid out like export.fetch_batches. The lock is only
+        held while a batch is read."""
+        start = str(start) if start is not None else "0000-01-01"
+        end = str(end) if end is not None else "9999-12-31"
+        last = ("", 0)
+        while True:
+            rows = self._query(
+                """SELECT food_name, quantity, calories_per_100g, total_calories,
+                meal_type, date, seq FROM logs
+                WHERE user_id=? AND NOT deleted AND date BETWEEN ? AND ?
+                AND (date > ? OR (date = ? AND seq > ?))
+                ORDER BY date, seq LIMIT ?""",
+                (user_id, start, end, last[0], last[0], last[1], batch_size)
+            )
+            if not rows:
+                return
+            last = (rows[-1][5], rows[-1][6])
+            yield [row[:6] for row in rows]
+
+    def set_goal(self, user_id, goal):
+        self._write("UPDATE users SET daily_goal=? WHERE id=?", (goal, user_id))
+
+    # Sync bookkeeping
+
+    def dirty_logs(self, user_id):
+        """Returns the entries changed locally, as (uuid, user_id, food_name,
+        quantity, calories_per_100g, total_calories, meal_type, date,
+        updated_at, deleted) rows"""
+        return self._query(
+            f"SELECT {_LOG_COLUMNS}, deleted FROM logs WHERE user_id=? AND dirty",
+            (user_id,)
+        )
+
+    def mark_pushed(self, log_uuid, updated_at):
+        """Clears the dirty flag unless the entry changed again meanwhile.
+        Pushed deletions are dropped for good."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM logs WHERE uuid=? AND updated_at=? AND deleted",
+                (log_uuid, updated_at)
+            )
+            self._conn.execute(
+                "UPDATE logs SET dirty=0 WHERE uuid=? AND updated_at=?",
+                (log_uuid, updated_at)
+            )
+
+    def merge(self, rows, deletions):
+        """Applies rows and deletions pulled from the server. rows are
+        (uuid, user_id, food_name, quantity, calories_per_100g,
+        total_calories, meal_type, date, updated_at) and deletions are
+        (uuid, deleted_at). Local changes newer than the server's win."""
+        with self._lock, self._conn:
+            for row in rows:
+                self._conn.execute(
+                    f"""INSERT INTO logs ({_LOG_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (uuid) DO UPDATE SET
+                    food_name=excluded.food_name, quantity=excluded.quantity,
+                    calories_per_100g=excluded.calories_per_100g,
+                    total_calories=excluded.total_calories, meal_type=excluded.meal_type,
+                    date=excluded.date, updated_at=excluded.updated_at, deleted=0, dirty=0
+                    WHERE excluded.updated_at > logs.updated_at""",
+                    row
+                )
+            for log_uuid, deleted_at in deletions:
+                self._conn.execute(
+                    "DELETE FROM logs WHERE uuid=? AND updated_at <= ?",
+                    (log_uuid, deleted_at)
+                )
+
+    def pulled_at(self, user_id):
+        rows = self._query("SELECT pulled_at FROM sync_state WHERE user_id=?", (user_id,))
+        return rows[0][0] if rows else None
+
+    def set_pulled_at(self, user_id, pulled_at):
+        self._write(
+            """INSERT INTO sync_state (user_id, pulled_at) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET pulled_at=excluded.pulled_at""",
+            (user_id, pulled_at)
+        )
@@ -0,0 +1,247 @@
+from psycopg2 import errors
+
+# Each migration is a description and the statements that apply it. Append
+# new migrations to the end; never edit or reorder ones that have shipped.
+MIGRATIONS = [
+    (
+        "Create users, calorie_logs and food_data",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                username VARCHAR(100) UNIQUE NOT NULL,
+                password VARCHAR(200) NOT NULL,
+                daily_goal INTEGER DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS calorie_logs (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER REFERENCES users(id),
+                food_name VARCHAR(100) NOT NULL,
+                quantity INTEGER NOT NULL,
+                calories_per_100g INTEGER NOT NULL,
+                total_calories INTEGER NOT NULL,
+                meal_type VARCHAR(50) NOT NULL,
+                date DATE NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS food_data (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL,
+                calories REAL NOT NULL,
+                protein REAL,
+                carbs REAL,
+                fat REAL
+            )
+            """,
+        ]
+    ),
+    (
+        "Index calorie_logs by user and date",
+        ["CREATE INDEX IF NOT EXISTS calorie_logs_user_date_idx ON calorie_logs (user_id, date)"]
+    ),
+    (
+        "Index calorie_logs by user and food",
+        ["CREATE INDEX IF NOT EXISTS calorie_logs_user_food_idx ON calorie_logs (user_id, food_name)"]
+    ),
+    (
+        "Add the daily_totals rollup of calorie_logs",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS daily_totals (
+                user_id INTEGER REFERENCES users(id),
+                date DATE NOT NULL,
+                food_name VARCHAR(100) NOT NULL,
+                meal_type VARCHAR(50) NOT NULL,
+                total_calories BIGINT NOT NULL,
+                entries INTEGER NOT NULL,
+                PRIMARY KEY (user_id, date, food_name, meal_type)
+            )
+            """,
+            """
+            INSERT INTO daily_totals
+            (user_id, date, food_name, meal_type, total_calories, entries)
+            SELECT user_id, date, food_name, meal_type, SUM(total_calories), COUNT(*)
+            FROM calorie_logs
+            GROUP BY user_id, date, food_name, meal_type
+            """,
+        ]
+    ),
+    (
+        "Track food_data changes for incremental catalog refreshes",
+        [
+            "ALTER TABLE food_data ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            "CREATE INDEX IF NOT EXISTS food_data_updated_at_idx ON food_data (updated_at)",
+            """
+            CREATE TABLE IF NOT EXISTS food_data_deletions (
+                id INTEGER PRIMARY KEY,
+                deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS food_data_deletions_deleted_at_idx ON food_data_deletions (deleted_at)",
+            """
+            CREATE OR REPLACE FUNCTION food_data_touch() RETURNS trigger AS $$
+            BEGIN
+                NEW.updated_at = now();
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            """
+            CREATE TRIGGER food_data_touch
+            BEFORE UPDATE ON food_data
+            FOR EACH ROW EXECUTE FUNCTION food_data_touch()
+            """,
+            """
+            CREATE OR REPLACE FUNCTION food_data_record_deletion() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO food_data_deletions (id) VALUES (OLD.id)
+                ON CONFLICT (id) DO UPDATE SET deleted_at = now();
+                RETURN OLD;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            """
+            CREATE TRIGGER food_data_record_deletion
+            AFTER DELETE ON food_data
+            FOR EACH ROW EXECUTE FUNCTION food_data_record_deletion()
+            """,
+        ]
+    ),
+    (
+        "Add uuids, change times and deletion records to calorie_logs for syncing",
+        [
+            # gen_random_uuid() is built in from PostgreSQL 13; older servers
+            # get it from pgcrypto
+            """
+            DO $$
+            BEGIN
+                IF current_setting('server_version_num')::integer < 130000 THEN
+                    CREATE EXTENSION IF NOT EXISTS pgcrypto;
+                END IF;
+            END
+            $$
+            """,
+            "ALTER TABLE calorie_logs ADD COLUMN IF NOT EXISTS uuid UUID NOT NULL DEFAULT gen_random_uuid()",
+            "CREATE UNIQUE INDEX IF NOT EXISTS calorie_logs_uuid_idx ON calorie_logs (uuid)",
+            # updated_at is when the row was last edited, on whichever device;
+            # changed_at is when the server received that edit
+            "ALTER TABLE calorie_logs ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            "ALTER TABLE calorie_logs ADD COLUMN IF NOT EXISTS changed_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            "CREATE INDEX IF NOT EXISTS calorie_logs_user_changed_idx ON calorie_logs (user_id, changed_at)",
+            """
+            CREATE OR REPLACE FUNCTION calorie_logs_touch() RETURNS trigger AS $$
+            BEGIN
+                NEW.changed_at = now();
+                IF TG_OP = 'UPDATE' AND NEW.updated_at IS NOT DISTINCT FROM OLD.updated_at THEN
+                    NEW.updated_at = now();
+                END IF;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            """
+            CREATE TRIGGER calorie_logs_touch
+            BEFORE INSERT OR UPDATE ON calorie_logs
+            FOR EACH ROW EXECUTE FUNCTION calorie_logs_touch()
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS calorie_log_deletions (
+                uuid UUID PRIMARY KEY,
+                user_id INTEGER REFERENCES users(id),
+                deleted_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                recorded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS calorie_log_deletions_user_recorded_idx ON calorie_log_deletions (user_id, recorded_at)",
+            """
+            CREATE OR REPLACE FUNCTION calorie_logs_record_deletion() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO calorie_log_deletions (uuid, user_id) VALUES (OLD.uuid, OLD.user_id)
+                ON CONFLICT (uuid) DO UPDATE SET deleted_at = now(), recorded_at = now();
+                RETURN OLD;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            """
+            CREATE TRIGGER calorie_logs_record_deletion
+            AFTER DELETE ON calorie_logs
+            FOR EACH ROW EXECUTE FUNCTION calorie_logs_record_deletion()
+            """,
+        ]
+    ),
+    (
+        "Add saved recipes made of food_data items",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS recipes (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES users(id),
+                name VARCHAR(100) NOT NULL,
+                UNIQUE (user_id, name)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS recipe_items (
+                recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+                food_id INTEGER NOT NULL REFERENCES food_data(id) ON DELETE CASCADE,
+                grams INTEGER NOT NULL CHECK (grams > 0)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS recipe_items_recipe_idx ON recipe_items (recipe_id)",
+        ]
+    ),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Key for the advisory lock that keeps two app instances from migrating at once
+MIGRATION_LOCK_ID = 0x63616C6F
+
+
+def get_schema_version(conn):
+    """Returns the applied schema version, 0 for a database never migrated"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+    except errors.UndefinedTable:
+        conn.rollback()
+        return 0
+
+    version = cursor.fetchone()[0]
+    conn.rollback()
+    return version or 0
+
+
+def migrate(conn):
+    """Applies every pending migration in a single transaction and returns
+    how many were applied. A current schema costs one query and no DDL."""
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return 0
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """)
+
+    # Another instance may have migrated while we waited for the lock
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    version = cursor.fetchone()[0] or 0
+
+    for number, (description, statements) in enumerate(MIGRATIONS[version:], start=version + 1):
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(
+            "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+            (number, description)
+        )
+
+    conn.commit()
+    return SCHEMA_VERSION - version
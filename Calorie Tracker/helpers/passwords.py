@@ -0,0 +1,39 @@
+import os
+
+# bcrypt is imported on first use, which happens on the database worker
+# after the login screen is up rather than at startup.
+
+# Work factor for new hashes. Each step doubles the time a hash takes.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+
+def _as_bytes(stored_hash):
+    """Normalises a hash read from the database to bytes"""
+    if isinstance(stored_hash, memoryview):
+        return bytes(stored_hash)
+    if isinstance(stored_hash, str):
+        # Hashes inserted as bytes by older versions ended up as bytea hex text
+        if stored_hash.startswith("\\x"):
+            return bytes.fromhex(stored_hash[2:])
+        return stored_hash.encode("ascii")
+    return stored_hash
+
+
+def hash_password(password, rounds=None):
+    """Hashes a password for storage, as text"""
+    import bcrypt
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("ascii")
+
+
+def check_password(password, stored_hash):
+    import bcrypt
+    return bcrypt.checkpw(password.encode("utf-8"), _as_bytes(stored_hash))
+
+
+def needs_rehash(stored_hash, rounds=None):
+    """Tells whether a hash was made with a different cost or stored in the
+    legacy format, and should be replaced after a successful login"""
+    if not isinstance(stored_hash, str) or stored_hash.startswith("\\x"):
+        return True
+    return int(stored_hash.split("$")[2]) != (rounds or BCRYPT_ROUNDS)
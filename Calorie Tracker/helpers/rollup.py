@@ -0,0 +1,96 @@
+import sys
+from psycopg2.extras import execute_values
+
+# daily_totals holds one row per user, day, food and meal with the summed
+# calories and number of log entries behind it. Every change to calorie_logs
+# applies the matching delta in the same transaction, so reports read a few
+# rows per day instead of every log entry.
+
+_UPSERT = """
+    INSERT INTO daily_totals
+    (user_id, date, food_name, meal_type, total_calories, entries)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (user_id, date, food_name, meal_type) DO UPDATE
+    SET total_calories = daily_totals.total_calories + EXCLUDED.total_calories,
+    entries = daily_totals.entries + EXCLUDED.entries
+"""
+
+_UPSERT_MANY = """
+    INSERT INTO daily_totals
+    (user_id, date, food_name, meal_type, total_calories, entries)
+    VALUES %s
+    ON CONFLICT (user_id, date, food_name, meal_type) DO UPDATE
+    SET total_calories = daily_totals.total_calories + EXCLUDED.total_calories,
+    entries = daily_totals.entries + EXCLUDED.entries
+"""
+
+_DELETE_EMPTY = """
+    DELETE FROM daily_totals
+    WHERE user_id=%s AND date=%s AND food_name=%s AND meal_type=%s AND entries <= 0
+"""
+
+
+def apply_delta(cursor, row, entries):
+    """Adds (entries=1) or subtracts (entries=-1) a log entry to its rollup
+    row. row is (user_id, date, food_name, meal_type, total_calories)."""
+    user_id, day, food_name, meal_type, total_calories = row
+    cursor.execute(
+        _UPSERT,
+        (user_id, day, food_name, meal_type, total_calories * entries, entries)
+    )
+    if entries < 0:
+        cursor.execute(_DELETE_EMPTY, (user_id, day, food_name, meal_type))
+
+
+def add_entries(cursor, rows):
+    """Adds many new log entries to the rollup with a single statement.
+    rows are (user_id, date, food_name, meal_type, total_calories)."""
+    # One statement cannot update the same rollup row twice, so entries
+    # for the same food and meal are summed first
+    grouped = {}
+    for user_id, day, food_name, meal_type, total_calories in rows:
+        key = (user_id, day, food_name, meal_type)
+        calories, entries = grouped.get(key, (0, 0))
+        grouped[key] = (calories + total_calories, entries + 1)
+
+    execute_values(
+        cursor,
+        _UPSERT_MANY,
+        [(*key, calories, entries) for key, (calories, entries) in grouped.items()]
+    )
+
+
+def rebuild(conn, user_id=None):
+    """Recomputes daily_totals from calorie_logs, for one user or everyone,
+    and returns the number of rollup rows written"""
+    cursor = conn.cursor()
+    # Hold off log changes until the rebuilt rows are committed
+    cursor.execute("LOCK TABLE calorie_logs IN SHARE MODE")
+    if user_id is None:
+        cursor.execute("DELETE FROM daily_totals")
+        where, params = "", ()
+    else:
+        cursor.execute("DELETE FROM daily_totals WHERE user_id=%s", (user_id,))
+        where, params = "WHERE user_id=%s", (user_id,)
+
+    cursor.execute(f"""
+        INSERT INTO daily_totals
+        (user_id, date, food_name, meal_type, total_calories, entries)
+        SELECT user_id, date, food_name, meal_type, SUM(total_calories), COUNT(*)
+        FROM calorie_logs
+        {where}
+        GROUP BY user_id, date, food_name, meal_type
+    """, params)
+    conn.commit()
+    return cursor.rowcount
+
+
+if __name__ == "__main__":
+    # Usage: python -m helpers.rollup [user_id]
+    from helpers.helpers import get_connection, close_pool
+
+    target = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    with get_connection() as conn:
+        count = rebuild(conn, target)
+    close_pool()
+    print(f"Rebuilt {count} daily total rows.")
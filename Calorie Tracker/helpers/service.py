@@ -0,0 +1,359 @@
+import uuid
+from datetime import date
+from psycopg2.extras import execute_values
+from helpers.export import BATCH_SIZE, fetch_batches, write_logs
+from helpers.helpers import calculate_calories, get_connection
+from helpers.rollup import add_entries, apply_delta
+
+# The app's data operations, free of any Tk code so they can be scripted and
+# load-tested. PostgresService works against the server and LocalService
+# against a LocalStore; both offer the same methods. Log ids are integers on
+# the server and uuids in the local store. Recipes are kept on the server
+# only.
+
+
+def _with_totals(items):
+    """Adds total calories to (food_name, quantity, calories_per_100g)
+    items"""
+    return [
+        (food_name, quantity, calories_per_100g, calculate_calories(quantity, calories_per_100g))
+        for food_name, quantity, calories_per_100g in items
+    ]
+
+
+class PostgresService:
+    """Data operations against the PostgreSQL server"""
+
+    def add_log(self, user_id, food_name, quantity, calories_per_100g, meal_type, day):
+        """Inserts a log entry and its rollup change. Returns the entry's
+        id and total calories."""
+        total_calories = calculate_calories(quantity, calories_per_100g)
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO calorie_logs
+                (user_id,
+                food_name,
+                quantity,
+                calories_per_100g,
+                total_calories,
+                meal_type,
+                date)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """,
+            (
+                user_id,
+                food_name,
+                quantity,
+                calories_per_100g,
+                total_calories,
+                meal_type, day
+            )
+            )
+            log_id = cursor.fetchone()[0]
+            apply_delta(
+                cursor,
+                (user_id, day, food_name, meal_type, total_calories),
+                1
+            )
+            conn.commit()
+        return log_id, total_calories
+
+    def add_logs(self, user_id, items, meal_type, day):
+        """Inserts several log entries for one meal, and their rollup
+        changes, in one transaction with one statement each. items are
+        (food_name, quantity, calories_per_100g). Returns (id, total
+        calories) for each item, in order."""
+        items = _with_totals(items)
+        # RETURNING does not promise the order of VALUES, so each row gets
+        # its uuid here and the ids are matched back by it
+        uuids = [str(uuid.uuid4()) for _ in items]
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            returned = execute_values(
+                cursor,
+                """INSERT INTO calorie_logs
+                (uuid, user_id, food_name, quantity, calories_per_100g, total_calories, meal_type, date)
+                VALUES %s
+                RETURNING uuid::text, id""",
+                [(log_uuid, user_id, *item, meal_type, day) for log_uuid, item in zip(uuids, items)],
+                fetch=True
+            )
+            add_entries(cursor, [(user_id, day, item[0], meal_type, item[3]) for item in items])
+            conn.commit()
+        ids = dict(returned)
+        return [(ids[log_uuid], item[3]) for log_uuid, item in zip(uuids, items)]
+
+    def get_log(self, log_id):
+        """Returns (food_name, quantity, calories_per_100g) of an entry"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""SELECT food_name,
+            quantity,
+            calories_per_100g
+            FROM calorie_logs
+            WHERE id=%s""",
+            (log_id,)
+            )
+            return cursor.fetchone()
+
+    def edit_log(self, log_id, food_name, quantity, calories_per_100g, meal_type):
+        """Updates a log entry and moves its rollup row. Returns the entry's
+        date, or None if it no longer exists, and its new total calories."""
+        total_calories = calculate_calories(quantity, calories_per_100g)
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            # Lock the entry so its rollup row is moved exactly once
+            cursor.execute("""
+                    SELECT user_id, date, food_name, meal_type, total_calories
+                    FROM calorie_logs
+                    WHERE id=%s
+                    FOR UPDATE
+                """, (log_id,))
+            old = cursor.fetchone()
+
+            if old is not None:
+                cursor.execute("""
+                        UPDATE calorie_logs
+                        SET food_name=%s,
+                        quantity=%s,
+                        calories_per_100g=%s,
+                        total_calories=%s,
+                        meal_type=%s
+                        WHERE id=%s
+                    """, (
+                    food_name,
+                    quantity,
+                    calories_per_100g,
+                    total_calories,
+                    meal_type,
+                    log_id
+                )
+                               )
+                apply_delta(cursor, old, -1)
+                apply_delta(cursor, (old[0], old[1], food_name, meal_type, total_calories), 1)
+            conn.commit()
+        return (old[1] if old is not None else None), total_calories
+
+    def remove_log(self, log_id):
+        """Deletes a log entry and its rollup change, returning the entry's
+        date or None if it no longer exists"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """DELETE FROM calorie_logs WHERE id=%s
+                RETURNING user_id, date, food_name, meal_type, total_calories""",
+                (log_id,)
+            )
+            removed = cursor.fetchone()
+            if removed is not None:
+                apply_delta(cursor, removed, -1)
+            conn.commit()
+        return removed[1] if removed is not None else None
+
+    def list_logs(self, user_id, page_end=None, limit=50):
+        """Returns a page of (id, food_name, quantity, total_calories,
+        meal_type, date) rows, newest first, and the key of the next page.
+        page_end is None for the first page, which starts at today."""
+        # Keyset pagination: continue below the (date, id) of the last row
+        # shown, so each page costs the same however far back it is
+        page_end = page_end or (date.today(), None)
+
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            if page_end[1] is None:
+                cursor.execute(
+                    """SELECT id,
+                    food_name,
+                    quantity,
+                    total_calories,
+                    meal_type,
+                    date
+                    FROM calorie_logs
+                    WHERE user_id=%s AND date <= %s
+                    ORDER BY date DESC, id DESC
+                    LIMIT %s""",
+                    (user_id, page_end[0], limit))
+            else:
+                cursor.execute(
+                    """SELECT id,
+                    food_name,
+                    quantity,
+                    total_calories,
+                    meal_type,
+                    date
+                    FROM calorie_logs
+                    WHERE user_id=%s AND (date, id) < (%s, %s)
+                    ORDER BY date DESC, id DESC
+                    LIMIT %s""",
+                    (user_id, page_end[0], page_end[1], limit))
+            logs = cursor.fetchall()
+        return logs, ((logs[-1][5], logs[-1][0]) if logs else None)
+
+    def daily_totals(self, user_id, days):
+        """Returns the calories logged on each of the given consecutive days
+        ("YYYY-MM-DD" strings) with a single range query"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT date,
+                SUM(total_calories)
+                FROM daily_totals
+                WHERE user_id=%s
+                AND date BETWEEN %s AND %s
+                GROUP BY date""",
+                (user_id, days[0], days[-1])
+            )
+            rows = cursor.fetchall()
+
+        # Days without any logs are missing from the result
+        by_day = {str(day): int(total) for day, total in rows}
+        return [by_day.get(day, 0) for day in days]
+
+    def food_totals(self, user_id):
+        """Returns (food_name, total) rows over all of the user's logs"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT food_name,
+                SUM(total_calories)
+                FROM daily_totals
+                WHERE user_id=%s
+                GROUP BY food_name""",
+                (user_id,)
+            )
+            return cursor.fetchall()
+
+    def daily_series(self, user_id, end=None):
+        """Returns the user's daily totals as an analytics.DailySeries"""
+        from helpers.analytics import load_series
+        with get_connection() as conn:
+            return load_series(conn, user_id, end)
+
+    def export_logs(self, user_id, path, fmt="csv", start=None, end=None):
+        """Writes the user's logs to path and returns the number of rows"""
+        with get_connection() as conn:
+            try:
+                return write_logs(fetch_batches(conn, user_id, start, end), path, fmt)
+            finally:
+                # End the read transaction the server-side cursor needed
+                conn.rollback()
+
+    def set_goal(self, user_id, goal):
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE users SET daily_goal=%s WHERE id=%s",
+                (goal, user_id)
+            )
+            conn.commit()
+
+    def save_recipe(self, user_id, name, items):
+        """Stores a recipe of (food_id, grams) items, replacing any recipe
+        of the same name, and returns its id"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """INSERT INTO recipes (user_id, name) VALUES (%s, %s)
+                ON CONFLICT (user_id, name) DO UPDATE SET name = EXCLUDED.name
+                RETURNING id""",
+                (user_id, name)
+            )
+            recipe_id = cursor.fetchone()[0]
+            cursor.execute("DELETE FROM recipe_items WHERE recipe_id=%s", (recipe_id,))
+            execute_values(
+                cursor,
+                "INSERT INTO recipe_items (recipe_id, food_id, grams) VALUES %s",
+                [(recipe_id, food_id, grams) for food_id, grams in items]
+            )
+            conn.commit()
+        return recipe_id
+
+    def list_recipes(self, user_id):
+        """Returns the user's (id, name) recipes by name"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, name FROM recipes WHERE user_id=%s ORDER BY name",
+                (user_id,)
+            )
+            return cursor.fetchall()
+
+    def recipe_items(self, recipe_id):
+        """Returns a recipe's items as (food_name, quantity,
+        calories_per_100g), ready for add_logs"""
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT food_data.name, recipe_items.grams, food_data.calories
+                FROM recipe_items
+                JOIN food_data ON food_data.id = recipe_items.food_id
+                WHERE recipe_items.recipe_id=%s""",
+                (recipe_id,)
+            )
+            # calorie_logs stores whole calories per 100g
+            return [(name, grams, round(calories)) for name, grams, calories in cursor.fetchall()]
+
+    def delete_recipe(self, user_id, recipe_id):
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM recipes WHERE id=%s AND user_id=%s",
+                (recipe_id, user_id)
+            )
+            conn.commit()
+
+
+class LocalService:
+    """The same operations against a LocalStore. Changes are only marked for
+    the next sync; pushing them is up to the caller."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def add_log(self, user_id, food_name, quantity, calories_per_100g, meal_type, day):
+        total_calories = calculate_calories(quantity, calories_per_100g)
+        log_id = self.store.add_log(
+            user_id, food_name, quantity, calories_per_100g,
+            total_calories, meal_type, str(day)
+        )
+        return log_id, total_calories
+
+    def add_logs(self, user_id, items, meal_type, day):
+        items = _with_totals(items)
+        log_ids = self.store.add_logs(user_id, items, meal_type, day)
+        return [(log_id, item[3]) for log_id, item in zip(log_ids, items)]
+
+    def get_log(self, log_id):
+        return self.store.get_log(log_id)
+
+    def edit_log(self, log_id, food_name, quantity, calories_per_100g, meal_type):
+        total_calories = calculate_calories(quantity, calories_per_100g)
+        day = self.store.update_log(
+            log_id, food_name, quantity,
+            calories_per_100g, total_calories, meal_type
+        )
+        return day, total_calories
+
+    def remove_log(self, log_id):
+        return self.store.delete_log(log_id)
+
+    def list_logs(self, user_id, page_end=None, limit=50):
+        return self.store.list_logs(user_id, page_end, limit)
+
+    def daily_totals(self, user_id, days):
+        return self.store.daily_totals(user_id, days)
+
+    def food_totals(self, user_id):
+        return self.store.food_totals(user_id)
+
+    def daily_series(self, user_id, end=None):
+        from helpers.analytics import make_series
+        return make_series(self.store.totals_by_day(user_id), end)
+
+    def export_logs(self, user_id, path, fmt="csv", start=None, end=None):
+        return write_logs(self.store.log_batches(user_id, start, end, BATCH_SIZE), path, fmt)
+
+    def set_goal(self, user_id, goal):
+        self.store.set_goal(user_id, goal)
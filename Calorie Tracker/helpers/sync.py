@@ -0,0 +1,145 @@
+import os
+import threading
+from datetime import datetime, timedelta
+import psycopg2
+from helpers.helpers import get_connection
+from helpers.local_store import timestamp
+from helpers.rollup import apply_delta
+
+# Seconds between syncs; writes also wake the sync thread straight away
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL_SECONDS", 30))
+# changed_at and recorded_at are the writer's transaction start time, so a
+# write can commit after a pull with a time before that pull's watermark.
+# Each pull reaches back this far to catch those; merging a row again is
+# harmless.
+SYNC_OVERLAP = timedelta(minutes=1)
+
+
+def _push(cursor, store, user_id):
+    """Sends local changes to the server. A change only applies when it is
+    newer than what the server has for that row, deletions included."""
+    pushed = []
+    for row in store.dirty_logs(user_id):
+        (log_uuid, _, food_name, quantity, calories_per_100g,
+         total_calories, meal_type, day, updated_at, deleted) = row
+
+        cursor.execute(
+            """SELECT user_id, date, food_name, meal_type, total_calories, updated_at
+            FROM calorie_logs WHERE uuid=%s FOR UPDATE""",
+            (log_uuid,)
+        )
+        current = cursor.fetchone()
+
+        if current is not None and timestamp(current[5]) >= updated_at:
+            pass  # The server's version is newer and will be pulled
+        elif deleted:
+            if current is not None:
+                cursor.execute("DELETE FROM calorie_logs WHERE uuid=%s", (log_uuid,))
+                apply_delta(cursor, current[:5], -1)
+            # The delete trigger stamped the tombstone with the server time
+            cursor.execute(
+                """INSERT INTO calorie_log_deletions (uuid, user_id, deleted_at) VALUES (%s, %s, %s)
+                ON CONFLICT (uuid) DO UPDATE SET deleted_at=EXCLUDED.deleted_at, recorded_at=now()""",
+                (log_uuid, user_id, updated_at)
+            )
+        elif current is not None:
+            cursor.execute(
+                """UPDATE calorie_logs SET food_name=%s, quantity=%s, calories_per_100g=%s,
+                total_calories=%s, meal_type=%s, updated_at=%s WHERE uuid=%s""",
+                (food_name, quantity, calories_per_100g, total_calories, meal_type, updated_at, log_uuid)
+            )
+            apply_delta(cursor, current[:5], -1)
+            apply_delta(cursor, (user_id, current[1], food_name, meal_type, total_calories), 1)
+        else:
+            # Skip rows deleted on the server after this change was made
+            cursor.execute(
+                "SELECT 1 FROM calorie_log_deletions WHERE uuid=%s AND deleted_at >= %s",
+                (log_uuid, updated_at)
+            )
+            if cursor.fetchone() is None:
+                cursor.execute(
+                    """INSERT INTO calorie_logs
+                    (uuid, user_id, food_name, quantity, calories_per_100g,
+                    total_calories, meal_type, date, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                    (log_uuid, user_id, food_name, quantity, calories_per_100g,
+                     total_calories, meal_type, day, updated_at)
+                )
+                apply_delta(cursor, (user_id, day, food_name, meal_type, total_calories), 1)
+
+        pushed.append((log_uuid, updated_at))
+    return pushed
+
+
+def _pull(cursor, store, user_id):
+    """Fetches the rows and deletions the server received since the last
+    pull. changed_at is set by the server, so client clocks do not matter."""
+    cursor.execute("SELECT now()")
+    pulled_at = cursor.fetchone()[0]
+    last_pull = store.pulled_at(user_id)
+    since = datetime.fromisoformat(last_pull) - SYNC_OVERLAP if last_pull else "-infinity"
+
+    cursor.execute(
+        """SELECT uuid::text, user_id, food_name, quantity, calories_per_100g,
+        total_calories, meal_type, date, updated_at
+        FROM calorie_logs WHERE user_id=%s AND changed_at > %s""",
+        (user_id, since)
+    )
+    rows = [(*row[:7], str(row[7]), timestamp(row[8])) for row in cursor.fetchall()]
+
+    cursor.execute(
+        """SELECT uuid::text, deleted_at FROM calorie_log_deletions
+        WHERE user_id=%s AND recorded_at > %s""",
+        (user_id, since)
+    )
+    deletions = [(log_uuid, timestamp(deleted_at)) for log_uuid, deleted_at in cursor.fetchall()]
+    return rows, deletions, pulled_at
+
+
+def sync(conn, store, user_id):
+    """Pushes local changes, then pulls the server's, in one transaction"""
+    cursor = conn.cursor()
+    pushed = _push(cursor, store, user_id)
+    rows, deletions, pulled_at = _pull(cursor, store, user_id)
+    conn.commit()
+
+    # Only touch the local store once the server side is committed
+    for log_uuid, updated_at in pushed:
+        store.mark_pushed(log_uuid, updated_at)
+    store.merge(rows, deletions)
+    store.set_pulled_at(user_id, timestamp(pulled_at))
+
+
+class Syncer:
+    """Syncs a user's local store with the server on a background thread,
+    every SYNC_INTERVAL seconds and whenever woken after a local write"""
+
+    def __init__(self, store, user_id, interval=SYNC_INTERVAL):
+        self.store = store
+        self.user_id = user_id
+        self.interval = interval
+        self.online = None
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="sync", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                with get_connection() as conn:
+                    sync(conn, self.store, self.user_id)
+                self.online = True
+            except psycopg2.Error:
+                # Offline or the server is unavailable; changes stay queued
+                self.online = False
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -0,0 +1,73 @@
+import sys
+import queue
+import threading
+
+
+class DatabaseWorker:
+    """Runs database jobs on a background thread so the Tk main loop never
+    blocks. Results are handed back to the Tk thread by polling with
+    root.after, since Tk widgets must only be touched from that thread."""
+
+    POLL_INTERVAL_MS = 50
+
+    def __init__(self, root, on_busy=None):
+        self.root = root
+        self.on_busy = on_busy
+        self.pending = 0
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._polling = False
+        self._thread = threading.Thread(target=self._run, name="database-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, job, on_success=None, on_error=None):
+        """Queues job() to run in the background. on_success(result) or
+        on_error(exception) is then called on the Tk thread."""
+        self.pending += 1
+        if self.pending == 1 and self.on_busy:
+            self.on_busy(True)
+
+        self._jobs.put((job, on_success, on_error))
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.POLL_INTERVAL_MS, self._poll)
+
+    def stop(self):
+        self._jobs.put(None)
+
+    def _run(self):
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                return
+
+            job, on_success, on_error = item
+            try:
+                self._results.put((on_success, job(), None))
+            except Exception as error:
+                self._results.put((on_error, None, error))
+
+    def _poll(self):
+        while True:
+            try:
+                callback, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            self.pending -= 1
+            if self.pending == 0 and self.on_busy:
+                self.on_busy(False)
+
+            if callback is None:
+                continue
+
+            # A failing callback must not stop the results behind it
+            try:
+                callback(error if error is not None else result)
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+
+        if self.pending:
+            self.root.after(self.POLL_INTERVAL_MS, self._poll)
+        else:
+            self._polling = False
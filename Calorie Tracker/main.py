@@ -1,22 +1,41 @@
+import os
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
+from tkinter import filedialog
+from tkinter import simpledialog
 from datetime import date, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
 import psycopg2
-import bcrypt
-import csv
-from helpers.helpers import calculate_bmr, calculate_calories, calculate_daily_calories, get_connection, initialize_database
+from helpers.cache import DailyTotalsCache
+from helpers.worker import DatabaseWorker
+from helpers.passwords import check_password, hash_password, needs_rehash
+from helpers.export import EXTENSIONS, available_formats
+from helpers.importer import MEAL_TYPES, import_logs
+from helpers.catalog import fetch_catalog_changes, load_catalog
+from helpers.local_store import LocalStore
+from helpers.sync import Syncer
+from helpers.service import LocalService, PostgresService
+from helpers.instrumentation import SLOW_QUERY_MS, STATS
+from helpers.helpers import calculate_bmr, calculate_calories, calculate_daily_calories, get_connection, initialize_database, close_pool
+
+# helpers.analytics (NumPy) and helpers.charts (Matplotlib) take longer to
+# import than the rest of the app, so they are imported where they are
+# first needed instead of delaying the login screen.
 
 
 class CaloriesCalculator:
-    def __init__(self, root):
+    # Number of log entries fetched per page of the log list
+    LOG_PAGE_SIZE = 50
+
+    def __init__(self, root, worker=None, local_store=None):
         self.meal_type_dropdown = None
         self.meal_type_var = None
         self.goal_entry = None
         self.log_ids = None
+        self.log_page_end = None
+        self.logs_exhausted = False
+        self.loading_logs = False
+        self.log_generation = 0
         self.save_edit_button = None
         self.selected_log_id = None
         self.log_listbox = None
@@ -36,8 +55,80 @@ class CaloriesCalculator:
         self.root = root
         self.root.title("Calorie Tracker App")
         self.user_id = None
-        initialize_database()  # Ensure database is initialized
+        self.totals_cache = DailyTotalsCache()
+        self.food_catalog = None
+        self.loading_catalog = False
+        self.suggestion_listbox = None
+        self.suggestions = []
+        # Items staged in the meal builder, as (food_name, quantity,
+        # calories_per_100g); kept when leaving the log screen, dropped on
+        # logout
+        self.meal_items = []
+        self.meal_listbox = None
+        # Charts are created on first use and then updated in place until
+        # logout
+        self.food_chart = None
+        self.trend_chart = None
+        self.dashboard_chart = None
+        self.status_label = tk.Label(self.root, text="", anchor="w")
+        self.status_label.grid(row=1, column=0, sticky="we", padx=10)
+        self.worker = worker or DatabaseWorker(self.root, on_busy=self.set_busy)
+
+        # With a local store, logs are read and written locally and synced
+        # with the server in the background, so the app also works offline
+        store_path = os.getenv("LOCAL_STORE")
+        self.local_store = local_store or (LocalStore(store_path) if store_path else None)
+        self.syncer = None
+        # Logs and reports go through the local store when there is one;
+        # goals and imports always go to the server
+        self.server = PostgresService()
+        self.service = LocalService(self.local_store) if self.local_store is not None else self.server
+
         self.show_login_screen()
+        # The schema check runs on the worker so the login screen does not
+        # wait for the server. Jobs run in order, so anything submitted
+        # afterwards sees the migrated schema.
+        self.worker.submit(initialize_database, on_error=self.database_unavailable)
+
+    def database_unavailable(self, error):
+        """Reports a failed schema check, unless the app can work offline"""
+        if self.local_store is not None and isinstance(error, psycopg2.OperationalError):
+            return
+        messagebox.showerror("Database Error", f"Could not prepare the database: {error}")
+
+    def set_busy(self, busy):
+        """Shows that background queries are running"""
+        self.status_label.config(text="Working..." if busy else "")
+        self.root.config(cursor="watch" if busy else "")
+
+    def run_in_background(self, job, on_success, error_title="Database Error"):
+        """Runs job() on the database worker and on_success(result) on the Tk
+        thread once it is done. Errors are reported in a message box."""
+        def on_error(error):
+            messagebox.showerror(error_title, f"An error occurred: {error}")
+
+        self.worker.submit(job, on_success, on_error)
+
+    def run_service(self, job, on_success, error_title="Database Error", on_error=None):
+        """Runs a data operation straight away against the local store, which
+        answers instantly, or on the worker against the server. Errors go to
+        on_error, or to a message box."""
+        def failed(error):
+            if on_error is not None:
+                on_error(error)
+            else:
+                messagebox.showerror(error_title, f"An error occurred: {error}")
+
+        if self.local_store is None:
+            self.worker.submit(job, on_success, failed)
+            return
+
+        try:
+            result = job()
+        except Exception as error:
+            failed(error)
+            return
+        on_success(result)
 
     def main_menu(self):
         """Displays the main menu"""
@@ -100,34 +191,55 @@ class CaloriesCalculator:
             command=self.show_dashboard
         ).grid(row=9, column=0, pady=5)
 
-        if self.daily_goal is not None and self.daily_goal > 0:
-            conn = get_connection()
-            cursor = conn.cursor()
-            today_str = date.today().strftime("%Y-%m-%d")
-            cursor.execute("""SELECT SUM(total_calories) 
-            FROM calorie_logs 
-            WHERE user_id=%s 
-            AND date=%s""",
-            (self.user_id, today_str)
-            )
+        tk.Button(
+            menu_frame,
+            text="Export Logs",
+            command=self.show_export_screen
+        ).grid(row=10, column=0, pady=5)
+
+        tk.Button(
+            menu_frame,
+            text="Import Logs",
+            command=self.import_logs
+        ).grid(row=11, column=0, pady=5)
+
+        tk.Button(
+            menu_frame,
+            text="Analytics",
+            command=self.show_analytics
+        ).grid(row=12, column=0, pady=5)
 
-            result = cursor.fetchone()[0]
-            conn.close()
-            total_logged = int(result) if result is not None else 0
-            percentage = min(int((total_logged / self.daily_goal) * 100), 100)
+        tk.Button(
+            menu_frame,
+            text="Query Stats",
+            command=self.show_query_stats
+        ).grid(row=13, column=0, pady=5)
 
+        if self.daily_goal is not None and self.daily_goal > 0:
             progress_frame = tk.Frame(menu_frame, padx=10, pady=10)
             progress_frame.grid(row=8, column=0, pady=10)
-            tk.Label(
+            intake_label = tk.Label(
                 progress_frame,
-                text=f"Today's intake: {total_logged} / {self.daily_goal} kcal"
-            ).grid(row=0,column=0, pady=5)
+                text="Loading today's intake..."
+            )
+            intake_label.grid(row=0,column=0, pady=5)
             progress_bar = ttk.Progressbar(
                 progress_frame,
                 length=300,
-                mode='determinate', maximum=100, value=percentage
+                mode='determinate', maximum=100, value=0
             )
             progress_bar.grid(row=1, column=0, pady=5)
+
+            def show_progress(totals):
+                if not progress_frame.winfo_exists():
+                    return
+                total_logged = totals[0]
+                percentage = min(int((total_logged / self.daily_goal) * 100), 100)
+                intake_label.config(text=f"Today's intake: {total_logged} / {self.daily_goal} kcal")
+                progress_bar.config(value=percentage)
+
+            today_str = date.today().strftime("%Y-%m-%d")
+            self.load_daily_totals([today_str], show_progress)
         else:
             tk.Label(
                 menu_frame,
@@ -136,6 +248,7 @@ class CaloriesCalculator:
 
     def show_login_screen(self):
         """Displays the user login screen."""
+        self.reset_session()
         self.clear_screen()
 
         login_frame = tk.Frame(self.root, padx=20, pady=20)
@@ -179,25 +292,76 @@ class CaloriesCalculator:
         username = self.username_entry.get()
         password = self.password_entry.get()
 
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, password, daily_goal FROM users WHERE username=%s",
-            (username,)
-        )
-        user = cursor.fetchone()
-        conn.close()
+        store = self.local_store
 
-        if user and bcrypt.checkpw(password.encode('utf-8'), user[1]):
-            self.user_id = user[0]
-            self.daily_goal = user[2]  # Load the daily goal from the database
-            messagebox.showinfo("Success", f"Welcome, {username}!")
-            self.main_menu()
-        else:
-            messagebox.showerror(
-                "Login Failed",
-                "Invalid username or password."
-            )
+        def check_on_server():
+            with get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT id, password, daily_goal FROM users WHERE username=%s",
+                    (username,)
+                )
+                user = cursor.fetchone()
+
+                if not user or not check_password(password, user[1]):
+                    return None
+
+                # Upgrade hashes made with an outdated cost while the
+                # plain password is at hand
+                if needs_rehash(user[1]):
+                    user = (user[0], hash_password(password), user[2])
+                    cursor.execute(
+                        "UPDATE users SET password=%s WHERE id=%s",
+                        (user[1], user[0])
+                    )
+                    conn.commit()
+                return user
+
+        # Runs on the database worker, so bcrypt never stalls the UI
+        def authenticate():
+            try:
+                user = check_on_server()
+            except psycopg2.OperationalError:
+                if store is None:
+                    raise
+                # Offline: check the credentials cached at the last online login
+                user = store.cached_user(username)
+                if user and check_password(password, user[1]):
+                    return user
+                return None
+
+            if user and store is not None:
+                store.cache_user(username, *user)
+            return user
+
+        def finish_login(user):
+            if user:
+                self.reset_session()
+                self.user_id = user[0]
+                self.daily_goal = user[2]  # Load the daily goal from the database
+                messagebox.showinfo("Success", f"Welcome, {username}!")
+                self.start_sync()
+                self.main_menu()
+                self.load_food_catalog()
+            else:
+                messagebox.showerror(
+                    "Login Failed",
+                    "Invalid username or password."
+                )
+
+        self.run_in_background(authenticate, finish_login, "Login Failed")
+
+    def start_sync(self):
+        """Starts syncing the logged-in user's local store, if there is one"""
+        if self.syncer is not None:
+            self.syncer.stop()
+            self.syncer = None
+        if self.local_store is not None:
+            self.syncer = Syncer(self.local_store, self.user_id)
+
+    def stop_sync(self):
+        if self.syncer is not None:
+            self.syncer.stop()
 
     def show_registration_screen(self):
         """Displays the user registration screen."""
@@ -243,25 +407,28 @@ class CaloriesCalculator:
         """Creates a new user with the given username and password"""
         username = self.new_username_entry.get()
         password = self.new_password_entry.get()
-        hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
 
-        conn = get_connection()
-        cursor = conn.cursor()
+        def create_user():
+            hashed_password = hash_password(password)
+            with get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT INTO users (username, password) VALUES (%s, %s)",
+                    (username, hashed_password)
+                )
+                conn.commit()
 
-        try:
-            cursor.execute(
-                "INSERT INTO users (username, password) VALUES (%s, %s)",
-                (username, hashed_password)
-            )
-            conn.commit()
+        def registered(_):
             messagebox.showinfo("Success", "Registration successful!")
             self.show_login_screen()
 
-        except psycopg2.IntegrityError:
-            messagebox.showerror("Error", "Username already exists.")
-
-        conn.close()
+        def failed(error):
+            if isinstance(error, psycopg2.IntegrityError):
+                messagebox.showerror("Error", "Username already exists.")
+            else:
+                messagebox.showerror("Error", f"An error occurred: {error}")
 
+        self.worker.submit(create_user, registered, failed)
 
     def daily_calories_gui(self):
         """Displays the daily calories calculator screen"""
@@ -371,6 +538,15 @@ class CaloriesCalculator:
         self.calories_entry = tk.Entry(log_frame)
         self.calories_entry.grid(row=2, column=1)
 
+        # Catalog matches for the typed food name; picking one fills in
+        # its calories
+        self.suggestion_listbox = tk.Listbox(log_frame, width=30, height=6)
+        self.suggestion_listbox.grid(row=0, column=2, rowspan=4, sticky="n", padx=5)
+        self.suggestion_listbox.grid_remove()
+        self.suggestion_listbox.bind("<<ListboxSelect>>", self.use_suggestion)
+        self.food_entry.bind("<KeyRelease>", self.show_suggestions)
+        self.load_food_catalog()
+
         # Meal Type Dropdown
         tk.Label(
             log_frame,
@@ -378,7 +554,7 @@ class CaloriesCalculator:
         ).grid(row=3, column=0, sticky="e")
 
         # Options for meal type
-        meal_options = ["Breakfast", "Lunch", "Dinner", "Snack", "Other"]
+        meal_options = list(MEAL_TYPES)
 
         # Create a StringVar to store the selected value; default to 'Other'
         self.meal_type_var = tk.StringVar(value="Other")
@@ -426,6 +602,31 @@ class CaloriesCalculator:
             command=self.main_menu
         ).grid(row=0, column=4, padx=5)
 
+        # Meal builder: stage several items, then log them together
+        tk.Button(
+            button_frame,
+            text="Add to Meal",
+            command=self.add_to_meal
+        ).grid(row=1, column=0, padx=5, pady=5)
+
+        tk.Button(
+            button_frame,
+            text="Log Meal",
+            command=self.log_meal
+        ).grid(row=1, column=1, padx=5, pady=5)
+
+        tk.Button(
+            button_frame,
+            text="Save as Recipe",
+            command=self.save_meal_as_recipe
+        ).grid(row=1, column=2, padx=5, pady=5)
+
+        tk.Button(
+            button_frame,
+            text="Recipes",
+            command=self.show_recipes
+        ).grid(row=1, column=3, padx=5, pady=5)
+
         # Save Edit Button (hidden by default)
         self.save_edit_button = tk.Button(
             log_frame,
@@ -436,94 +637,436 @@ class CaloriesCalculator:
         self.save_edit_button.grid(row=5, column=0, columnspan=2, pady=10)
         self.save_edit_button.grid_remove()  # Hide initially
 
+        log_scrollbar = tk.Scrollbar(log_frame, orient="vertical")
         self.log_listbox = tk.Listbox(log_frame, width=50)
         self.log_listbox.grid(row=6, column=0, columnspan=2, pady=10)
+        log_scrollbar.grid(row=6, column=2, sticky="ns", pady=10)
+
+        def on_scroll(first, last):
+            log_scrollbar.set(first, last)
+            # Fetch the next page before the user reaches the bottom
+            if float(last) >= 0.9:
+                self.load_more_logs()
+
+        self.log_listbox.config(yscrollcommand=on_scroll)
+        log_scrollbar.config(command=self.log_listbox.yview)
         self.update_log_display()
 
+        tk.Label(
+            log_frame,
+            text="Meal:"
+        ).grid(row=7, column=0, sticky="w")
+
+        self.meal_listbox = tk.Listbox(log_frame, width=50, height=5)
+        self.meal_listbox.grid(row=8, column=0, columnspan=2, pady=5)
+        for item in self.meal_items:
+            self.meal_listbox.insert(tk.END, self.format_meal_item(*item))
+
+    def load_food_catalog(self):
+        """Loads the food catalog in the background, or fetches only the
+        rows that changed if it is already loaded"""
+        if self.loading_catalog:
+            return
+        self.loading_catalog = True
+        catalog = self.food_catalog
+
+        def fetch():
+            with get_connection() as conn:
+                if catalog is None:
+                    return load_catalog(conn)
+                return fetch_catalog_changes(conn, catalog.loaded_at)
+
+        def loaded(result):
+            self.loading_catalog = False
+            if catalog is None:
+                self.food_catalog = result
+            else:
+                catalog.apply(*result)
+
+        def failed(error):
+            self.loading_catalog = False
+            # Offline, suggestions are simply unavailable until a later load
+            if self.local_store is not None and isinstance(error, psycopg2.OperationalError):
+                return
+            messagebox.showerror("Food Catalog", f"An error occurred: {error}")
+
+        self.worker.submit(fetch, loaded, failed)
+
+    def show_suggestions(self, event=None):
+        """Lists catalog foods starting with the typed name"""
+        listbox = self.suggestion_listbox
+        if self.food_catalog is None:
+            self.suggestions = []
+        else:
+            self.suggestions = self.food_catalog.search(self.food_entry.get(), limit=6)
+
+        listbox.delete(0, tk.END)
+        for name, calories in self.suggestions:
+            listbox.insert(tk.END, f"{name} ({round(calories)} kcal/100g)")
+
+        if self.suggestions:
+            listbox.grid()
+        else:
+            listbox.grid_remove()
+
+    def use_suggestion(self, event=None):
+        """Fills in the name and calories of the picked catalog food"""
+        selection = self.suggestion_listbox.curselection()
+        if not selection:
+            return
+
+        name, calories = self.suggestions[selection[0]]
+        self.food_entry.delete(0, tk.END)
+        self.food_entry.insert(0, name)
+        self.calories_entry.delete(0, tk.END)
+        self.calories_entry.insert(0, round(calories))
+        self.suggestion_listbox.grid_remove()
+        self.quantity_entry.focus_set()
+
     def add_item(self):
         """Adds a food item to the database"""
         try:
             food_name = self.food_entry.get()
             quantity = int(self.quantity_entry.get())
             calories_per_100g = int(self.calories_entry.get())
-            total_calories = calculate_calories(quantity, calories_per_100g)
-            meal_type = self.meal_type_var.get()
-            date_today = date.today().strftime("%Y-%m-%d")
-
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO calorie_logs
-                (user_id,
-                food_name,
-                quantity,
-                calories_per_100g,
-                total_calories,
-                meal_type,
-                date)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                self.user_id,
-                food_name,
-                quantity,
-                calories_per_100g,
-                total_calories,
-                meal_type, date_today
-            )
-            )
-            conn.commit()
-            conn.close()
+        except ValueError:
+            messagebox.showerror("Error", "Please enter valid data.")
+            return
 
-            self.update_log_display()
+        meal_type = self.meal_type_var.get()
+        date_today = date.today().strftime("%Y-%m-%d")
+        user_id = self.user_id
+        service = self.service
+        listbox = self.log_listbox
+        generation = self.log_generation
+
+        def added(result):
+            log_id, total_calories = result
+            self.logs_changed()
+            self.totals_cache.invalidate(user_id, date_today)
+
+            # Left alone if the log screen was closed or reloaded meanwhile
+            if generation != self.log_generation or not listbox.winfo_exists():
+                return
+            # The new entry is the newest, so it goes on top of the list
+            self.log_ids.insert(0, log_id)
+            listbox.insert(
+                0,
+                self.format_log(food_name, quantity, total_calories, meal_type)
+            )
             self.food_entry.delete(0, tk.END)
             self.quantity_entry.delete(0, tk.END)
             self.calories_entry.delete(0, tk.END)
 
+        self.run_service(
+            lambda: service.add_log(user_id, food_name, quantity, calories_per_100g, meal_type, date_today),
+            added,
+            "Error"
+        )
+
+    def logs_changed(self):
+        """Pushes local changes to the server without waiting for the next
+        scheduled sync"""
+        if self.syncer is not None:
+            self.syncer.wake()
+
+    @staticmethod
+    def format_log(food_name, quantity, total_calories, meal_type):
+        # Format: Food Name - Quantity(g) - Calories kcal - Meal Type
+        return f"{food_name} - {quantity}g - {int(total_calories)} kcal - {meal_type}"
+
+    @staticmethod
+    def format_meal_item(food_name, quantity, calories_per_100g):
+        return f"{food_name} - {quantity}g - {calculate_calories(quantity, calories_per_100g)} kcal"
+
+    def add_to_meal(self):
+        """Stages the entered food in the meal builder"""
+        try:
+            item = (
+                self.food_entry.get(),
+                int(self.quantity_entry.get()),
+                int(self.calories_entry.get())
+            )
         except ValueError:
             messagebox.showerror("Error", "Please enter valid data.")
+            return
+
+        self.meal_items.append(item)
+        self.meal_listbox.insert(tk.END, self.format_meal_item(*item))
+        self.food_entry.delete(0, tk.END)
+        self.quantity_entry.delete(0, tk.END)
+        self.calories_entry.delete(0, tk.END)
+
+    def log_meal(self):
+        """Logs every staged item with one batched insert"""
+        if not self.meal_items:
+            messagebox.showerror("Error", "Add items to the meal first.")
+            return
+
+        meal_type = self.meal_type_var.get()
+        date_today = date.today().strftime("%Y-%m-%d")
+        user_id = self.user_id
+        service = self.service
+        listbox = self.log_listbox
+        generation = self.log_generation
+
+        # Taken out of the builder now, so clicking again cannot log them twice
+        items = self.meal_items
+        self.meal_items = []
+        self.meal_listbox.delete(0, tk.END)
+
+        def logged(results):
+            self.logs_changed()
+            self.totals_cache.invalidate(user_id, date_today)
+
+            if generation != self.log_generation or not listbox.winfo_exists():
+                return
+            # The new entries are the newest, so they go on top of the list
+            for (food_name, quantity, _), (log_id, total_calories) in zip(items, results):
+                self.log_ids.insert(0, log_id)
+                listbox.insert(
+                    0,
+                    self.format_log(food_name, quantity, total_calories, meal_type)
+                )
+
+        def failed(error):
+            # Back into the builder, ahead of anything staged since, unless
+            # the user has logged out
+            if user_id == self.user_id:
+                self.meal_items[:0] = items
+                if self.meal_listbox is not None and self.meal_listbox.winfo_exists():
+                    for index, item in enumerate(items):
+                        self.meal_listbox.insert(index, self.format_meal_item(*item))
+            messagebox.showerror("Error", f"An error occurred: {error}")
+
+        self.run_service(
+            lambda: service.add_logs(user_id, items, meal_type, date_today),
+            logged,
+            on_error=failed
+        )
+
+    def save_meal_as_recipe(self):
+        """Saves the staged items as a recipe. Recipes refer to food_data
+        rows, so every item must be a food from the catalog."""
+        if not self.meal_items:
+            messagebox.showerror("Error", "Add items to the meal first.")
+            return
+        if self.food_catalog is None:
+            messagebox.showerror("Save Recipe", "The food list is still loading, please try again.")
+            return
+
+        foods = [self.food_catalog.lookup(food_name) for food_name, _, _ in self.meal_items]
+        unknown = [item[0] for item, food in zip(self.meal_items, foods) if food is None]
+        if unknown:
+            messagebox.showerror(
+                "Save Recipe",
+                "Recipes can only contain foods from the food list. Not found: " + ", ".join(unknown)
+            )
+            return
+
+        name = simpledialog.askstring("Save Recipe", "Recipe name:", parent=self.root)
+        if not name or not name.strip():
+            return
+        name = name.strip()
+
+        user_id = self.user_id
+        items = [(food[0], quantity) for food, (_, quantity, _) in zip(foods, self.meal_items)]
+
+        def saved(_):
+            messagebox.showinfo("Save Recipe", f"Recipe '{name}' saved.")
+
+        self.run_in_background(lambda: self.server.save_recipe(user_id, name, items), saved)
+
+    def show_recipes(self):
+        """Lists the saved recipes; each can be logged in one action"""
+        self.clear_screen()
+
+        recipes_frame = tk.Frame(self.root, padx=20, pady=20)
+        recipes_frame.grid(row=0, column=0, padx=50, pady=50)
 
-        except psycopg2.DatabaseError as error:
-            messagebox.showerror("Error", f"{error}")
+        tk.Label(
+            recipes_frame,
+            text="Recipes",
+            font=("Arial", 18, "bold")
+        ).grid(row=0, column=0, columnspan=3, pady=10)
+
+        recipes_listbox = tk.Listbox(recipes_frame, width=40, height=10)
+        recipes_listbox.grid(row=1, column=0, columnspan=3, pady=5)
+        recipe_ids = []
+
+        tk.Label(
+            recipes_frame,
+            text="Meal Type:"
+        ).grid(row=2, column=0, sticky="e")
+
+        meal_type_var = tk.StringVar(value="Other")
+        tk.OptionMenu(
+            recipes_frame,
+            meal_type_var,
+            *MEAL_TYPES
+        ).grid(row=2, column=1, sticky="w")
+
+        def selected():
+            selection = recipes_listbox.curselection()
+            if not selection:
+                messagebox.showerror("Error", "Please select a recipe.")
+                return None
+            return recipe_ids[selection[0]]
+
+        def log_selected():
+            recipe_id = selected()
+            if recipe_id is not None:
+                self.log_recipe(recipe_id, meal_type_var.get())
+
+        def delete_selected():
+            recipe_id = selected()
+            if recipe_id is not None:
+                user_id = self.user_id
+                self.run_in_background(
+                    lambda: self.server.delete_recipe(user_id, recipe_id),
+                    lambda _: self.show_recipes()
+                )
+
+        # Recipes live on the server, so the buttons only work once the
+        # list has loaded from it
+        log_button = tk.Button(
+            recipes_frame,
+            text="Log Recipe",
+            command=log_selected,
+            state="disabled"
+        )
+        log_button.grid(row=3, column=0, pady=10)
+
+        delete_button = tk.Button(
+            recipes_frame,
+            text="Delete Recipe",
+            command=delete_selected,
+            state="disabled"
+        )
+        delete_button.grid(row=3, column=1, pady=10)
+
+        tk.Button(
+            recipes_frame,
+            text="Back",
+            command=self.food_calories_gui
+        ).grid(row=3, column=2, pady=10)
+
+        def show(recipes):
+            if not recipes_listbox.winfo_exists():
+                return
+            for recipe_id, name in recipes:
+                recipe_ids.append(recipe_id)
+                recipes_listbox.insert(tk.END, name)
+            log_button.config(state="normal")
+            delete_button.config(state="normal")
+
+        def failed(error):
+            if self.local_store is not None and isinstance(error, psycopg2.OperationalError):
+                if recipes_listbox.winfo_exists():
+                    recipes_listbox.insert(tk.END, "Recipes are not available offline.")
+                return
+            messagebox.showerror("Database Error", f"An error occurred: {error}")
+
+        user_id = self.user_id
+        self.worker.submit(lambda: self.server.list_recipes(user_id), show, failed)
+
+    def log_recipe(self, recipe_id, meal_type):
+        """Logs every item of a saved recipe with one batched insert, using
+        the current calories of its foods"""
+        user_id = self.user_id
+        server = self.server
+        service = self.service
+        date_today = date.today().strftime("%Y-%m-%d")
+
+        def log():
+            items = server.recipe_items(recipe_id)
+            return service.add_logs(user_id, items, meal_type, date_today) if items else []
+
+        def logged(results):
+            if not results:
+                messagebox.showinfo("Recipes", "This recipe has no items.")
+                return
+            self.logs_changed()
+            self.totals_cache.invalidate(user_id, date_today)
+            total_calories = sum(total for _, total in results)
+            messagebox.showinfo("Recipes", f"Logged {len(results)} items ({total_calories} kcal).")
+
+        self.run_in_background(log, logged)
 
     def update_log_display(self):
+        """Reloads the log list, starting with today's newest entries"""
+        self.log_generation += 1
+        self.log_ids = []
+        self.log_page_end = None
+        self.logs_exhausted = False
+        self.loading_logs = False
         self.log_listbox.delete(0, tk.END)
-        self.log_ids = []  # Store the corresponding log IDs
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """SELECT id,
-             food_name, 
-             quantity, 
-             total_calories, 
-             meal_type 
-             FROM calorie_logs WHERE user_id=%s""",
-            (self.user_id,))
-        logs = cursor.fetchall()
-        conn.close()
-
-        for log in logs:
-            self.log_ids.append(log[0])
-            # Format: Food Name - Quantity(g) - Calories kcal - Meal Type
-            self.log_listbox.insert(tk.END, f"{log[1]} - {log[2]}g - {int(log[3])} kcal - {log[4]}")
+        self.load_more_logs()
+
+    def load_more_logs(self):
+        """Appends the next page of older entries to the log list"""
+        if self.loading_logs or self.logs_exhausted:
+            return
+        self.loading_logs = True
+
+        user_id = self.user_id
+        service = self.service
+        listbox = self.log_listbox
+        generation = self.log_generation
+        page_end = self.log_page_end
+        page_size = self.LOG_PAGE_SIZE
+
+        def show_page(page):
+            logs, next_page = page
+            # Ignore pages of a list that has been reloaded since
+            if generation != self.log_generation:
+                return
+            self.loading_logs = False
+            if not listbox.winfo_exists():
+                return
+
+            for log in logs:
+                self.log_ids.append(log[0])
+                listbox.insert(tk.END, self.format_log(*log[1:5]))
+
+            if len(logs) < page_size:
+                self.logs_exhausted = True
+            else:
+                self.log_page_end = next_page
+
+        # The local store answers instantly; the server is queried on the worker
+        if self.local_store is not None:
+            show_page(service.list_logs(user_id, page_end, page_size))
+            return
+
+        def fetch_page():
+            return service.list_logs(user_id, page_end, page_size)
+
+        def failed(error):
+            if generation == self.log_generation:
+                self.loading_logs = False
+            messagebox.showerror("Database Error", f"An error occurred: {error}")
+
+        self.worker.submit(fetch_page, show_page, failed)
 
     def edit_item(self):
         try:
             index = self.log_listbox.curselection()[0]
-            self.selected_log_id = self.log_ids[index]  # Use the stored ID
-
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""SELECT food_name, 
-            quantity, 
-            calories_per_100g 
-            FROM calorie_logs 
-            WHERE id=%s""",
-            (self.selected_log_id,)
-            )
+            log_id = self.log_ids[index]  # Use the stored ID
+        except IndexError:
+            messagebox.showerror("Error", "Please select an item to edit.")
+            return
+
+        self.selected_log_id = log_id
+        service = self.service
+        generation = self.log_generation
 
-            log = cursor.fetchone()
-            conn.close()
+        def show_log(log):
+            if generation != self.log_generation or self.selected_log_id != log_id:
+                return
+            if log is None:
+                messagebox.showerror("Error", "This item no longer exists.")
+                return
 
             self.food_entry.delete(0, tk.END)
             self.food_entry.insert(0, log[0])
@@ -535,9 +1078,7 @@ class CaloriesCalculator:
             # Show the save edit button
             self.save_edit_button.grid()
 
-        except IndexError:
-            messagebox.showerror("Error", "Please select an item to edit.")
-
+        self.run_service(lambda: service.get_log(log_id), show_log, "Error")
 
     def save_edit(self):
         """Saves the made edits to the chosen item from the listbox"""
@@ -545,139 +1086,316 @@ class CaloriesCalculator:
             food_name = self.food_entry.get()
             quantity = int(self.quantity_entry.get())
             calories_per_100g = int(self.calories_entry.get())
-            total_calories = (quantity / 100) * calories_per_100g
-            meal_type = self.meal_type_var.get()  # Include meal type
-
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                    UPDATE calorie_logs
-                    SET food_name=%s, 
-                    quantity=%s, 
-                    calories_per_100g=%s, 
-                    total_calories=%s, 
-                    meal_type=%s
-                    WHERE id=%s
-                """, (
-                food_name,
-                quantity,
-                calories_per_100g,
-                total_calories,
-                meal_type,
-                self.selected_log_id
-            )
-                           )
-
-            conn.commit()
-            conn.close()
+        except ValueError:
+            messagebox.showerror("Error", "Please enter valid data.")
+            return
 
-            self.update_log_display()
+        meal_type = self.meal_type_var.get()  # Include meal type
+        log_id = self.selected_log_id
+        user_id = self.user_id
+        service = self.service
+        listbox = self.log_listbox
+        generation = self.log_generation
+
+        def saved(result):
+            day, total_calories = result
+            self.logs_changed()
+
+            if day is not None:
+                self.totals_cache.invalidate(user_id, str(day))
+
+            # Only the edited row changes; its date and position stay the same
+            if generation == self.log_generation and listbox.winfo_exists() and log_id in self.log_ids:
+                index = self.log_ids.index(log_id)
+                listbox.delete(index)
+                listbox.insert(
+                    index,
+                    self.format_log(food_name, quantity, total_calories, meal_type)
+                )
             messagebox.showinfo("Success", "Item updated successfully!")
 
-        except ValueError:
-            messagebox.showerror("Error", "Please enter valid data.")
+        self.run_service(
+            lambda: service.edit_log(log_id, food_name, quantity, calories_per_100g, meal_type),
+            saved,
+            "Error"
+        )
 
     def remove_item(self):
         try:
             index = self.log_listbox.curselection()[0]
             log_id = self.log_ids[index]  # Get the ID from the stored list
+        except IndexError:
+            messagebox.showerror("Error", "Please select an item to remove.")
+            return
 
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM calorie_logs WHERE id=%s", (log_id,))
-            conn.commit()
-            conn.close()
+        user_id = self.user_id
+        service = self.service
+        listbox = self.log_listbox
+        generation = self.log_generation
 
-            self.update_log_display()
+        def removed(day):
+            self.logs_changed()
+
+            if day is not None:
+                self.totals_cache.invalidate(user_id, str(day))
+
+            # The entry may have moved if others were added meanwhile
+            if generation == self.log_generation and listbox.winfo_exists() and log_id in self.log_ids:
+                index = self.log_ids.index(log_id)
+                self.log_ids.pop(index)
+                listbox.delete(index)
             messagebox.showinfo("Success", "Item removed successfully!")
 
-        except IndexError:
-            messagebox.showerror("Error", "Please select an item to remove.")
+        self.run_service(lambda: service.remove_log(log_id), removed, "Error")
 
     def finish_session(self):
         """Finishes the current session and displays a summary"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """SELECT SUM(total_calories) 
-            FROM calorie_logs 
-            WHERE user_id=%s AND date=%s""",
-            (self.user_id, date.today().strftime("%Y-%m-%d"))
-        )
-
-        total_calories = cursor.fetchone()[0]
-        conn.close()
+        today = date.today().strftime("%Y-%m-%d")
+
+        def show_summary(totals):
+            total_calories = totals[0]
+            if total_calories:
+                messagebox.showinfo(
+                    "Session Summary",
+                    f"Total calories for today: {int(total_calories)} kcal"
+                )
+            else:
+                messagebox.showinfo(
+                    "Session Summary",
+                    "No items logged today."
+                )
 
-        if total_calories:
-            messagebox.showinfo(
-                "Session Summary",
-                f"Total calories for today: {int(total_calories)} kcal"
-            )
-        else:
-            messagebox.showinfo(
-                "Session Summary",
-                "No items logged today."
-            )
+        self.load_daily_totals([today], show_summary)
 
     def show_graph(self):
         """Displays a bar graph with the data from the database"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """SELECT food_name, 
-            SUM(total_calories) 
-            FROM calorie_logs 
-            WHERE user_id=%s 
-            GROUP BY food_name""",
-            (self.user_id,)
-        )
-        data = cursor.fetchall()
-        conn.close()
+        user_id = self.user_id
 
-        if not data:
-            messagebox.showinfo("Info", "No data to display.")
-            return
+        service = self.service
+
+        def fetch_totals():
+            return service.food_totals(user_id)
+
+        def plot(data):
+            if not data:
+                messagebox.showinfo("Info", "No data to display.")
+                return
 
-        food_names, calories = zip(*data)
-        plt.bar(food_names, calories, color='skyblue')
-        plt.xlabel("Food Items")
-        plt.ylabel("Calories")
-        plt.title("Calorie Intake")
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
+            if self.food_chart is None:
+                from helpers.charts import FoodChart
+                self.food_chart = FoodChart(self.root)
+            self.food_chart.update(data)
+            self.food_chart.show()
+
+        self.run_in_background(fetch_totals, plot)
 
     def show_trend_graph(self):
-        """Displays a trend graph"""
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """SELECT date, 
-            SUM(total_calories) 
-            FROM calorie_logs 
-            WHERE user_id=%s 
-            GROUP BY date""",
-            (self.user_id,)
-        )
+        """Displays the daily intake with rolling averages and the goal"""
+        user_id = self.user_id
+        goal = self.daily_goal
+        service = self.service
+
+        def fetch_series():
+            return service.daily_series(user_id, end=date.today())
+
+        def plot(series):
+            if not series.logged.any():
+                messagebox.showinfo("Info", "No data to display.")
+                return
+
+            if self.trend_chart is None:
+                from helpers.charts import TrendChart
+                self.trend_chart = TrendChart(self.root)
+            self.trend_chart.update(series, goal)
+            self.trend_chart.show()
+
+        self.run_in_background(fetch_series, plot)
+
+    def show_analytics(self):
+        """Displays long-range statistics of the logged intake"""
+        self.clear_screen()
 
-        data = cursor.fetchall()
-        conn.close()
+        analytics_frame = tk.Frame(self.root, padx=20, pady=20)
+        analytics_frame.grid(row=0, column=0, padx=50, pady=50)
 
-        if not data:
-            messagebox.showinfo("Info", "No data to display.")
+        tk.Label(
+            analytics_frame,
+            text="Analytics",
+            font=("Arial", 18, "bold")
+        ).grid(row=0, column=0, columnspan=2, pady=10)
+
+        stats_frame = tk.Frame(analytics_frame)
+        stats_frame.grid(row=1, column=0, columnspan=2, pady=10)
+
+        loading_label = tk.Label(stats_frame, text="Loading...")
+        loading_label.grid(row=0, column=0, columnspan=2)
+
+        tk.Button(
+            analytics_frame,
+            text="Back",
+            command=self.main_menu
+        ).grid(row=2, column=0, columnspan=2, pady=10)
+
+        user_id = self.user_id
+        goal = self.daily_goal
+
+        service = self.service
+
+        def analyze():
+            from helpers.analytics import buckets, summarize
+            series = service.daily_series(user_id, end=date.today())
+            return summarize(series, goal), buckets(series, "W"), buckets(series, "M")
+
+        def show_stats(result):
+            if not stats_frame.winfo_exists():
+                return
+            loading_label.destroy()
+
+            summary, weeks, months = result
+            if not summary["logged_days"]:
+                tk.Label(stats_frame, text="No data to display.").grid(row=0, column=0, columnspan=2)
+                return
+
+            percentiles = ", ".join(f"P{p}: {int(value)}" for p, value in summary["percentiles"].items())
+            rows = [
+                ("Logged days", summary["logged_days"]),
+                ("Average intake", f"{int(summary['mean'])} kcal"),
+                ("Percentiles", percentiles),
+                ("Logging streak", f"{summary['current_logging_streak']} days "
+                                   f"(longest {summary['longest_logging_streak']})"),
+            ]
+
+            if "goal" in summary:
+                adherence = summary["goal"]
+                rows += [
+                    ("On target", f"{adherence['on_target']} of {adherence['days']} days "
+                                  f"({adherence['adherence']:.0%})"),
+                    ("Deficit / surplus days", f"{adherence['deficit_days']} / {adherence['surplus_days']}"),
+                    ("Total deficit / surplus", f"{int(adherence['total_deficit'])} / "
+                                                f"{int(adherence['total_surplus'])} kcal"),
+                    ("Average vs goal", f"{int(adherence['mean_difference']):+d} kcal"),
+                    ("Longest on-target streak", f"{adherence['longest_on_target_streak']} days"),
+                ]
+
+            # Averages of the most recent weeks and months
+            for label, (starts, _, means), count in (("Week of", weeks, 4), ("Month of", months, 6)):
+                for start, mean in list(zip(starts, means))[-count:]:
+                    rows.append((f"{label} {start}", f"{int(mean)} kcal/day"))
+
+            for row, (name, value) in enumerate(rows):
+                tk.Label(stats_frame, text=f"{name}:").grid(row=row, column=0, sticky="e", padx=5)
+                tk.Label(stats_frame, text=str(value)).grid(row=row, column=1, sticky="w", padx=5)
+
+        self.run_in_background(analyze, show_stats)
+
+    def show_query_stats(self):
+        """Displays the database statements run so far, slowest in total
+        first, with where in the app they were run from"""
+        self.clear_screen()
+
+        stats_frame = tk.Frame(self.root, padx=20, pady=20)
+        stats_frame.grid(row=0, column=0, padx=50, pady=50)
+
+        tk.Label(
+            stats_frame,
+            text="Query Stats",
+            font=("Arial", 18, "bold")
+        ).grid(row=0, column=0, columnspan=3, pady=10)
+
+        statements = tk.Listbox(stats_frame, width=120, height=15, font=("Courier", 9))
+        statements.grid(row=1, column=0, columnspan=3, pady=5)
+        for entry in STATS.summary():
+            statements.insert(
+                tk.END,
+                f"{entry['calls']:>6} calls {entry['total_ms']:>9.1f} ms total "
+                f"{entry['mean_ms']:>7.1f} ms mean {entry['max_ms']:>7.1f} ms max  "
+                f"{entry['call_site']}  {entry['statement']}"
+            )
+
+        tk.Label(
+            stats_frame,
+            text=f"{len(STATS.slow)} recent statements took over {SLOW_QUERY_MS:g} ms"
+        ).grid(row=2, column=0, columnspan=3, pady=5)
+
+        tk.Button(
+            stats_frame,
+            text="Export JSON",
+            command=self.export_query_stats
+        ).grid(row=3, column=0, pady=10)
+
+        def reset():
+            STATS.reset()
+            self.show_query_stats()
+
+        tk.Button(
+            stats_frame,
+            text="Reset",
+            command=reset
+        ).grid(row=3, column=1, pady=10)
+
+        tk.Button(
+            stats_frame,
+            text="Back",
+            command=self.main_menu
+        ).grid(row=3, column=2, pady=10)
+
+    def export_query_stats(self, path=None):
+        """Writes the query stats, with the recent slow statements, as JSON"""
+        path = path or filedialog.asksaveasfilename(
+            title="Export Query Stats",
+            initialfile="query_stats.json",
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json")]
+        )
+        if not path:
+            return
+
+        try:
+            STATS.export_json(path)
+        except OSError as error:
+            messagebox.showerror("Export Query Stats", f"An error occurred: {error}")
             return
+        messagebox.showinfo("Export Query Stats", f"Query stats exported to {path}")
 
-        dates, total_calories = zip(*data)
-        plt.plot(dates, total_calories, marker='o')
-        plt.xlabel("Date")
-        plt.ylabel("Total Calories")
-        plt.title("Calorie Intake Trend")
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
+    def reset_session(self):
+        """Forgets everything held for the logged-in user, so the next user
+        starts with an empty meal, log list and charts"""
+        self.stop_sync()
+        self.syncer = None
+        self.user_id = None
+        self.daily_goal = None
+        self.meal_items = []
+        self.meal_listbox = None
+        self.log_ids = None
+        self.log_page_end = None
+        self.logs_exhausted = False
+        self.loading_logs = False
+        self.selected_log_id = None
+        # Pages still loading for the previous user are dropped
+        self.log_generation += 1
+        self.suggestions = []
+        self.totals_cache.clear()
+        self.close_charts()
+
+    def close_charts(self):
+        """Drops the charts, which still show the last user's data"""
+        for chart in (self.food_chart, self.trend_chart):
+            if chart is not None:
+                chart.close()
+        self.food_chart = None
+        self.trend_chart = None
+        # No longer kept, so clear_screen destroys its widget
+        self.dashboard_chart = None
 
     def clear_screen(self):
         for widget in self.root.winfo_children():
+            # Chart windows stay open across screens
+            if widget is self.status_label or isinstance(widget, tk.Toplevel):
+                continue
+            # The dashboard chart is kept for the next visit
+            if self.dashboard_chart is not None and widget is self.dashboard_chart.widget:
+                widget.grid_remove()
+                continue
             widget.destroy()
 
     def set_daily_goal(self):
@@ -714,80 +1432,170 @@ class CaloriesCalculator:
     def save_goal(self):
         try:
             new_goal = int(self.goal_entry.get())
-            self.daily_goal = new_goal
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid integer")
+            return
 
-            # Update the user's daily goal in the database
-            conn = get_connection()
-            cursor = conn.cursor()
+        user_id = self.user_id
 
-            cursor.execute(
-                "UPDATE users SET daily_goal=%s WHERE id=%s",
-                (new_goal, self.user_id)
-            )
-            conn.commit()
-            conn.close()
+        def save():
+            # Goals are not synced, so the server is written directly and
+            # the local copy, which offline logins read, is kept in step
+            self.server.set_goal(user_id, new_goal)
+            if self.service is not self.server:
+                self.service.set_goal(user_id, new_goal)
 
+        def saved(_):
+            self.daily_goal = new_goal
             messagebox.showinfo(
                 "Success",
                 f"Daily goal set to {self.daily_goal} kcal"
             )
-
             self.main_menu()
 
+        self.run_in_background(save, saved, "Daily Goal")
+
+    def show_export_screen(self):
+        """Displays the export options"""
+        self.clear_screen()
+
+        export_frame = tk.Frame(self.root, padx=20, pady=20)
+        export_frame.grid(row=0, column=0, padx=50, pady=50)
+
+        tk.Label(
+            export_frame,
+            text="Export Logs",
+            font=("Arial", 18, "bold")
+        ).grid(row=0, column=0, columnspan=2, pady=10)
+
+        tk.Label(
+            export_frame,
+            text="Format:"
+        ).grid(row=1, column=0, sticky="e", padx=5, pady=5)
+
+        formats = available_formats()
+        self.export_format_var = tk.StringVar(value=formats[0])
+        tk.OptionMenu(
+            export_frame,
+            self.export_format_var,
+            *formats
+        ).grid(row=1, column=1, padx=5, pady=5)
+
+        tk.Label(
+            export_frame,
+            text="From (YYYY-MM-DD):"
+        ).grid(row=2, column=0, sticky="e", padx=5, pady=5)
+
+        self.export_start_entry = tk.Entry(export_frame)
+        self.export_start_entry.grid(row=2, column=1, padx=5, pady=5)
+
+        tk.Label(
+            export_frame,
+            text="To (YYYY-MM-DD):"
+        ).grid(row=3, column=0, sticky="e", padx=5, pady=5)
+
+        self.export_end_entry = tk.Entry(export_frame)
+        self.export_end_entry.grid(row=3, column=1, padx=5, pady=5)
+
+        tk.Button(
+            export_frame,
+            text="Export",
+            command=self.start_export
+        ).grid(row=4, column=0, pady=10)
+
+        tk.Button(
+            export_frame,
+            text="Back",
+            command=self.main_menu
+        ).grid(row=4, column=1, pady=10)
+
+    def start_export(self):
+        """Reads the export options and exports the logs"""
+        try:
+            start, end = (
+                date.fromisoformat(value) if value else None
+                for value in (
+                    self.export_start_entry.get().strip(),
+                    self.export_end_entry.get().strip()
+                )
+            )
         except ValueError:
-            messagebox.showerror("Error", "Please enter a valid integer")
+            messagebox.showerror("Error", "Please enter dates as YYYY-MM-DD")
+            return
 
+        self.export_logs(self.export_format_var.get(), start, end)
 
-    def export_logs(self):
-        """Exports the logs of the current user to a csv file"""
-        # Query the database for the current user's logs
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """SELECT food_name, 
-            quantity, 
-            calories_per_100g, 
-            total_calories, 
-            meal_type, 
-            date 
-            FROM calorie_logs 
-            WHERE user_id=%s""",
-            (self.user_id,)
-        )
+    def export_logs(self, fmt="csv", start=None, end=None):
+        """Exports the logs of the current user, optionally limited to a date
+        range, streaming them from the database in batches"""
+        user_id = self.user_id
+        filename = f"user_{user_id}_calorie_logs{EXTENSIONS[fmt]}"
+
+        service = self.service
 
-        logs = cursor.fetchall()
-        conn.close()
+        def export():
+            return service.export_logs(user_id, filename, fmt, start, end)
 
-        if not logs:
-            messagebox.showinfo("Export Logs", "No logs available to export")
+        def report(exported):
+            if exported:
+                messagebox.showinfo("Export Logs", f"Logs exported successfully to {filename}")
+            else:
+                messagebox.showinfo("Export Logs", "No logs available to export")
+
+        self.run_in_background(export, report, "Export Logs")
+
+    def import_logs(self, path=None):
+        """Imports logs from a CSV file in the export layout"""
+        path = path or filedialog.askopenfilename(
+            title="Import Logs",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+        )
+        if not path:
             return
 
-        filename = f"user_{self.user_id}_calorie_logs.csv"
+        user_id = self.user_id
 
-        try:
-            with open(filename, "w", newline="") as csvfile:
-                writer = csv.writer(csvfile)
-
-                # Write header row
-                writer.writerow(
-                    [
-                    "Food Name",
-                    "Quantity (g)",
-                    "Calories per 100g",
-                    "Total Calories",
-                    "Meal Type",
-                    "Date"
-                ]
+        def run_import():
+            with get_connection() as conn:
+                return import_logs(conn, user_id, path)
+
+        def report(result):
+            # Every cached total may be stale now
+            self.totals_cache.clear()
+
+            message = f"Imported {result.imported} log entries."
+            if result.rejected:
+                details = "\n".join(f"Line {line}: {reason}" for line, reason in result.errors)
+                message += (
+                    f"\n\n{result.rejected} rows were rejected and listed in "
+                    f"{result.rejects_path}:\n{details}"
                 )
-                # Write each log entry
-                for log in logs:
-                    writer.writerow(log)
+            messagebox.showinfo("Import Logs", message)
+
+        self.run_in_background(run_import, report, "Import Logs")
 
-            messagebox.showinfo("Export Logs", f"Logs exported successfully to {filename}")
+    def load_daily_totals(self, days, on_loaded):
+        """Calls on_loaded with the calories logged on each of the given
+        consecutive days, from the cache or a single range query on the
+        worker. The cache is only touched on the Tk thread."""
+        user_id = self.user_id
+        service = self.service
+        use_cache = self.local_store is None
 
-        except Exception as e:
-            messagebox.showerror("Export Logs", f"An error occurred: {str(e)}")
+        if use_cache:
+            totals = self.totals_cache.get(user_id, days)
+            if totals is not None:
+                on_loaded(totals)
+                return
+        version = self.totals_cache.version
+
+        def loaded(totals):
+            # Skipped if the user logged out or logged food meanwhile
+            if use_cache and user_id == self.user_id:
+                self.totals_cache.store(user_id, dict(zip(days, totals)), version)
+            on_loaded(totals)
+
+        self.run_in_background(lambda: service.daily_totals(user_id, days), loaded)
 
     def show_dashboard(self):
         self.clear_screen()
@@ -802,49 +1610,8 @@ class CaloriesCalculator:
             font=("Arial", 18, "bold")
         ).grid(row=0, column=0, columnspan=2,pady=10)
 
-        # Query the last 7 days of data
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        days = []
-        totals = []
-
-        for i in range(6, -1, -1):
-            day = date.today() - timedelta(days=i)
-            day_str = day.strftime("%Y-%m-%d")
-            days.append(day_str)
-
-            cursor.execute("""SELECT SUM(total_calories) 
-            FROM calorie_logs 
-            WHERE user_id=%s AND date=%s""", (self.user_id, day_str))
-            result = cursor.fetchone()[0]
-            totals.append(result if result is not None else 0)
-
-        conn.close()
-
-        # Create a line chart using matplotlib
-        fig = Figure(figsize=(5, 3), dpi=100)
-        ax = fig.add_subplot(111)
-        ax.plot(days, totals, marker="o")
-        ax.set_title("Daily Calorie Intake (Last 7 Days)")
-        ax.set_xlabel("Date")
-        ax.set_ylabel("Total Calories")
-        ax.tick_params(axis="x", rotation=45, labelsize=10)
-        fig.autofmt_xdate()
-        fig.subplots_adjust(bottom=0.3)
-
-        canvas = FigureCanvasTkAgg(fig, master=dashboard_frame)
-        canvas.draw()
-        canvas.get_tk_widget().grid(row=1, column=0, columnspan=2, pady=10)
-
-        # Calculate and display the average daily intake
-        avg_intake = sum(totals) / 7
-
-        tk.Label(
-            dashboard_frame,
-            text=f"Average Daily Intake: {int(avg_intake)} kcal",
-            font=("Arial", 14)
-        ).grid(row=2, column=0, columnspan=2, pady=10)
+        loading_label = tk.Label(dashboard_frame, text="Loading...")
+        loading_label.grid(row=1, column=0, columnspan=2, pady=10)
 
         # Button to return to the main menu
         tk.Button(
@@ -853,8 +1620,40 @@ class CaloriesCalculator:
             command=self.main_menu
         ).grid(row=3, column=0, pady=10)
 
+        # Query the last 7 days of data
+        days = [
+            (date.today() - timedelta(days=i)).strftime("%Y-%m-%d")
+            for i in range(6, -1, -1)
+        ]
+
+        def show_totals(totals):
+            if not dashboard_frame.winfo_exists():
+                return
+            loading_label.destroy()
+
+            # The chart is created once and redrawn on every visit
+            if self.dashboard_chart is None:
+                from helpers.charts import DashboardChart
+                self.dashboard_chart = DashboardChart(self.root)
+            self.dashboard_chart.update(days, totals)
+            self.dashboard_chart.widget.grid(row=0, column=1, padx=(0, 50), pady=50)
+
+            # Calculate and display the average daily intake
+            avg_intake = sum(totals) / 7
+
+            tk.Label(
+                dashboard_frame,
+                text=f"Average Daily Intake: {int(avg_intake)} kcal",
+                font=("Arial", 14)
+            ).grid(row=2, column=0, columnspan=2, pady=10)
+
+        self.load_daily_totals(days, show_totals)
+
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = CaloriesCalculator(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    app.stop_sync()
+    app.worker.stop()
+    close_pool()
\ No newline at end of file
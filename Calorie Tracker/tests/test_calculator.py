@@ -1,16 +1,34 @@
 import pytest
 import tkinter as tk
 from datetime import date, timedelta
+import numpy as np
 import bcrypt
 import psycopg2
+import psycopg2.errors
 from unittest.mock import patch, Mock, MagicMock
 import sys
 import os
+import json
 
 # Add application directory to path so we can import the module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import CaloriesCalculator
+from helpers import helpers
+from helpers import migrations
+from helpers import passwords
+from helpers import rollup
+from helpers import export
+from helpers import importer
+from helpers.catalog import FoodCatalog
+from helpers.local_store import LocalStore
+from helpers import sync
+from helpers import service
+from helpers.service import LocalService
+from helpers import instrumentation
+from helpers import analytics
+from helpers import charts
+from helpers.worker import DatabaseWorker
 from helpers.helpers import calculate_bmr, calculate_calories, calculate_daily_calories
 
 
@@ -20,25 +38,72 @@ class MockConnection:
         self.cursor_mock = Mock()
         self.committed = False
         self.closed = False
+        self.released = False
+        self.rolled_back = False
 
-    def cursor(self):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.released = True
+
+    def cursor(self, name=None):
+        self.cursor_name = name
         return self.cursor_mock
 
     def commit(self):
         self.committed = True
 
+    def rollback(self):
+        self.rolled_back = True
+
     def close(self):
         self.closed = True
 
 
+class SyncWorker:
+    """Runs database jobs immediately instead of on a background thread"""
+
+    def submit(self, job, on_success=None, on_error=None):
+        try:
+            result = job()
+        except Exception as error:
+            if on_error:
+                on_error(error)
+            return
+        if on_success:
+            on_success(result)
+
+    def stop(self):
+        pass
+
+
 @pytest.fixture
 def app():
     """Fixture to create the app instance with mocked Tk root"""
     root = MagicMock()
-    app = CaloriesCalculator(root)
+    with patch('main.initialize_database'):
+        app = CaloriesCalculator(root, worker=SyncWorker())
     return app
 
 
+def test_startup_reports_unreachable_database():
+    """Test that the login screen shows before the schema check, whose
+    failure is reported unless the app can work offline"""
+    error = psycopg2.OperationalError("server unreachable")
+
+    with patch('main.initialize_database', side_effect=error), \
+            patch('main.messagebox.showerror') as mock_showerror, \
+            patch.object(CaloriesCalculator, 'show_login_screen') as mock_login:
+        CaloriesCalculator(MagicMock(), worker=SyncWorker())
+        mock_login.assert_called_once()
+        mock_showerror.assert_called_once()
+
+        mock_showerror.reset_mock()
+        CaloriesCalculator(MagicMock(), worker=SyncWorker(), local_store=LocalStore(":memory:"))
+        mock_showerror.assert_not_called()
+
+
 @pytest.fixture
 def mock_connection():
     """Fixture to provide a mock database connection"""
@@ -94,6 +159,164 @@ def test_calculate_daily_calories():
     assert calculate_daily_calories(bmr, "very active") == bmr * 1.725
 
 
+class MockPool:
+    def __init__(self, connections):
+        self.connections = list(connections)
+        self.returned = []
+        self.closed = False
+
+    def getconn(self):
+        return self.connections.pop(0)
+
+    def putconn(self, conn, close=False):
+        self.returned.append((conn, close))
+
+
+def make_pooled_connection(healthy=True):
+    conn = MagicMock()
+    conn.closed = 0 if healthy else 1
+    conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+def test_get_connection_returns_connection_to_pool():
+    """Test that a borrowed connection goes back to the pool"""
+    conn = make_pooled_connection()
+    mock_pool = MockPool([conn])
+
+    with patch('helpers.helpers.get_pool', return_value=mock_pool):
+        with helpers.get_connection() as borrowed:
+            assert borrowed is conn
+
+    assert mock_pool.returned == [(conn, False)]
+
+
+def test_get_connection_returns_connection_on_error():
+    """Test that a connection is rolled back and returned when the block raises"""
+    conn = make_pooled_connection()
+    mock_pool = MockPool([conn])
+
+    with patch('helpers.helpers.get_pool', return_value=mock_pool):
+        with pytest.raises(psycopg2.DatabaseError):
+            with helpers.get_connection():
+                raise psycopg2.DatabaseError("boom")
+
+    conn.rollback.assert_called_once()
+    assert mock_pool.returned == [(conn, False)]
+
+
+def test_get_connection_keeps_error_when_rollback_fails():
+    """Test that a failing rollback neither masks the error nor returns the connection"""
+    conn = make_pooled_connection()
+    conn.rollback.side_effect = psycopg2.InterfaceError("connection already closed")
+    mock_pool = MockPool([conn])
+
+    with patch('helpers.helpers.get_pool', return_value=mock_pool):
+        with pytest.raises(psycopg2.DatabaseError, match="boom"):
+            with helpers.get_connection():
+                raise psycopg2.DatabaseError("boom")
+
+    assert mock_pool.returned == [(conn, True)]
+
+
+def test_get_connection_replaces_broken_connection():
+    """Test that closed connections are discarded instead of handed out"""
+    broken = make_pooled_connection(healthy=False)
+    fresh = make_pooled_connection()
+    mock_pool = MockPool([broken, fresh])
+
+    with patch('helpers.helpers.get_pool', return_value=mock_pool):
+        with helpers.get_connection() as borrowed:
+            assert borrowed is fresh
+
+    assert mock_pool.returned == [(broken, True), (fresh, False)]
+
+
+def test_migrate_skips_current_schema():
+    """Test that a current schema costs a single query and no DDL"""
+    mock_conn = MockConnection()
+    mock_conn.rollback = Mock()
+    mock_conn.cursor_mock.fetchone.return_value = (migrations.SCHEMA_VERSION,)
+
+    assert migrations.migrate(mock_conn) == 0
+    mock_conn.cursor_mock.execute.assert_called_once_with("SELECT MAX(version) FROM schema_version")
+    assert not mock_conn.committed
+
+
+def test_migrate_applies_pending_migrations():
+    """Test that a fresh database gets every migration and its version rows"""
+    mock_conn = MockConnection()
+    mock_conn.rollback = Mock()
+    mock_cursor = mock_conn.cursor_mock
+
+    executed = []
+
+    def execute(statement, params=None):
+        executed.append((statement, params))
+        if len(executed) == 1:
+            raise psycopg2.errors.UndefinedTable("relation \"schema_version\" does not exist")
+
+    mock_cursor.execute.side_effect = execute
+    mock_cursor.fetchone.return_value = (None,)
+
+    assert migrations.migrate(mock_conn) == migrations.SCHEMA_VERSION
+    assert mock_conn.committed
+
+    versions = [params[0] for statement, params in executed if statement.startswith("INSERT INTO schema_version")]
+    assert versions == list(range(1, migrations.SCHEMA_VERSION + 1))
+    assert any("calorie_logs_user_date_idx" in statement for statement, _ in executed)
+    assert any("calorie_logs_user_food_idx" in statement for statement, _ in executed)
+    # Servers older than 13 get gen_random_uuid() from pgcrypto before it is used
+    statements = [statement for statement, _ in executed]
+    pgcrypto = next(i for i, statement in enumerate(statements) if "pgcrypto" in statement)
+    uuid_column = next(i for i, statement in enumerate(statements) if "gen_random_uuid()" in statement)
+    assert pgcrypto < uuid_column
+
+
+def test_database_worker_runs_jobs_off_the_tk_thread():
+    """Test that jobs run in the background and callbacks run when polled"""
+    import threading
+
+    root = MagicMock()
+    busy_states = []
+    worker = DatabaseWorker(root, on_busy=busy_states.append)
+    job_threads = []
+    results = []
+
+    def job():
+        job_threads.append(threading.current_thread())
+        return 42
+
+    worker.submit(job, results.append)
+    poll = root.after.call_args[0][1]
+
+    while not results:
+        poll()
+    worker.stop()
+
+    assert results == [42]
+    assert job_threads[0] is not threading.current_thread()
+    assert busy_states == [True, False]
+
+
+def test_database_worker_reports_errors():
+    """Test that job exceptions go to the error callback"""
+    root = MagicMock()
+    worker = DatabaseWorker(root)
+    errors = []
+
+    def job():
+        raise psycopg2.OperationalError("server closed the connection")
+
+    worker.submit(job, None, errors.append)
+    poll = root.after.call_args[0][1]
+    while not errors:
+        poll()
+    worker.stop()
+
+    assert isinstance(errors[0], psycopg2.OperationalError)
+
+
 # Application tests
 @patch('main.get_connection')
 def test_login_success(mock_get_connection, app):
@@ -117,7 +340,8 @@ def test_login_success(mock_get_connection, app):
 
     # Mock messagebox
     with patch('main.messagebox.showinfo') as mock_showinfo:
-        with patch.object(app, 'main_menu') as mock_main_menu:
+        with patch.object(app, 'main_menu') as mock_main_menu, \
+                patch.object(app, 'load_food_catalog') as mock_load_catalog:
             # Call the function
             app.login_user()
 
@@ -126,6 +350,7 @@ def test_login_success(mock_get_connection, app):
             assert app.daily_goal == 2000
             mock_showinfo.assert_called_once()
             mock_main_menu.assert_called_once()
+            mock_load_catalog.assert_called_once()
 
 
 @patch('main.get_connection')
@@ -158,6 +383,51 @@ def test_login_failure(mock_get_connection, app):
         mock_showerror.assert_called_once()
 
 
+def test_check_password_accepts_legacy_bytea_hashes():
+    """Hashes stored as bytes by older versions come back as bytea hex text"""
+    hashed = bcrypt.hashpw(b"password123", bcrypt.gensalt(4))
+    legacy = "\\x" + hashed.hex()
+
+    assert passwords.check_password("password123", legacy)
+    assert not passwords.check_password("wrong", legacy)
+    assert passwords.needs_rehash(legacy)
+
+
+def test_needs_rehash_compares_cost():
+    hashed = passwords.hash_password("password123", rounds=4)
+
+    assert isinstance(hashed, str)
+    assert not passwords.needs_rehash(hashed, rounds=4)
+    assert passwords.needs_rehash(hashed, rounds=5)
+
+
+@patch('main.get_connection')
+def test_login_rehashes_outdated_password(mock_get_connection, app):
+    """A successful login replaces a hash made with an outdated cost"""
+    mock_conn = MockConnection()
+    mock_cursor = mock_conn.cursor()
+    old_hash = passwords.hash_password("password123", rounds=4)
+    mock_cursor.fetchone.return_value = (1, old_hash, 2000)
+    mock_get_connection.return_value = mock_conn
+
+    app.username_entry = MagicMock()
+    app.username_entry.get.return_value = "testuser"
+    app.password_entry = MagicMock()
+    app.password_entry.get.return_value = "password123"
+
+    with patch('helpers.passwords.BCRYPT_ROUNDS', 5), \
+            patch('main.messagebox.showinfo'), patch.object(app, 'main_menu'), \
+            patch.object(app, 'load_food_catalog'):
+        app.login_user()
+
+    sql, params = mock_cursor.execute.call_args[0]
+    assert sql.startswith("UPDATE users SET password")
+    assert params[1] == 1
+    assert passwords.check_password("password123", params[0])
+    assert not passwords.needs_rehash(params[0], rounds=5)
+    assert mock_conn.committed
+
+
 @patch('main.get_connection')
 def test_register_user_success(mock_get_connection, app):
     """Test successful user registration"""
@@ -182,10 +452,15 @@ def test_register_user_success(mock_get_connection, app):
 
             # Verify the results
             assert mock_conn.committed
-            assert mock_conn.closed
+            assert mock_conn.released
             mock_showinfo.assert_called_once()
             mock_show_login.assert_called_once()
 
+            # The hash is stored as text, not bytes
+            stored_hash = mock_cursor.execute.call_args[0][1][1]
+            assert isinstance(stored_hash, str)
+            assert passwords.check_password("newpassword", stored_hash)
+
 
 @patch('main.get_connection')
 def test_register_user_duplicate(mock_get_connection, app):
@@ -212,7 +487,7 @@ def test_register_user_duplicate(mock_get_connection, app):
         app.register_user()
 
         # Verify the results
-        assert mock_conn.closed
+        assert mock_conn.released
         mock_showerror.assert_called_once()
 
 
@@ -247,7 +522,7 @@ def test_calculate_daily_intake(mock_daily_calories, mock_bmr, app):
         mock_showinfo.assert_called_once_with("Result", "Your daily calorie intake: 2700 kcal")
 
 
-@patch('main.get_connection')
+@patch('helpers.service.get_connection')
 def test_add_item(mock_get_connection, app):
     """Test adding a food item to the log"""
     # Setup mock
@@ -267,6 +542,9 @@ def test_add_item(mock_get_connection, app):
     app.calories_entry.get.return_value = "89"
     app.meal_type_var = MagicMock()
     app.meal_type_var.get.return_value = "Snack"
+    app.log_ids = [4]
+    app.log_listbox = MagicMock()
+    mock_cursor.fetchone.return_value = (10,)
 
     # Mock update_log_display
     with patch.object(app, 'update_log_display') as mock_update_log:
@@ -275,16 +553,25 @@ def test_add_item(mock_get_connection, app):
 
         # Verify the results
         assert mock_conn.committed
-        assert mock_conn.closed
-        mock_cursor.execute.assert_called_once()
-        mock_update_log.assert_called_once()
+        assert mock_conn.released
+        # The log entry and its daily_totals row are written together
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        assert "INSERT INTO calorie_logs" in statements[0]
+        assert "INSERT INTO daily_totals" in statements[1]
+        assert mock_cursor.execute.call_args[0][1][1:] == (
+            date.today().strftime("%Y-%m-%d"), "Banana", "Snack", 134, 1
+        )
+        # The new row is added on top instead of reloading the list
+        mock_update_log.assert_not_called()
+        assert app.log_ids == [10, 4]
+        app.log_listbox.insert.assert_called_once_with(0, "Banana - 150g - 134 kcal - Snack")
         # Check entry fields were cleared
         app.food_entry.delete.assert_called_with(0, tk.END)
         app.quantity_entry.delete.assert_called_with(0, tk.END)
         app.calories_entry.delete.assert_called_with(0, tk.END)
 
 
-@patch('main.get_connection')
+@patch('helpers.service.get_connection')
 def test_update_log_display(mock_get_connection, app):
     """Test updating the log display"""
     # Setup mock
@@ -293,8 +580,8 @@ def test_update_log_display(mock_get_connection, app):
 
     # Mock data return
     mock_cursor.fetchall.return_value = [
-        (1, "Apple", 100, 52, "Snack"),
-        (2, "Chicken", 200, 330, "Dinner")
+        (2, "Chicken", 200, 330, "Dinner", date(2025, 4, 30)),
+        (1, "Apple", 100, 52, "Snack", date(2025, 4, 30))
     ]
 
     # Mock the connection function
@@ -308,13 +595,51 @@ def test_update_log_display(mock_get_connection, app):
     app.update_log_display()
 
     # Verify the results
-    assert app.log_ids == [1, 2]
-    assert mock_conn.closed
+    assert app.log_ids == [2, 1]
+    assert mock_conn.released
     app.log_listbox.delete.assert_called_once_with(0, tk.END)
     assert app.log_listbox.insert.call_count == 2
 
+    # Only the first page, newest first, is requested
+    sql, params = mock_cursor.execute.call_args[0]
+    assert "ORDER BY date DESC, id DESC" in sql
+    assert params == (1, date.today(), app.LOG_PAGE_SIZE)
+    # A short page means there is nothing older to load
+    assert app.logs_exhausted
 
-@patch('main.get_connection')
+
+@patch('helpers.service.get_connection')
+def test_load_more_logs_continues_after_last_row(mock_get_connection, app):
+    """Test that scrolling fetches the page below the last row shown"""
+    mock_conn = MockConnection()
+    mock_cursor = mock_conn.cursor()
+    mock_get_connection.return_value = mock_conn
+
+    app.user_id = 1
+    app.LOG_PAGE_SIZE = 2
+    app.log_listbox = MagicMock()
+    mock_cursor.fetchall.return_value = [
+        (9, "Apple", 100, 52, "Snack", date(2025, 4, 30)),
+        (7, "Rice", 150, 195, "Lunch", date(2025, 4, 29))
+    ]
+    app.update_log_display()
+    assert app.log_page_end == (date(2025, 4, 29), 7)
+
+    mock_cursor.fetchall.return_value = [(3, "Egg", 50, 78, "Breakfast", date(2025, 4, 28))]
+    app.load_more_logs()
+
+    sql, params = mock_cursor.execute.call_args[0]
+    assert "(date, id) < (%s, %s)" in sql
+    assert params == (1, date(2025, 4, 29), 7, 2)
+    assert app.log_ids == [9, 7, 3]
+    assert app.logs_exhausted
+
+    # Nothing more is fetched once the oldest entry is shown
+    app.load_more_logs()
+    assert mock_cursor.execute.call_count == 2
+
+
+@patch('helpers.service.get_connection')
 def test_save_goal(mock_get_connection, app):
     """Test saving a daily calorie goal"""
     # Setup mock
@@ -338,23 +663,26 @@ def test_save_goal(mock_get_connection, app):
             # Verify the results
             assert app.daily_goal == 2500
             assert mock_conn.committed
-            assert mock_conn.closed
+            assert mock_conn.released
             mock_cursor.execute.assert_called_once()
             mock_showinfo.assert_called_once()
             mock_main_menu.assert_called_once()
 
 
-@patch('main.get_connection')
+@patch('helpers.service.get_connection')
 def test_export_logs(mock_get_connection, app, tmp_path):
     """Test exporting logs to CSV"""
     # Setup mock
     mock_conn = MockConnection()
     mock_cursor = mock_conn.cursor()
 
-    # Mock data return
-    mock_cursor.fetchall.return_value = [
-        ("Apple", 100, 52, 52, "Snack", "2025-04-30"),
-        ("Chicken", 200, 165, 330, "Dinner", "2025-04-30")
+    # Mock data return, one batch followed by the end of the results
+    mock_cursor.fetchmany.side_effect = [
+        [
+            ("Apple", 100, 52, 52, "Snack", "2025-04-30"),
+            ("Chicken", 200, 165, 330, "Dinner", "2025-04-30")
+        ],
+        []
     ]
 
     # Mock the connection function
@@ -375,13 +703,18 @@ def test_export_logs(mock_get_connection, app, tmp_path):
             app.export_logs()
 
             # Verify the results
-            assert mock_conn.closed
+            assert mock_conn.released
+            assert mock_conn.rolled_back
+            # Rows are streamed through a server-side cursor
+            assert mock_conn.cursor_name == "export_logs"
             mock_cursor.execute.assert_called_once()
+            mock_cursor.fetchall.assert_not_called()
+            mock_cursor.close.assert_called_once()
             mock_open.assert_called_once()
             mock_showinfo.assert_called_once()
 
 
-@patch('main.get_connection')
+@patch('helpers.service.get_connection')
 def test_finish_session(mock_get_connection, app):
     """Test finish session summary display"""
     # Setup mock
@@ -389,7 +722,7 @@ def test_finish_session(mock_get_connection, app):
     mock_cursor = mock_conn.cursor()
 
     # Mock data return for today's calories
-    mock_cursor.fetchone.return_value = [1850]
+    mock_cursor.fetchall.return_value = [(date.today(), 1850)]
 
     # Mock the connection function
     mock_get_connection.return_value = mock_conn
@@ -403,14 +736,14 @@ def test_finish_session(mock_get_connection, app):
         app.finish_session()
 
         # Verify the results
-        assert mock_conn.closed
+        assert mock_conn.released
         mock_cursor.execute.assert_called_once()
         mock_showinfo.assert_called_once_with("Session Summary", "Total calories for today: 1850 kcal")
 
 
-@patch('matplotlib.pyplot')
-@patch('main.get_connection')
-def test_show_graph(mock_get_connection, mock_plt, app):
+@patch('helpers.charts.FoodChart')
+@patch('helpers.service.get_connection')
+def test_show_graph(mock_get_connection, mock_chart, app):
     """Test displaying the calorie graph"""
     # Setup mock
     mock_conn = MockConnection()
@@ -433,10 +766,91 @@ def test_show_graph(mock_get_connection, mock_plt, app):
     app.show_graph()
 
     # Verify the results
-    assert mock_conn.closed
+    assert mock_conn.released
     mock_cursor.execute.assert_called_once()
-    mock_plt.bar.assert_called_once()
-    mock_plt.show.assert_called_once()
+    mock_chart.return_value.update.assert_called_once_with([("Apple", 150), ("Banana", 105), ("Chicken", 330)])
+    mock_chart.return_value.show.assert_called_once()
+
+    # Showing the graph again reuses the same chart
+    app.show_graph()
+    mock_chart.assert_called_once()
+
+
+def test_logout_closes_charts(app):
+    """Test that no chart of the previous user survives a logout"""
+    food_chart, trend_chart, dashboard_chart = MagicMock(), MagicMock(), MagicMock()
+    app.food_chart, app.trend_chart, app.dashboard_chart = food_chart, trend_chart, dashboard_chart
+    app.root.winfo_children.return_value = [dashboard_chart.widget]
+
+    app.show_login_screen()
+
+    food_chart.close.assert_called_once()
+    trend_chart.close.assert_called_once()
+    dashboard_chart.widget.destroy.assert_called_once()
+    assert app.food_chart is app.trend_chart is app.dashboard_chart is None
+
+
+def test_logout_and_login_reset_user_state(app):
+    """Test that a staged meal and other state of one user never reach the next"""
+    app.user_id = 1
+    app.daily_goal = 2000
+    app.meal_items = [("Apple", 100, 52)]
+    app.log_ids = [1, 2]
+    app.selected_log_id = 2
+    app.totals_cache.store(1, {"2025-04-30": 500})
+    syncer = app.syncer = MagicMock()
+
+    app.show_login_screen()
+
+    syncer.stop.assert_called_once()
+    assert app.user_id is None and app.daily_goal is None
+    assert app.meal_items == []
+    assert app.log_ids is None and app.selected_log_id is None
+    assert app.totals_cache.get(1, ["2025-04-30"]) is None
+
+    app.meal_items = [("Banana", 120, 89)]
+    app.username_entry = MagicMock()
+    app.password_entry = MagicMock()
+    app.password_entry.get.return_value = "password123"
+    user = (2, passwords.hash_password("password123", rounds=4), 1800)
+    with patch('main.get_connection') as mock_get_connection, \
+            patch('main.messagebox.showinfo'), patch.object(app, 'main_menu'), \
+            patch.object(app, 'load_food_catalog'):
+        mock_get_connection.return_value.__enter__.return_value.cursor.return_value.fetchone.return_value = user
+        app.login_user()
+
+    assert app.user_id == 2
+    assert app.meal_items == []
+
+
+@patch('helpers.service.get_connection')
+def test_save_goal_updates_local_store(mock_get_connection):
+    """Test that a saved goal also reaches the local store, and that an
+    unreachable server is reported without changing the goal"""
+    mock_get_connection.return_value = MockConnection()
+    store = LocalStore(":memory:")
+    store.cache_user("testuser", 1, "", 2000)
+    with patch('main.initialize_database'):
+        app = CaloriesCalculator(MagicMock(), worker=SyncWorker(), local_store=store)
+    app.user_id = 1
+    app.daily_goal = 2000
+    app.goal_entry = MagicMock()
+    app.goal_entry.get.return_value = "2500"
+
+    with patch('main.messagebox.showinfo'), patch.object(app, 'main_menu'):
+        app.save_goal()
+
+    assert app.daily_goal == 2500
+    assert store.cached_user("testuser")[2] == 2500
+
+    mock_get_connection.side_effect = psycopg2.OperationalError("server unreachable")
+    app.goal_entry.get.return_value = "1800"
+    with patch('main.messagebox.showerror') as mock_showerror:
+        app.save_goal()
+
+    mock_showerror.assert_called_once()
+    assert app.daily_goal == 2500
+    assert store.cached_user("testuser")[2] == 2500
 
 
 @patch('main.get_connection')
@@ -455,7 +869,7 @@ def test_set_daily_goal_invalid_input(mock_get_connection, app):
         mock_showerror.assert_called_once_with("Error", "Please enter a valid integer")
 
 
-@patch('main.get_connection')
+@patch('helpers.service.get_connection')
 def test_remove_item(mock_get_connection, app):
     """Test removing a food item from the log"""
     # Setup mock
@@ -470,6 +884,7 @@ def test_remove_item(mock_get_connection, app):
     app.log_listbox = MagicMock()
     app.log_listbox.curselection.return_value = [0]
     app.log_ids = [5, 6, 7]  # Mock log IDs
+    mock_cursor.fetchone.return_value = (1, date(2025, 4, 30), "Banana", "Snack", 134)
 
     # Mock update_log_display and messagebox
     with patch.object(app, 'update_log_display') as mock_update_log:
@@ -479,7 +894,852 @@ def test_remove_item(mock_get_connection, app):
 
             # Verify the results
             assert mock_conn.committed
-            assert mock_conn.closed
-            mock_cursor.execute.assert_called_once_with("DELETE FROM calorie_logs WHERE id=%s", (5,))
-            mock_update_log.assert_called_once()
-            mock_showinfo.assert_called_once()
\ No newline at end of file
+            assert mock_conn.released
+            delete_sql, delete_params = mock_cursor.execute.call_args_list[0][0]
+            assert delete_sql.startswith("DELETE FROM calorie_logs WHERE id=%s")
+            assert delete_params == (5,)
+            # The removed entry is subtracted from its rollup row
+            upsert_params = mock_cursor.execute.call_args_list[1][0][1]
+            assert upsert_params == (1, date(2025, 4, 30), "Banana", "Snack", -134, -1)
+            # Only the removed row leaves the list
+            mock_update_log.assert_not_called()
+            assert app.log_ids == [6, 7]
+            app.log_listbox.delete.assert_called_once_with(0)
+            mock_showinfo.assert_called_once()
+
+
+@patch('helpers.service.get_connection')
+def test_get_daily_totals_single_query(mock_get_connection, app):
+    """Test that the dashboard totals come from one range query with missing days filled in"""
+    mock_conn = MockConnection()
+    mock_cursor = mock_conn.cursor()
+    mock_cursor.fetchall.return_value = [(date(2025, 4, 28), 1800), (date(2025, 4, 30), 2100)]
+    mock_get_connection.return_value = mock_conn
+
+    app.user_id = 1
+    days = ["2025-04-28", "2025-04-29", "2025-04-30"]
+
+    loaded = []
+    app.load_daily_totals(days, loaded.append)
+    assert loaded == [[1800, 0, 2100]]
+    mock_cursor.execute.assert_called_once()
+    assert mock_cursor.execute.call_args[0][1] == (1, "2025-04-28", "2025-04-30")
+
+    # Served from the cache on the second call
+    app.load_daily_totals(days, loaded.append)
+    assert loaded[1] == [1800, 0, 2100]
+    mock_cursor.execute.assert_called_once()
+
+
+def test_daily_totals_are_cached_on_the_tk_thread_only_while_current(app):
+    """Test that the worker only queries, and that totals read before an
+    invalidation or by a user who has logged out are not cached"""
+    app.user_id = 1
+    days = ["2025-04-30"]
+    jobs = []
+    app.worker = MagicMock()
+    app.worker.submit.side_effect = lambda job, on_success, on_error: jobs.append((job, on_success))
+
+    with patch.object(app.service, 'daily_totals', return_value=[500]) as mock_totals:
+        app.load_daily_totals(days, lambda totals: None)
+        job, on_success = jobs.pop()
+        result = job()
+        mock_totals.assert_called_once_with(1, days)
+        assert app.totals_cache.get(1, days) is None
+
+        # Food logged before the result reaches the Tk thread
+        app.totals_cache.invalidate(1, "2025-04-30")
+        on_success(result)
+        assert app.totals_cache.get(1, days) is None
+
+        app.load_daily_totals(days, lambda totals: None)
+        job, on_success = jobs.pop()
+        result = job()
+        app.user_id = 2
+        on_success(result)
+        assert app.totals_cache.get(1, days) is None
+
+        app.user_id = 1
+        app.load_daily_totals(days, lambda totals: None)
+        job, on_success = jobs.pop()
+        on_success(job())
+        assert app.totals_cache.get(1, days) == [500]
+
+
+@patch('helpers.service.get_connection')
+def test_add_item_invalidates_daily_totals(mock_get_connection, app):
+    """Test that logging food drops the cached total for today"""
+    mock_conn = MockConnection()
+    mock_conn.cursor_mock.fetchone.return_value = (10,)
+    mock_get_connection.return_value = mock_conn
+    app.log_ids = []
+    app.log_listbox = MagicMock()
+
+    today = date.today().strftime("%Y-%m-%d")
+    app.user_id = 1
+    app.totals_cache.store(1, {today: 500})
+    app.food_entry = MagicMock()
+    app.food_entry.get.return_value = "Banana"
+    app.quantity_entry = MagicMock()
+    app.quantity_entry.get.return_value = "150"
+    app.calories_entry = MagicMock()
+    app.calories_entry.get.return_value = "89"
+    app.meal_type_var = MagicMock()
+    app.meal_type_var.get.return_value = "Snack"
+
+    app.add_item()
+
+    assert app.totals_cache.get(1, [today]) is None
+
+
+def test_log_edits_run_on_the_worker(app):
+    """Test that changing logs against the server leaves the Tk thread
+    before touching the service, and that a removal finds its row even
+    if entries were added meanwhile"""
+    jobs = []
+    app.worker = MagicMock()
+    app.worker.submit.side_effect = lambda job, on_success, on_error: jobs.append((job, on_success))
+    app.service = MagicMock()
+    app.service.add_log.return_value = (8, 134)
+    app.service.remove_log.return_value = date(2025, 4, 30)
+    app.user_id = 1
+    app.log_ids = [5, 6]
+    app.log_listbox = MagicMock()
+    app.log_listbox.curselection.return_value = [0]
+    app.food_entry = MagicMock()
+    app.food_entry.get.return_value = "Banana"
+    app.quantity_entry = MagicMock()
+    app.quantity_entry.get.return_value = "150"
+    app.calories_entry = MagicMock()
+    app.calories_entry.get.return_value = "89"
+    app.meal_type_var = MagicMock()
+    app.meal_type_var.get.return_value = "Snack"
+
+    app.remove_item()
+    app.add_item()
+    app.service.remove_log.assert_not_called()
+    app.service.add_log.assert_not_called()
+
+    add_job, added = jobs.pop()
+    added(add_job())
+    assert app.log_ids == [8, 5, 6]
+
+    remove_job, removed = jobs.pop()
+    with patch('main.messagebox.showinfo'):
+        removed(remove_job())
+    app.service.remove_log.assert_called_once_with(5)
+    assert app.log_ids == [8, 6]
+    app.log_listbox.delete.assert_called_once_with(1)
+
+
+def test_log_edits_report_service_errors(app):
+    """Test that database errors while saving or removing an entry are shown
+    instead of escaping the Tk callback"""
+    app.service = MagicMock()
+    app.service.edit_log.side_effect = psycopg2.OperationalError("server gone")
+    app.service.remove_log.side_effect = psycopg2.OperationalError("server gone")
+    app.user_id = 1
+    app.selected_log_id = 5
+    app.log_ids = [5]
+    app.log_listbox = MagicMock()
+    app.log_listbox.curselection.return_value = [0]
+    app.food_entry = MagicMock()
+    app.food_entry.get.return_value = "Apple"
+    app.quantity_entry = MagicMock()
+    app.quantity_entry.get.return_value = "200"
+    app.calories_entry = MagicMock()
+    app.calories_entry.get.return_value = "52"
+    app.meal_type_var = MagicMock()
+    app.meal_type_var.get.return_value = "Lunch"
+
+    with patch('main.messagebox.showerror') as mock_showerror:
+        app.save_edit()
+        app.remove_item()
+
+    assert mock_showerror.call_count == 2
+    assert app.log_ids == [5]
+    app.log_listbox.delete.assert_not_called()
+
+
+@patch('helpers.service.get_connection')
+def test_save_edit_moves_rollup_entry(mock_get_connection, app):
+    """Test that editing an entry moves its calories between rollup rows"""
+    mock_conn = MockConnection()
+    mock_cursor = mock_conn.cursor()
+    mock_cursor.fetchone.return_value = (1, date(2025, 4, 30), "Banana", "Snack", 134)
+    mock_get_connection.return_value = mock_conn
+
+    app.user_id = 1
+    app.selected_log_id = 5
+    app.log_ids = [6, 5]
+    app.log_listbox = MagicMock()
+    app.totals_cache.store(1, {"2025-04-30": 900})
+    app.food_entry = MagicMock()
+    app.food_entry.get.return_value = "Apple"
+    app.quantity_entry = MagicMock()
+    app.quantity_entry.get.return_value = "200"
+    app.calories_entry = MagicMock()
+    app.calories_entry.get.return_value = "52"
+    app.meal_type_var = MagicMock()
+    app.meal_type_var.get.return_value = "Lunch"
+
+    with patch.object(app, 'update_log_display'), patch('main.messagebox.showinfo'):
+        app.save_edit()
+
+    assert mock_conn.committed
+    assert "FOR UPDATE" in mock_cursor.execute.call_args_list[0][0][0]
+    upserts = [
+        call[0][1] for call in mock_cursor.execute.call_args_list
+        if "INSERT INTO daily_totals" in call[0][0]
+    ]
+    assert upserts == [
+        (1, date(2025, 4, 30), "Banana", "Snack", -134, -1),
+        (1, date(2025, 4, 30), "Apple", "Lunch", 104, 1),
+    ]
+    assert app.totals_cache.get(1, ["2025-04-30"]) is None
+    # The edited row is redrawn in place
+    app.log_listbox.delete.assert_called_once_with(1)
+    app.log_listbox.insert.assert_called_once_with(1, "Apple - 200g - 104 kcal - Lunch")
+
+
+def test_rollup_rebuild_for_one_user():
+    """Test that a rebuild replaces only the given user's rollup rows"""
+    mock_conn = MockConnection()
+    mock_cursor = mock_conn.cursor_mock
+    mock_cursor.rowcount = 3
+
+    assert rollup.rebuild(mock_conn, user_id=1) == 3
+    assert mock_conn.committed
+
+    statements = [call[0] for call in mock_cursor.execute.call_args_list]
+    assert statements[0] == ("LOCK TABLE calorie_logs IN SHARE MODE",)
+    assert statements[1] == ("DELETE FROM daily_totals WHERE user_id=%s", (1,))
+    assert "GROUP BY user_id, date, food_name, meal_type" in statements[2][0]
+    assert statements[2][1] == (1,)
+
+
+def test_fetch_batches_applies_date_range():
+    """Test that the date filters end up in the export query"""
+    mock_conn = MockConnection()
+    mock_cursor = mock_conn.cursor_mock
+    mock_cursor.fetchmany.side_effect = [[("Apple", 100, 52, 52, "Snack", date(2025, 4, 30))], []]
+
+    batches = list(export.fetch_batches(mock_conn, 1, date(2025, 4, 1), date(2025, 4, 30), batch_size=1))
+
+    assert len(batches) == 1
+    sql, params = mock_cursor.execute.call_args[0]
+    assert "date >= %s AND date <= %s" in sql
+    assert params == [1, date(2025, 4, 1), date(2025, 4, 30)]
+    mock_cursor.fetchmany.assert_called_with(1)
+
+
+def test_write_logs_gzip(tmp_path):
+    """Test that batches are written to a compressed CSV"""
+    import gzip
+
+    path = tmp_path / "logs.csv.gz"
+    batches = iter([
+        [("Apple", 100, 52, 52, "Snack", date(2025, 4, 29))],
+        [("Chicken", 200, 165, 330, "Dinner", date(2025, 4, 30))],
+    ])
+
+    assert export.write_logs(batches, path, "csv.gz") == 2
+    with gzip.open(path, "rt") as f:
+        lines = f.read().splitlines()
+    assert lines[0] == ",".join(export.COLUMNS)
+    assert lines[2] == "Chicken,200,165,330,Dinner,2025-04-30"
+
+
+def test_write_logs_without_rows_creates_no_file(tmp_path):
+    path = tmp_path / "logs.csv"
+
+    assert export.write_logs(iter([]), path) == 0
+    assert not path.exists()
+
+
+def test_import_logs_copies_valid_rows(tmp_path):
+    """Test that valid rows are streamed through COPY and invalid ones reported"""
+    path = tmp_path / "logs.csv"
+    path.write_text(
+        ",".join(export.COLUMNS) + "\n"
+        "Apple,100,52,52,Snack,2025-04-29\n"
+        "Chicken,-5,165,0,Dinner,2025-04-30\n"
+        "Rice,150,130,,Lunch,2025-04-30\n"
+        "Cake,100,400,400,Dessert,2025-04-30\n"
+    )
+
+    mock_conn = MockConnection()
+    mock_cursor = mock_conn.cursor_mock
+    mock_cursor.rowcount = 2
+    copied = []
+    mock_cursor.copy_expert.side_effect = lambda sql, stream: copied.append(stream.read(16) + stream.read())
+
+    report = importer.import_logs(mock_conn, 1, str(path))
+
+    assert mock_conn.committed
+    assert copied == ["Apple,100,52,52,Snack,2025-04-29\r\nRice,150,130,195,Lunch,2025-04-30\r\n"]
+    assert report.imported == 2
+    assert report.rejected == 2
+    assert [line for line, _ in report.errors] == [3, 5]
+
+    # One statement each fills the logs and refreshes the rollup
+    statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+    assert "INSERT INTO calorie_logs" in statements[1]
+    assert "INSERT INTO daily_totals" in statements[2]
+
+    with open(report.rejects_path) as f:
+        assert len(f.read().splitlines()) == 3
+
+
+def test_import_logs_rejects_unknown_layout(tmp_path):
+    path = tmp_path / "logs.csv"
+    path.write_text("name,calories\nApple,52\n")
+
+    with pytest.raises(ValueError):
+        importer.import_logs(MockConnection(), 1, str(path))
+    assert not (tmp_path / "logs.csv.rejected.csv").exists()
+
+
+
+def test_import_logs_removes_rejects_when_the_import_fails(tmp_path):
+    """Test that a failed import, which the caller rolls back, leaves no
+    rejects file behind"""
+    path = tmp_path / "logs.csv"
+    path.write_text(
+        "Food Name,Quantity (g),Calories per 100g,Total Calories,Meal Type,Date\n"
+        "Cake,100,400,400,Dessert,2025-04-30\n"
+    )
+
+    mock_conn = MockConnection()
+    mock_conn.cursor_mock.copy_expert.side_effect = lambda sql, stream: stream.read()
+    mock_conn.cursor_mock.execute.side_effect = [None, psycopg2.OperationalError("server gone")]
+
+    with pytest.raises(psycopg2.OperationalError):
+        importer.import_logs(mock_conn, 1, str(path))
+    assert not mock_conn.committed
+    assert not (tmp_path / "logs.csv.rejected.csv").exists()
+
+def test_food_catalog_prefix_search():
+    """Test that catalog lookups match name prefixes regardless of case"""
+    catalog = FoodCatalog([
+        (1, "Banana", 89),
+        (2, "apple", 52),
+        (3, "Apple Pie", 237),
+        (4, "Apricot", 48),
+        (5, "Applesauce", 68),
+    ])
+
+    assert catalog.search("APP") == [("apple", 52), ("Apple Pie", 237), ("Applesauce", 68)]
+    assert catalog.search("ap", limit=2) == [("apple", 52), ("Apple Pie", 237)]
+    assert catalog.search("kiwi") == []
+    assert catalog.search("") == []
+
+
+def test_food_catalog_applies_changes():
+    """Test that refreshed rows replace, add and remove catalog entries"""
+    catalog = FoodCatalog([(1, "Apple", 52), (2, "Banana", 89)])
+
+    catalog.apply([(2, "Apricot", 48), (3, "Avocado", 160)], [1], "later")
+
+    assert len(catalog) == 2
+    assert catalog.search("a") == [("Apricot", 48), ("Avocado", 160)]
+    assert catalog.search("b") == []
+    assert catalog.loaded_at == "later"
+
+
+@patch('main.get_connection')
+def test_load_food_catalog_fetches_only_changes(mock_get_connection, app):
+    """Test that a loaded catalog is refreshed with the rows changed since"""
+    from datetime import datetime
+
+    mock_conn = MockConnection()
+    mock_cursor = mock_conn.cursor()
+    mock_get_connection.return_value = mock_conn
+    refreshed_at = datetime(2025, 4, 30, 12, 0)
+    mock_cursor.fetchone.return_value = (refreshed_at,)
+    mock_cursor.fetchall.side_effect = [[(2, "Banana", 89)], [(1,)]]
+
+    app.food_catalog = FoodCatalog([(1, "Apple", 52)], datetime(2025, 4, 30, 11, 0))
+    app.load_food_catalog()
+
+    since = mock_cursor.execute.call_args_list[1][0][1][0]
+    assert since < datetime(2025, 4, 30, 11, 0)
+    assert app.food_catalog.search("a") == []
+    assert app.food_catalog.search("b") == [("Banana", 89)]
+    assert app.food_catalog.loaded_at == refreshed_at
+    assert not app.loading_catalog
+
+
+def test_use_suggestion_fills_calories(app):
+    """Test that picking a suggestion fills in the food name and calories"""
+    app.food_catalog = FoodCatalog([(1, "Apple", 52.4), (2, "Apricot", 48)])
+    app.food_entry = MagicMock()
+    app.food_entry.get.return_value = "ap"
+    app.calories_entry = MagicMock()
+    app.quantity_entry = MagicMock()
+    app.suggestion_listbox = MagicMock()
+
+    app.show_suggestions()
+    assert app.suggestion_listbox.insert.call_count == 2
+
+    app.suggestion_listbox.curselection.return_value = (0,)
+    app.use_suggestion()
+
+    app.food_entry.insert.assert_called_once_with(0, "Apple")
+    app.calories_entry.insert.assert_called_once_with(0, 52)
+
+
+def test_local_store_last_writer_wins():
+    """Test that pulled rows only replace local entries they are newer than"""
+    store = LocalStore(":memory:")
+    today = date.today().strftime("%Y-%m-%d")
+    log_uuid = store.add_log(1, "Apple", 100, 52, 52, "Snack", today)
+
+    older = (log_uuid, 1, "Apple", 50, 52, 26, "Snack", today, "2000-01-01T00:00:00.000000+00:00")
+    store.merge([older], [])
+    assert store.get_log(log_uuid) == ("Apple", 100, 52)
+    assert len(store.dirty_logs(1)) == 1
+
+    newer = (log_uuid, 1, "Apple", 300, 52, 156, "Snack", today, "2999-01-01T00:00:00.000000+00:00")
+    store.merge([newer], [])
+    assert store.get_log(log_uuid) == ("Apple", 300, 52)
+    assert store.dirty_logs(1) == []
+    assert store.daily_totals(1, [today]) == [156]
+
+    store.merge([], [(log_uuid, "2999-12-31T00:00:00.000000+00:00")])
+    assert store.get_log(log_uuid) is None
+
+
+def test_sync_pushes_local_entries_and_pulls_changes():
+    """Test that a new local entry is inserted on the server with its rollup"""
+    from datetime import datetime, timezone
+
+    store = LocalStore(":memory:")
+    log_uuid = store.add_log(1, "Apple", 100, 52, 52, "Snack", "2025-04-30")
+
+    mock_conn = MockConnection()
+    mock_cursor = mock_conn.cursor_mock
+    pulled_at = datetime(2025, 4, 30, 12, 0, tzinfo=timezone.utc)
+    # No server row, no deletion record, then the server time for the pull
+    mock_cursor.fetchone.side_effect = [None, None, (pulled_at,)]
+    mock_cursor.fetchall.side_effect = [[], []]
+
+    sync.sync(mock_conn, store, 1)
+
+    assert mock_conn.committed
+    statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+    insert = next(call[0][1] for call in mock_cursor.execute.call_args_list if "INSERT INTO calorie_logs" in call[0][0])
+    assert insert[0] == log_uuid
+    assert any("INSERT INTO daily_totals" in statement for statement in statements)
+    assert store.dirty_logs(1) == []
+    assert store.pulled_at(1) == "2025-04-30T12:00:00.000000+00:00"
+
+
+def test_sync_pulls_rows_committed_behind_the_watermark():
+    """Test that a write whose transaction started before a pull but
+    committed after it is still pulled by the next sync"""
+    from datetime import datetime, timedelta, timezone
+
+    first_pull = datetime(2025, 4, 30, 12, 0, tzinfo=timezone.utc)
+    # changed_at is the writer's transaction start, before the first pull
+    late_row = ("7f1c0c4e-0000-0000-0000-000000000001", 1, "Pear", 100, 57, 57,
+                "Snack", date(2025, 4, 30), first_pull - timedelta(seconds=5))
+    server_rows = []
+    server_times = iter([first_pull, first_pull + timedelta(seconds=30)])
+
+    class ServerCursor:
+        def execute(self, statement, params=None):
+            self.result = []
+            if statement == "SELECT now()":
+                self.result = [(next(server_times),)]
+            elif "FROM calorie_logs" in statement:
+                since = params[1]
+                self.result = [row for row in server_rows
+                               if since == "-infinity" or row[8] > since]
+
+        def fetchone(self):
+            return self.result[0]
+
+        def fetchall(self):
+            return self.result
+
+    mock_conn = MockConnection()
+    mock_conn.cursor = lambda: ServerCursor()
+    store = LocalStore(":memory:")
+
+    sync.sync(mock_conn, store, 1)
+    server_rows.append(late_row)  # Commits after the first pull
+    sync.sync(mock_conn, store, 1)
+
+    assert store.get_log(late_row[0]) == ("Pear", 100, 57)
+
+
+@patch('main.Syncer')
+@patch('main.initialize_database')
+@patch('main.get_connection')
+def test_offline_login_and_logging(mock_get_connection, mock_init_db, mock_syncer):
+    """Test that with a local store users can log in and log food offline"""
+    mock_get_connection.side_effect = psycopg2.OperationalError("server unreachable")
+    store = LocalStore(":memory:")
+    store.cache_user("testuser", 1, passwords.hash_password("password123", rounds=4), 2000)
+    app = CaloriesCalculator(MagicMock(), worker=SyncWorker(), local_store=store)
+
+    app.username_entry = MagicMock()
+    app.username_entry.get.return_value = "testuser"
+    app.password_entry = MagicMock()
+    app.password_entry.get.return_value = "password123"
+
+    with patch('main.messagebox.showinfo'), patch.object(app, 'main_menu'), \
+            patch('main.messagebox.showerror') as mock_error:
+        app.login_user()
+
+    # The catalog cannot load offline, which is not worth a dialog
+    mock_error.assert_not_called()
+    assert app.food_catalog is None
+    assert app.user_id == 1
+    assert app.daily_goal == 2000
+    mock_syncer.assert_called_once_with(store, 1)
+
+    app.log_ids = []
+    app.log_listbox = MagicMock()
+    app.food_entry = MagicMock()
+    app.food_entry.get.return_value = "Banana"
+    app.quantity_entry = MagicMock()
+    app.quantity_entry.get.return_value = "150"
+    app.calories_entry = MagicMock()
+    app.calories_entry.get.return_value = "89"
+    app.meal_type_var = MagicMock()
+    app.meal_type_var.get.return_value = "Snack"
+
+    app.add_item()
+
+    assert store.get_log(app.log_ids[0]) == ("Banana", 150, 89)
+    loaded = []
+    app.load_daily_totals([date.today().strftime("%Y-%m-%d")], loaded.append)
+    assert loaded == [[134]]
+    app.syncer.wake.assert_called_once()
+
+
+def test_analytics_series_and_rolling_mean():
+    """Test that missing days are filled and averages skip them"""
+    series = analytics.make_series(
+        [(date(2025, 4, 28), 1800), (date(2025, 4, 30), 2100), (date(2025, 5, 1), 2000)],
+        end=date(2025, 5, 4)
+    )
+
+    assert len(series) == 7
+    assert series.totals.tolist() == [1800, 0, 2100, 2000, 0, 0, 0]
+
+    means = analytics.rolling_mean(series, 3)
+    assert means[:6].tolist() == [1800, 1800, 1950, 2050, 2050, 2000]
+    assert analytics.np.isnan(means[6])
+
+
+def test_analytics_buckets_and_streaks():
+    """Test weekly and monthly buckets and logging streaks"""
+    series = analytics.make_series(
+        [(date(2025, 4, 28), 1800), (date(2025, 4, 29), 2200), (date(2025, 5, 5), 2600)]
+    )
+
+    starts, totals, means = analytics.buckets(series, "W")
+    assert [str(day) for day in starts] == ["2025-04-28", "2025-05-05"]
+    assert totals.tolist() == [4000, 2600]
+    assert means.tolist() == [2000, 2600]
+
+    starts, totals, _ = analytics.buckets(series, "M")
+    assert [str(day) for day in starts] == ["2025-04-01", "2025-05-01"]
+    assert totals.tolist() == [4000, 2600]
+
+    assert analytics.streaks(series.logged) == (2, 1)
+
+
+def test_analytics_goal_adherence():
+    """Test deficit and surplus against the daily goal"""
+    series = analytics.make_series(
+        [(date(2025, 4, 28), 1500), (date(2025, 4, 29), 2050), (date(2025, 4, 30), 2600)]
+    )
+
+    summary = analytics.summarize(series, goal=2000)
+
+    assert summary["logged_days"] == 3
+    assert summary["percentiles"][50] == 2050
+    adherence = summary["goal"]
+    assert adherence["on_target"] == 1
+    assert adherence["deficit_days"] == 1
+    assert adherence["surplus_days"] == 1
+    assert adherence["total_deficit"] == 500
+    assert adherence["total_surplus"] == 650
+
+
+@patch('helpers.charts.TrendChart')
+@patch('helpers.service.get_connection')
+def test_show_trend_graph_plots_rolling_means(mock_get_connection, mock_chart, app):
+    """Test that the trend graph shows daily totals, averages and the goal"""
+    mock_conn = MockConnection()
+    mock_conn.cursor_mock.fetchall.return_value = [(date(2025, 4, 28), 1800), (date(2025, 4, 30), 2100)]
+    mock_get_connection.return_value = mock_conn
+
+    app.user_id = 1
+    app.daily_goal = 2000
+    app.show_trend_graph()
+
+    series, goal = mock_chart.return_value.update.call_args.args
+    assert series.logged.sum() == 2
+    assert goal == 2000
+    mock_chart.return_value.show.assert_called_once()
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    """Test that downsampling keeps the first, last and extreme points"""
+    x = np.arange(10000, dtype=float)
+    y = np.sin(x / 500)
+    y[4321] = 50
+
+    sampled_x, sampled_y = charts.lttb(x, y, 200)
+
+    assert len(sampled_x) == 200
+    assert sampled_x[0] == 0 and sampled_x[-1] == 9999
+    assert np.all(np.diff(sampled_x) > 0)
+    assert 50 in sampled_y
+
+
+def test_downsample_drops_gaps_and_short_series():
+    """Test that gaps are dropped and short series are left as they are"""
+    x = np.arange(5, dtype=float)
+    y = np.array([1, np.nan, 3, np.nan, 5])
+
+    sampled_x, sampled_y = charts.downsample(x, y, 700)
+
+    assert sampled_x.tolist() == [0, 2, 4]
+    assert sampled_y.tolist() == [1, 3, 5]
+
+
+def test_top_n_groups_remaining_foods():
+    """Test that foods past the top n are grouped into one bar"""
+    labels, values = charts.top_n(["a", "b", "c", "d"], [5, 1, 9, 3], 2)
+
+    assert labels == ["c", "a", "Other (2 foods)"]
+    assert values == [9, 5, 4]
+
+
+def test_food_chart_updates_bars_in_place():
+    """Test that the food chart reuses its bars for new data"""
+    chart = charts.FoodChart(None, size=2)
+    bars = list(chart.bars)
+
+    chart.update([("Apple", 150), ("Banana", 105), ("Chicken", 330)])
+
+    assert list(chart.bars) == bars
+    assert [bar.get_width() for bar in chart.bars] == [330, 150, 105]
+    assert [label.get_text() for label in chart.ax.get_yticklabels()] == ["Chicken", "Apple", "Other (1 food)"]
+
+
+def test_local_service_operations(tmp_path):
+    """Test the headless service against a local store"""
+    store = LocalStore(":memory:")
+    store.cache_user("testuser", 1, "hash", 2000)
+    service = LocalService(store)
+    today = date.today().isoformat()
+
+    apple_id, apple_total = service.add_log(1, "Apple", 200, 52, "Snack", today)
+    rice_id, _ = service.add_log(1, "Rice", 100, 130, "Lunch", today)
+    assert apple_total == 104
+    assert service.edit_log(rice_id, "Rice", 300, 130, "Dinner") == (today, 390)
+
+    logs, _ = service.list_logs(1)
+    assert [log[0] for log in logs] == [rice_id, apple_id]
+    assert service.daily_totals(1, [today]) == [494]
+    assert sorted(service.food_totals(1)) == [("Apple", 104), ("Rice", 390)]
+    assert service.daily_series(1).totals.tolist() == [494]
+
+    assert service.remove_log(apple_id) == today
+    assert service.export_logs(1, str(tmp_path / "logs.csv")) == 1
+
+    service.set_goal(1, 1800)
+    assert store.cached_user("testuser")[2] == 1800
+
+
+def test_normalize_groups_statements_by_shape():
+    """Test that literals and multi-row VALUES lists are normalized away"""
+    assert instrumentation.normalize(
+        b"INSERT INTO t (a, b)\n VALUES (1, 'x'), (2, 'it''s') RETURNING id"
+    ) == "INSERT INTO t (a, b) VALUES (?, ?), ... RETURNING id"
+    assert instrumentation.normalize("SELECT * FROM logs WHERE id=%s LIMIT 50") == \
+        "SELECT * FROM logs WHERE id=%s LIMIT ?"
+    assert instrumentation.redact(("secret", 42)) == ["str", "int"]
+
+
+def test_local_store_statements_are_recorded(tmp_path, caplog, monkeypatch):
+    """Test that statements are counted by call site and slow ones are
+    logged and exported without their parameter values"""
+    instrumentation.STATS.reset()
+    monkeypatch.setattr(instrumentation, "SLOW_QUERY_MS", 0)
+    store = LocalStore(":memory:")
+
+    with caplog.at_level("WARNING", logger="helpers.instrumentation"):
+        for _ in range(3):
+            store.add_log(1, "Apple", 100, 52, 52, "Snack", "2025-04-30")
+
+    inserts = [
+        entry for entry in instrumentation.STATS.summary()
+        if entry["statement"].startswith("INSERT INTO logs")
+    ]
+    assert len(inserts) == 1
+    assert inserts[0]["calls"] == 3
+    assert inserts[0]["rows"] == 3
+    assert "add_log" in inserts[0]["call_site"]
+    assert "Apple" not in caplog.text
+
+    path = tmp_path / "query_stats.json"
+    instrumentation.STATS.export_json(path)
+    with open(path) as f:
+        exported = json.load(f)
+    assert exported["slow_queries"][0]["params"][2] == "str"
+    assert "Apple" not in path.read_text()
+    instrumentation.STATS.reset()
+
+
+@patch('helpers.helpers.pool.ThreadedConnectionPool')
+def test_pool_uses_instrumented_cursors(mock_pool):
+    """Test that server connections hand out instrumented cursors"""
+    helpers._create_pool()
+
+    assert mock_pool.call_args.kwargs["cursor_factory"] is instrumentation.InstrumentedCursor
+
+
+@patch('helpers.rollup.execute_values')
+def test_add_entries_groups_rollup_rows(mock_execute_values):
+    """Test that a batch of entries updates each rollup row once"""
+    cursor = Mock()
+    rollup.add_entries(cursor, [
+        (1, "2025-04-30", "Rice", "Lunch", 130),
+        (1, "2025-04-30", "Rice", "Lunch", 260),
+        (1, "2025-04-30", "Egg", "Lunch", 78),
+    ])
+
+    mock_execute_values.assert_called_once()
+    assert mock_execute_values.call_args.args[2] == [
+        (1, "2025-04-30", "Rice", "Lunch", 390, 2),
+        (1, "2025-04-30", "Egg", "Lunch", 78, 1),
+    ]
+
+
+@patch('helpers.rollup.execute_values')
+@patch('helpers.service.execute_values')
+@patch('helpers.service.get_connection')
+def test_add_logs_inserts_meal_in_one_batch(mock_get_connection, mock_execute_values, mock_rollup_values):
+    """Test that a meal is inserted with one statement in one transaction"""
+    mock_conn = MockConnection()
+    mock_get_connection.return_value = mock_conn
+    # Rows come back in the opposite order of the values
+    mock_execute_values.side_effect = lambda cursor, sql, rows, fetch: [
+        (rows[1][0], 12), (rows[0][0], 11)
+    ]
+
+    logged = service.PostgresService().add_logs(
+        1, [("Apple", 200, 52), ("Rice", 300, 130)], "Lunch", "2025-04-30"
+    )
+
+    assert logged == [(11, 104), (12, 390)]
+    mock_execute_values.assert_called_once()
+    rows = mock_execute_values.call_args.args[2]
+    assert [row[1:] for row in rows] == [
+        (1, "Apple", 200, 52, 104, "Lunch", "2025-04-30"),
+        (1, "Rice", 300, 130, 390, "Lunch", "2025-04-30"),
+    ]
+    assert rows[0][0] != rows[1][0]
+    mock_rollup_values.assert_called_once()
+    assert mock_conn.committed
+
+
+def test_food_catalog_lookup():
+    """Test exact, case-insensitive lookups in the food catalog"""
+    catalog = FoodCatalog([(1, "Apple", 52.0), (2, "Apple pie", 237.0)])
+
+    assert catalog.lookup(" apple ") == (1, 52.0)
+    assert catalog.lookup("Appl") is None
+
+
+def test_log_meal_logs_staged_items(app):
+    """Test that staged items are logged together and shown on top"""
+    store = LocalStore(":memory:")
+    app.service = service.LocalService(store)
+    app.user_id = 1
+    app.log_ids = []
+    app.log_listbox = MagicMock()
+    app.meal_listbox = MagicMock()
+    app.meal_type_var = MagicMock()
+    app.meal_type_var.get.return_value = "Lunch"
+    app.food_entry = MagicMock()
+    app.quantity_entry = MagicMock()
+    app.calories_entry = MagicMock()
+
+    for food_name, quantity, calories in [("Apple", "200", "52"), ("Rice", "300", "130")]:
+        app.food_entry.get.return_value = food_name
+        app.quantity_entry.get.return_value = quantity
+        app.calories_entry.get.return_value = calories
+        app.add_to_meal()
+
+    app.log_meal()
+
+    assert app.meal_items == []
+    assert len(app.log_ids) == 2
+    app.log_listbox.insert.assert_called_with(0, "Rice - 300g - 390 kcal - Lunch")
+    assert store.daily_totals(1, [date.today().isoformat()]) == [494]
+
+
+@patch('helpers.service.get_connection')
+def test_recipes_screen_offline(mock_get_connection):
+    """Test that offline the recipes screen says so and keeps its buttons disabled"""
+    mock_get_connection.side_effect = psycopg2.OperationalError("server unreachable")
+    with patch('main.initialize_database'):
+        app = CaloriesCalculator(MagicMock(), worker=SyncWorker(), local_store=LocalStore(":memory:"))
+    app.user_id = 1
+
+    with patch('main.tk.Listbox') as mock_listbox, patch('main.tk.Button') as mock_button, \
+            patch('main.tk.StringVar'), patch('main.tk.OptionMenu'), \
+            patch('main.messagebox.showerror') as mock_showerror:
+        app.show_recipes()
+
+    mock_showerror.assert_not_called()
+    mock_listbox.return_value.insert.assert_called_once_with(tk.END, "Recipes are not available offline.")
+    log_call, delete_call = mock_button.call_args_list[:2]
+    assert log_call.kwargs["state"] == delete_call.kwargs["state"] == "disabled"
+    mock_button.return_value.config.assert_not_called()
+
+
+def test_save_meal_as_recipe(app):
+    """Test that a meal of catalog foods is saved as a recipe by food id"""
+    app.user_id = 1
+    app.food_catalog = FoodCatalog([(7, "Apple", 52.0), (9, "Rice", 130.0)])
+    app.meal_items = [("Apple", 200, 52), ("Rice", 300, 130)]
+
+    with patch('main.simpledialog.askstring', return_value=" Lunch bowl "), \
+            patch('main.messagebox.showinfo'), \
+            patch.object(app.server, 'save_recipe') as mock_save:
+        app.save_meal_as_recipe()
+
+    mock_save.assert_called_once_with(1, "Lunch bowl", [(7, 200), (9, 300)])
+
+    app.meal_items.append(("Homemade soup", 250, 40))
+    with patch('main.messagebox.showerror') as mock_showerror, \
+            patch.object(app.server, 'save_recipe') as mock_save:
+        app.save_meal_as_recipe()
+
+    mock_save.assert_not_called()
+    assert "Homemade soup" in mock_showerror.call_args.args[1]
+
+
+def test_log_recipe(app):
+    """Test that logging a recipe adds all of its items at once"""
+    store = LocalStore(":memory:")
+    app.service = service.LocalService(store)
+    app.user_id = 1
+
+    with patch.object(app.server, 'recipe_items', return_value=[("Apple", 200, 52), ("Oats", 50, 389)]), \
+            patch('main.messagebox.showinfo') as mock_showinfo:
+        app.log_recipe(3, "Breakfast")
+
+    mock_showinfo.assert_called_once_with("Recipes", "Logged 2 items (298 kcal).")
+    logs, _ = store.list_logs(1, None, 10)
+    assert sorted(log[1] for log in logs) == ["Apple", "Oats"]
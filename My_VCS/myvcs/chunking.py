@@ -0,0 +1,117 @@
+import random
+
+# Gear table for the rolling hash. Seeded so that every repository (and every
+# run) cuts the same content at the same places.
+_rng = random.Random(0x6D79766373)
+_GEAR = tuple(_rng.getrandbits(32) for _ in range(256))
+del _rng
+_HASH_MASK = 0xFFFFFFFF
+
+DEFAULT_MIN_SIZE = 2 * 1024
+DEFAULT_AVG_SIZE = 8 * 1024
+DEFAULT_MAX_SIZE = 64 * 1024
+
+# Data at least this long has its hashes computed with NumPy, when it is
+# installed; below it the set-up costs more than the plain loop
+VECTORIZE_THRESHOLD = 64 * 1024
+# How much of a file read_chunks holds in memory, besides one chunk
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def _boundary_mask(avg_size):
+    """Builds a mask over the high bits of the hash so that a boundary
+    is hit roughly once every avg_size bytes"""
+    bits = max(avg_size.bit_length() - 1, 1)
+    return ((1 << bits) - 1) << (32 - bits)
+
+
+def _boundary_offsets(data, mask):
+    """Returns the sorted offsets i at which the hash of the 32 bytes ending
+    at i hits a boundary, computed with NumPy, or None when NumPy is not
+    installed or data is short. The gear hash shifts one bit per byte, so
+    after 32 bytes it only depends on those 32."""
+    if len(data) < VECTORIZE_THRESHOLD:
+        return None
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+
+    hashes = np.array(_GEAR, dtype=np.uint32)[np.frombuffer(data, dtype=np.uint8)]
+    # Doubles the window each pass: h_2w[i] = h_w[i] + (h_w[i - w] << w),
+    # with uint32 wrapping around like _HASH_MASK
+    width = 1
+    while width < 32:
+        hashes[width:] += hashes[:-width] << np.uint32(width)
+        width *= 2
+    return np.flatnonzero((hashes & np.uint32(mask)) == 0)
+
+
+def _find_cut(data, begin, end, mask, offsets):
+    """Returns the end of the chunk whose hash starts at begin: just past
+    the first boundary before end, or end itself"""
+    # The hash restarts at begin, so for its first 31 bytes it differs from
+    # the precomputed one and is worked out here; with nothing precomputed
+    # every byte is
+    stop = end if offsets is None else min(begin + 31, end)
+    gear = _GEAR
+    h = 0
+    for i in range(begin, stop):
+        h = ((h << 1) + gear[data[i]]) & _HASH_MASK
+        if not h & mask:
+            return i + 1
+
+    if offsets is not None and stop < end:
+        index = offsets.searchsorted(stop)
+        if index < len(offsets) and offsets[index] < end:
+            return int(offsets[index]) + 1
+    return end
+
+
+def chunk_boundaries(data, min_size=DEFAULT_MIN_SIZE, avg_size=DEFAULT_AVG_SIZE, max_size=DEFAULT_MAX_SIZE):
+    """Yields the end offset of each content-defined chunk in data"""
+    if not 0 < min_size <= avg_size <= max_size:
+        raise ValueError("Chunk sizes must satisfy 0 < min <= avg <= max")
+
+    mask = _boundary_mask(avg_size)
+    offsets = _boundary_offsets(data, mask)
+    length = len(data)
+    start = 0
+
+    while start < length:
+        # Bytes below the minimum chunk size never form a boundary, so they
+        # are skipped instead of being fed through the hash.
+        cut = _find_cut(data, start + min_size, min(start + max_size, length), mask, offsets)
+        yield cut
+        start = cut
+
+
+def split_chunks(data, min_size=DEFAULT_MIN_SIZE, avg_size=DEFAULT_AVG_SIZE, max_size=DEFAULT_MAX_SIZE):
+    """Splits data into content-defined chunks"""
+    chunks = []
+    start = 0
+    for end in chunk_boundaries(data, min_size, avg_size, max_size):
+        chunks.append(data[start:end])
+        start = end
+    return chunks
+
+
+def read_chunks(f, min_size=DEFAULT_MIN_SIZE, avg_size=DEFAULT_AVG_SIZE, max_size=DEFAULT_MAX_SIZE,
+                block_size=READ_BLOCK_SIZE):
+    """Yields the content-defined chunks of a binary file, the same ones
+    split_chunks gives for its whole content, reading it a block at a time"""
+    buffer = b""
+    while True:
+        block = f.read(block_size)
+        buffer += block
+        start = 0
+        for end in chunk_boundaries(buffer, min_size, avg_size, max_size):
+            # A chunk cut short by the end of the buffer may grow with the
+            # next block
+            if block and end == len(buffer) and end - start < max_size:
+                break
+            yield buffer[start:end]
+            start = end
+        buffer = buffer[start:]
+        if not block:
+            return
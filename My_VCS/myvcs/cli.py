@@ -1,6 +1,17 @@
+import sys
 import argparse
 from myvcs import commands
 
+def positive_int(value):
+    """argparse type for counts that must be at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 def main():
     parser = argparse.ArgumentParser(
         prog="myvcs",
@@ -18,13 +29,57 @@ def main():
     commit_parser = subparsers.add_parser("commit")
     commit_parser.add_argument("-m", required=True, help="Commit message")
 
-    subparsers.add_parser("log")
+    log_parser = subparsers.add_parser("log")
+    log_parser.add_argument("--stat", action="store_true", help="Show a summary of changed files")
+
+    show_parser = subparsers.add_parser("show")
+    show_parser.add_argument("commit", nargs="?", help="Branch, remote/<branch>, commit hash or prefix (defaults to HEAD)")
+    show_parser.add_argument("--stat", action="store_true", help="Show a summary instead of the full diff")
 
     diff_parser = subparsers.add_parser("diff")
     diff_parser.add_argument("file")
 
     branch_parser = subparsers.add_parser("branch")
-    branch_parser.add_argument("name")
+    branch_parser.add_argument("name", nargs="?")
+    branch_parser.add_argument("--list", action="store_true", help="List branches")
+    branch_parser.add_argument("-d", "--delete", metavar="NAME", help="Delete a branch")
+
+    switch_parser = subparsers.add_parser("switch")
+    switch_parser.add_argument("name")
+
+    subparsers.add_parser("pack-refs")
+
+    clone_parser = subparsers.add_parser("clone")
+    clone_parser.add_argument("source")
+    clone_parser.add_argument("destination")
+    clone_parser.add_argument("--sparse", action="append", metavar="PATTERN", help="Only check out matching paths")
+
+    subparsers.add_parser("status")
+
+    sparse_parser = subparsers.add_parser("sparse-checkout")
+    sparse_parser.add_argument("action", choices=["set", "add", "list", "disable"])
+    sparse_parser.add_argument("patterns", nargs="*")
+
+    fetch_parser = subparsers.add_parser("fetch")
+    fetch_parser.add_argument("source", nargs="?")
+
+    push_parser = subparsers.add_parser("push")
+    push_parser.add_argument("destination", nargs="?")
+
+    export_parser = subparsers.add_parser("fast-export")
+    export_parser.add_argument("file", nargs="?", help="Output file (defaults to stdout)")
+
+    import_parser = subparsers.add_parser("fast-import")
+    import_parser.add_argument("file", nargs="?", help="Input file (defaults to stdin)")
+
+    grep_parser = subparsers.add_parser("grep")
+    grep_parser.add_argument("pattern")
+    grep_parser.add_argument("--all-history", action="store_true", help="Search every commit, not just HEAD")
+    grep_parser.add_argument("-j", "--jobs", type=positive_int, help="Number of worker processes")
+
+    config_parser = subparsers.add_parser("config")
+    config_parser.add_argument("key")
+    config_parser.add_argument("value", nargs="?")
 
     args = parser.parse_args()
 
@@ -42,13 +97,62 @@ def main():
             commands.commit(args.m)
 
         case "log":
-            commands.log()
+            commands.log(args.stat)
+
+        case "show":
+            commands.show(args.commit, args.stat)
 
         case "diff":
             commands.diff(args.file)
 
         case "branch":
-            commands.branch(args.name)
+            if args.delete:
+                commands.delete_branch(args.delete)
+            elif args.list or args.name is None:
+                commands.list_branches()
+            else:
+                commands.branch(args.name)
+
+        case "switch":
+            commands.switch(args.name)
+
+        case "pack-refs":
+            commands.pack_refs()
+
+        case "clone":
+            commands.clone(args.source, args.destination, args.sparse)
+
+        case "status":
+            commands.status()
+
+        case "sparse-checkout":
+            commands.sparse_checkout(args.action, args.patterns)
+
+        case "fetch":
+            commands.fetch(args.source)
+
+        case "push":
+            commands.push(args.destination)
+
+        case "fast-export":
+            if args.file:
+                with open(args.file, "wb") as f:
+                    commands.fast_export(f)
+            else:
+                commands.fast_export(sys.stdout.buffer)
+
+        case "fast-import":
+            if args.file:
+                with open(args.file, "rb") as f:
+                    commands.fast_import(f)
+            else:
+                commands.fast_import(sys.stdin.buffer)
+
+        case "grep":
+            commands.grep(args.pattern, args.all_history, args.jobs)
+
+        case "config":
+            commands.config(args.key, args.value)
 
         case _:
             parser.print_help()
\ No newline at end of file
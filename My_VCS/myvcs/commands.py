@@ -3,21 +3,146 @@ import json
 import time
 import hashlib
 import difflib
+import queue
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from myvcs import objects
+from myvcs import chunking
+from myvcs import transfer
+from myvcs import fastimport
+from myvcs import search
+from myvcs import refs
+from myvcs import sparse
+from myvcs import stats
+from myvcs.utils import BatchWriter, DURABILITY_MODES, atomic_write
 
 VCS_DIR = ".myvcs"
 COMMITS_DIR = os.path.join(VCS_DIR, "commits")
+OBJECTS_DIR = os.path.join(VCS_DIR, "objects")
 INDEX_FILE = os.path.join(VCS_DIR, "index")
 HEAD_FILE = os.path.join(VCS_DIR, "HEAD")
+BRANCH_FILE = os.path.join(VCS_DIR, "BRANCH")
+FETCH_HEAD_FILE = os.path.join(VCS_DIR, "FETCH_HEAD")
+CONFIG_FILE = os.path.join(VCS_DIR, "config")
+
+DEFAULT_CONFIG = {
+    "chunking": False,
+    "chunk_threshold": 1024 * 1024,
+    "chunk_min_size": chunking.DEFAULT_MIN_SIZE,
+    "chunk_avg_size": chunking.DEFAULT_AVG_SIZE,
+    "chunk_max_size": chunking.DEFAULT_MAX_SIZE,
+    "remote": None,
+    "durability": "full",
+    "fsync_batch_size": 1000,
+}
+
+
+def load_config():
+    config = dict(DEFAULT_CONFIG)
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE) as f:
+            config.update(json.load(f))
+    return config
+
+
+def config(key, value=None):
+    if not os.path.exists(VCS_DIR):
+        print("Repository not initialised.")
+        return
+
+    settings = {}
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE) as f:
+            settings = json.load(f)
+
+    if value is None:
+        print(f"{key} = {json.dumps(settings.get(key, DEFAULT_CONFIG.get(key)))}")
+        return
+
+    # Values are parsed as JSON so that "true" and "4096" keep their types
+    try:
+        settings[key] = json.loads(value)
+    except json.JSONDecodeError:
+        settings[key] = value
+
+    if key == "durability" and settings[key] not in DURABILITY_MODES:
+        print(f"durability must be one of: {', '.join(DURABILITY_MODES)}")
+        return
+
+    with open(CONFIG_FILE, "w") as f:
+        json.dump(settings, f, indent=2)
+
+    print(f"Set {key} = {json.dumps(settings[key])}")
+
+
+def store_content(data, settings, writer):
+    """Returns the commit entry for file content given as bytes: the text
+    inline, or a list of chunk objects for large files when chunking is
+    enabled"""
+    if settings["chunking"] and len(data) >= settings["chunk_threshold"]:
+        chunks = chunking.split_chunks(
+            data,
+            settings["chunk_min_size"],
+            settings["chunk_avg_size"],
+            settings["chunk_max_size"]
+        )
+        return {
+            "chunks": [objects.write_object(OBJECTS_DIR, chunk, writer) for chunk in chunks],
+            "size": len(data)
+        }
+
+    return data.decode("utf-8")
+
+
+def store_file(file_path, settings, writer):
+    """Returns the commit entry for a file in the working tree"""
+    if settings["chunking"] and os.path.getsize(file_path) >= settings["chunk_threshold"]:
+        # Streamed, so only about one read block is in memory at a time
+        chunk_hashes = []
+        size = 0
+        with open(file_path, "rb") as f:
+            for chunk in chunking.read_chunks(
+                f,
+                settings["chunk_min_size"],
+                settings["chunk_avg_size"],
+                settings["chunk_max_size"]
+            ):
+                chunk_hashes.append(objects.write_object(OBJECTS_DIR, chunk, writer))
+                size += len(chunk)
+        return {"chunks": chunk_hashes, "size": size}
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def load_file(entry, objects_dir=OBJECTS_DIR):
+    """Returns the text content of a commit entry written by store_file"""
+    return objects.read_entry(objects_dir, entry)
+
+
+def write_commit(commit_data, writer):
+    """Stores a commit under the hash of its data and returns the hash"""
+    commit_hash = hashlib.sha1(json.dumps(commit_data, sort_keys=True).encode()).hexdigest()
+    writer.write(
+        os.path.join(COMMITS_DIR, commit_hash),
+        json.dumps(commit_data, indent=2).encode("utf-8")
+    )
+    return commit_hash
 
 
 def init():
     os.makedirs(COMMITS_DIR,  exist_ok=True)
+    os.makedirs(OBJECTS_DIR, exist_ok=True)
     with open(INDEX_FILE, "w") as f:
         json.dump([], f)
 
     with open(HEAD_FILE, "w") as f:
         f.write("")
 
+    with open(BRANCH_FILE, "w") as f:
+        f.write("main")
+
     print("Initialized empty VCS repository in .myvcs/")
 
 
@@ -26,6 +151,10 @@ def add(file_path):
         print(f"{file_path} does not exist")
         return
 
+    if not sparse.load_matcher(VCS_DIR)(file_path):
+        print(f"{file_path} is outside the sparse checkout")
+        return
+
     with open(INDEX_FILE, "r+") as f:
         try:
             staged = json.load(f)
@@ -91,39 +220,49 @@ def commit(message):
             if parent:
                 commit_data["parent"] = parent
 
-    # Save file contents
-    for file in staged:
-        if not os.path.exists(file):
-            print(f"Warning: {file} not found. Skipping.")
-            continue
+    # Save file contents. Objects and the commit only become visible, synced,
+    # when the batch is flushed, and HEAD is moved only after that, so a
+    # crash can never leave HEAD pointing at a partial commit.
+    settings = load_config()
+    with BatchWriter(settings["durability"]) as writer:
+        for file in staged:
+            if not os.path.exists(file):
+                print(f"Warning: {file} not found. Skipping.")
+                continue
 
-        with open(file, "r", encoding="utf-8") as f:
-            content= f.read()
+            commit_data["files"][file] = store_file(file, settings, writer)
 
-        commit_data["files"][file] = content
-
-    # Hash the commit
-    commit_hash = hashlib.sha1(json.dumps(commit_data, sort_keys=True).encode()).hexdigest()
-    commit_path = os.path.join(COMMITS_DIR, commit_hash)
+        commit_hash = write_commit(commit_data, writer)
 
-    with open(commit_path, "w", encoding="utf-8") as f:
-        json.dump(commit_data, f, indent=2)
+    atomic_write(HEAD_FILE, commit_hash, durable=settings["durability"] != "none")
 
-    with open(HEAD_FILE, "w") as f:
-        f.write(commit_hash)
+    current = current_branch()
+    if current:
+        try:
+            refs.update(VCS_DIR, current, commit_hash)
+        except refs.RefError as error:
+            print(f"Warning: {error}")
 
-    with open(INDEX_FILE, "w") as f:
-        json.dump([], f)
+    atomic_write(INDEX_FILE, json.dumps([]), durable=False)
 
     print(f"Committed as {commit_hash}")
 
 
-def log():
+def _print_commit(commit_hash, data):
+    print(f"Commit: {commit_hash}")
+    print(f"Date:   {time.ctime(data['timestamp'])}")
+    print(f"Message: {data['message']}\n")
+
+
+def log(stat=False):
     if not os.path.exists(HEAD_FILE):
         print("No commits yet.")
         return
 
     head = open(HEAD_FILE).read().strip()
+    if not head:
+        print("No commits yet.")
+        return
 
     while head:
         commit_path = os.path.join(COMMITS_DIR, head)
@@ -133,18 +272,76 @@ def log():
         with open(commit_path, "r") as f:
             data = json.load(f)
 
-        print(f"Commit: {head}")
-        print(f"Date:   {time.ctime(data['timestamp'])}")
-        print(f"Message: {data['message']}\n")
+        _print_commit(head, data)
+        if stat:
+            print(stats.format_stat(stats.commit_stat(VCS_DIR, head)) + "\n")
 
         head = data.get("parent")
 
 
+def _resolve_commit(name):
+    """Resolves a branch name, remote/<branch>, full hash or unique hash
+    prefix"""
+    if name is None:
+        return transfer.read_head(VCS_DIR) or None
+
+    branch_head = refs.resolve(VCS_DIR, name)
+    if branch_head:
+        return branch_head
+
+    # Remote-tracking branches are named remote/<branch>
+    if name.startswith("remote/"):
+        remote_head = refs.read_remote(VCS_DIR).get(name[len("remote/"):])
+        if remote_head:
+            return remote_head
+
+    candidates = [h for h in os.listdir(COMMITS_DIR) if h.startswith(name)]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def show(name=None, stat=False):
+    if not os.path.exists(HEAD_FILE):
+        print("Repository not initialised.")
+        return
+
+    commit_hash = _resolve_commit(name)
+    if commit_hash is None:
+        print(f"Unknown commit: {name or 'HEAD'}")
+        return
+
+    data = transfer.read_commit(VCS_DIR, commit_hash)
+    _print_commit(commit_hash, data)
+
+    if stat:
+        print(stats.format_stat(stats.commit_stat(VCS_DIR, commit_hash)))
+        return
+
+    parent_files = transfer.read_commit(VCS_DIR, data["parent"])["files"] if data.get("parent") else {}
+    for path in sorted(data["files"]):
+        old_entry = parent_files.get(path)
+        if old_entry == data["files"][path]:
+            continue
+
+        old_content = load_file(old_entry) if old_entry is not None else ""
+        diff_lines = difflib.unified_diff(
+            old_content.splitlines(),
+            load_file(data["files"][path]).splitlines(),
+            fromfile=f"a/{path}",
+            tofile=f"b/{path}",
+            lineterm=""
+        )
+        print("\n".join(diff_lines))
+
+
 def diff(file_path):
     if not os.path.exists(file_path):
         print(f"{file_path} does not exist.")
         return
 
+    if not sparse.load_matcher(VCS_DIR)(file_path):
+        print(f"{file_path} is outside the sparse checkout.")
+        return
+
     with open(HEAD_FILE) as f:
         head = f.read().strip()
 
@@ -160,11 +357,13 @@ def diff(file_path):
     with open(commit_path) as f:
         data = json.load(f)
 
-    committed_content = data["files"].get(file_path)
-    if committed_content is None:
+    entry = data["files"].get(file_path)
+    if entry is None:
         print(f"{file_path} not found in last commit.")
         return
 
+    committed_content = load_file(entry)
+
     with open(file_path, "r", encoding="utf-8") as f:
         working_content = f.read()
 
@@ -179,17 +378,571 @@ def diff(file_path):
     print("\n".join(diff_lines) or "No changes.")
 
 
-def branch(branch_name):
-    os.makedirs(os.path.join(VCS_DIR, "branches"), exist_ok=True)
-
-    if os.path.exists(os.path.join(VCS_DIR, "branches", branch_name)):
-        print(f"Branch '{branch_name}' already exists")
+def status():
+    if not os.path.exists(INDEX_FILE):
+        print("Repository not initialised.")
         return
 
+    current = current_branch()
+    print(f"On branch {current}" if current else "Not on any branch")
+
+    with open(INDEX_FILE) as f:
+        staged = json.load(f)
+
+    head = transfer.read_head(VCS_DIR)
+    committed = transfer.read_commit(VCS_DIR, head)["files"] if head else {}
+    matches = sparse.load_matcher(VCS_DIR)
+
+    # Paths outside the sparse checkout are skipped before their content,
+    # which may be spread over many chunk objects, is ever read.
+    changes = []
+    for file_path, entry in committed.items():
+        if not matches(file_path):
+            continue
+
+        if not os.path.exists(file_path):
+            changes.append(f"deleted:  {file_path}")
+            continue
+
+        with open(file_path, "r", encoding="utf-8") as f:
+            if f.read() != load_file(entry):
+                changes.append(f"modified: {file_path}")
+
+    if staged:
+        print("Staged files:")
+        for file_path in staged:
+            print(f"  {file_path}")
+
+    if changes:
+        print("Changes since last commit:")
+        for change in changes:
+            print(f"  {change}")
+
+    if not staged and not changes:
+        print("Nothing to commit, working tree clean.")
+
+
+def current_branch(vcs_dir=VCS_DIR):
+    branch_file = os.path.join(vcs_dir, "BRANCH")
+    if not os.path.exists(branch_file):
+        return None
+
+    with open(branch_file) as f:
+        return f.read().strip() or None
+
+
+def branch(branch_name):
     with open(HEAD_FILE) as f:
         current_commit = f.read().strip()
 
-    with open(os.path.join(VCS_DIR, "branches", branch_name), "w") as f:
-        f.write(current_commit)
+    if not current_commit:
+        print("Cannot create a branch before the first commit.")
+        return
+
+    try:
+        refs.update(VCS_DIR, branch_name, current_commit, create=True)
+    except refs.RefError as error:
+        print(error)
+        return
+
+    print(f"Created branch '{branch_name}'.")
+
+
+def list_branches():
+    current = current_branch()
+    lines = [
+        f"{'*' if name == current else ' '} {name}"
+        for name in refs.list_refs(VCS_DIR)
+    ]
+    print("\n".join(lines) or "No branches yet.")
+
+
+def delete_branch(branch_name):
+    if branch_name == current_branch():
+        print(f"Cannot delete the current branch '{branch_name}'.")
+        return
+
+    try:
+        refs.delete(VCS_DIR, branch_name)
+    except refs.RefError as error:
+        print(error)
+        return
+
+    print(f"Deleted branch '{branch_name}'.")
+
+
+def _differs(file_path, entry, objects_dir=OBJECTS_DIR):
+    """True if file_path exists in the working tree with content other than
+    entry's. entry may be None for a path the commit does not have."""
+    if not os.path.exists(file_path):
+        return False
+    if entry is None:
+        return True
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read() != load_file(entry, objects_dir)
+
+
+def _tree_conflicts(root, vcs_dir, old_files, new_files):
+    """Returns the paths whose local changes moving the working tree at root
+    from the old_files tree to new_files would lose. A file is safe to
+    replace or remove if it matches the old tree, or already matches the
+    new one."""
+    matches = sparse.load_matcher(vcs_dir)
+    objects_dir = os.path.join(vcs_dir, "objects")
+    return [
+        file_path for file_path in sorted(set(old_files) | set(new_files))
+        if matches(file_path)
+        and old_files.get(file_path) != new_files.get(file_path)
+        and _differs(os.path.join(root, file_path), old_files.get(file_path), objects_dir)
+        and _differs(os.path.join(root, file_path), new_files.get(file_path), objects_dir)
+    ]
+
+
+def _checkout_tree(root, vcs_dir, old_files, new_files):
+    """Moves the working tree at root from the old_files tree to new_files:
+    changed files are written and files only old_files has are removed.
+    Check _tree_conflicts first."""
+    matches = sparse.load_matcher(vcs_dir)
+    changed = {
+        file_path: entry for file_path, entry in new_files.items()
+        if old_files.get(file_path) != entry or not os.path.exists(os.path.join(root, file_path))
+    }
+    checkout_files({"files": changed}, root, os.path.join(vcs_dir, "objects"), matches)
+
+    for file_path in old_files:
+        target = os.path.join(root, file_path)
+        if file_path in new_files or not matches(file_path) or not os.path.exists(target):
+            continue
+        os.remove(target)
+        # Drop directories the removal left empty
+        directory = os.path.dirname(file_path)
+        while directory:
+            try:
+                os.rmdir(os.path.join(root, directory))
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+
+def switch(branch_name):
+    target = refs.resolve(VCS_DIR, branch_name)
+    if target is None:
+        print(f"Branch '{branch_name}' does not exist.")
+        return
+
+    with open(INDEX_FILE) as f:
+        if json.load(f):
+            print("Commit or unstage your changes before switching branches.")
+            return
+
+    head = transfer.read_head(VCS_DIR)
+    current_files = transfer.read_tree(VCS_DIR, head)
+    target_files = transfer.read_tree(VCS_DIR, target)
+
+    # Nothing is written unless every file the switch touches is safe
+    changed = _tree_conflicts(".", VCS_DIR, current_files, target_files)
+    if changed:
+        print("Your local changes would be overwritten by switching branches:")
+        for file_path in changed:
+            print(f"  {file_path}")
+        print("Commit or discard them before switching branches.")
+        return
+
+    _checkout_tree(".", VCS_DIR, current_files, target_files)
+    atomic_write(HEAD_FILE, target)
+    atomic_write(BRANCH_FILE, branch_name)
+
+    print(f"Switched to branch '{branch_name}'.")
+
+
+def pack_refs():
+    refs.pack(VCS_DIR)
+    print("Packed refs.")
+
+
+def checkout_files(commit_data, root=".", objects_dir=OBJECTS_DIR, matches=None):
+    """Writes the files of a commit into the working tree at root. With a
+    sparse matcher, files outside the checkout are skipped without reading
+    their content."""
+    for file_path, entry in commit_data["files"].items():
+        if matches is not None and not matches(file_path):
+            continue
+
+        target = os.path.join(root, file_path)
+        os.makedirs(os.path.dirname(target) or root, exist_ok=True)
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(load_file(entry, objects_dir))
+
+
+def sparse_checkout(action, patterns=None):
+    """Manages the sparse checkout patterns. Files of HEAD that become
+    selected are written into the working tree, and files that drop out of
+    the checkout are removed unless they have local changes."""
+    if not os.path.exists(HEAD_FILE):
+        print("Repository not initialised.")
+        return
+
+    current = sparse.load_patterns(VCS_DIR)
+
+    match action:
+        case "list":
+            print("\n".join(current) or "Sparse checkout is disabled.")
+            return
+        case "set":
+            new_patterns = list(patterns)
+        case "add":
+            new_patterns = current + [p for p in patterns if p not in current]
+        case "disable":
+            new_patterns = []
+        case _:
+            print(f"Unknown sparse-checkout action: {action}")
+            return
+
+    sparse.save_patterns(VCS_DIR, new_patterns)
+
+    head = transfer.read_head(VCS_DIR)
+    if not head:
+        return
+
+    was_selected = sparse.make_matcher(current)
+    matches = sparse.make_matcher(new_patterns)
+    files = transfer.read_commit(VCS_DIR, head)["files"]
+
+    for file_path, entry in files.items():
+        if matches(file_path):
+            # Existing files are left alone so local work is never overwritten
+            if not os.path.exists(file_path):
+                checkout_files({"files": {file_path: entry}})
+        elif was_selected(file_path) and os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                unchanged = f.read() == load_file(entry)
+            if unchanged:
+                os.remove(file_path)
+            else:
+                print(f"Warning: keeping {file_path}, it has local changes.")
+
+    if new_patterns:
+        print(f"Sparse checkout set to: {', '.join(new_patterns)}")
+    else:
+        print("Sparse checkout disabled.")
+
+
+def _remote_vcs_dir(path):
+    if path is None:
+        path = load_config()["remote"]
+        if path is None:
+            print("No remote configured.")
+            return None
+
+    remote_vcs = os.path.join(path, VCS_DIR)
+    if not os.path.isdir(remote_vcs):
+        print(f"{path} is not a repository.")
+        return None
+    return remote_vcs
+
+
+def clone(source, destination, sparse_patterns=None):
+    source_vcs = _remote_vcs_dir(source)
+    if source_vcs is None:
+        return
+
+    dest_vcs = os.path.join(destination, VCS_DIR)
+    if os.path.exists(dest_vcs):
+        print(f"{destination} already contains a repository.")
+        return
+
+    os.makedirs(os.path.join(dest_vcs, "commits"))
+    os.makedirs(os.path.join(dest_vcs, "objects"))
+    with open(os.path.join(dest_vcs, "index"), "w") as f:
+        json.dump([], f)
+    with open(os.path.join(dest_vcs, "config"), "w") as f:
+        json.dump({"remote": os.path.abspath(source)}, f, indent=2)
+    sparse.save_patterns(dest_vcs, sparse_patterns)
+
+    head = transfer.read_head(source_vcs)
+    branches = refs.list_refs(source_vcs)
+    commit_count, object_count = transfer.transfer(source_vcs, dest_vcs, [head, *branches.values()])
+
+    refs.pack(dest_vcs, branches)
+
+    current = current_branch(source_vcs)
+    if current:
+        with open(os.path.join(dest_vcs, "BRANCH"), "w") as f:
+            f.write(current)
+
+    with open(os.path.join(dest_vcs, "HEAD"), "w") as f:
+        f.write(head)
+
+    if head:
+        checkout_files(
+            {"files": transfer.read_tree(dest_vcs, head)},
+            destination,
+            os.path.join(dest_vcs, "objects"),
+            sparse.make_matcher(sparse_patterns)
+        )
+
+    print(f"Cloned into {destination} ({commit_count} commits, {object_count} objects).")
+
+
+def fetch(source=None):
+    if not os.path.exists(HEAD_FILE):
+        print("Repository not initialised.")
+        return
+
+    source_vcs = _remote_vcs_dir(source)
+    if source_vcs is None:
+        return
+
+    head = transfer.read_head(source_vcs)
+    branches = refs.list_refs(source_vcs)
+    commit_count, object_count = transfer.transfer(source_vcs, VCS_DIR, [head, *branches.values()])
+
+    # Objects are in place, so the refs never point at missing commits
+    refs.write_remote(VCS_DIR, branches)
+    with open(FETCH_HEAD_FILE, "w") as f:
+        f.write(head)
+
+    print(f"Fetched {commit_count} commits and {object_count} objects.")
+
+
+def push(destination=None):
+    """Pushes the current branch to the remote branch of the same name. When
+    the remote has that branch checked out, its working tree is updated
+    too, and the push is refused if that would lose local changes there."""
+    if not os.path.exists(HEAD_FILE):
+        print("Repository not initialised.")
+        return
+
+    dest_vcs = _remote_vcs_dir(destination)
+    if dest_vcs is None:
+        return
+
+    head = transfer.read_head(VCS_DIR)
+    if not head:
+        print("No commits to push.")
+        return
+
+    branch_name = current_branch()
+    if branch_name is None:
+        print("Switch to a branch before pushing.")
+        return
+
+    remote_head = refs.resolve(dest_vcs, branch_name)
+    if remote_head and not transfer.is_ancestor(VCS_DIR, remote_head, head):
+        print("Push rejected: the remote has commits that are not in your history.")
+        return
+
+    dest_root = os.path.dirname(dest_vcs)
+    checked_out = current_branch(dest_vcs) == branch_name
+    if checked_out:
+        with open(os.path.join(dest_vcs, "index")) as f:
+            if json.load(f):
+                print(f"Push rejected: {branch_name} is checked out in the remote and it has staged files.")
+                return
+
+    commit_count, object_count = transfer.transfer(VCS_DIR, dest_vcs, [head])
+
+    if checked_out:
+        old_files = transfer.read_tree(dest_vcs, transfer.read_head(dest_vcs))
+        new_files = transfer.read_tree(dest_vcs, head)
+        conflicts = _tree_conflicts(dest_root, dest_vcs, old_files, new_files)
+        if conflicts:
+            print(f"Push rejected: {branch_name} is checked out in the remote and these files have local changes there:")
+            for file_path in conflicts:
+                print(f"  {file_path}")
+            return
+
+    try:
+        refs.update(dest_vcs, branch_name, head, create=remote_head is None, expected=remote_head)
+    except refs.RefError as error:
+        print(f"Push rejected: {error}")
+        return
+
+    if checked_out:
+        _checkout_tree(dest_root, dest_vcs, old_files, new_files)
+        atomic_write(os.path.join(dest_vcs, "HEAD"), head)
+
+    print(f"Pushed {commit_count} commits and {object_count} objects.")
+
+
+def _history(heads):
+    """Returns every commit reachable from heads, parents before children"""
+    order = []
+    seen = set()
+
+    for head in heads:
+        segment = []
+        while head and head not in seen:
+            seen.add(head)
+            segment.append(head)
+            head = transfer.read_commit(VCS_DIR, head).get("parent")
+        order.extend(reversed(segment))
+
+    return order
+
+
+def fast_export(out):
+    """Writes the whole history to out (a binary stream) in the fast-export format"""
+    if not os.path.exists(HEAD_FILE):
+        print("Repository not initialised.")
+        return
+
+    head = transfer.read_head(VCS_DIR)
+    branches = refs.list_refs(VCS_DIR)
+    marks = {}
+
+    for mark, commit_hash in enumerate(_history([head, *branches.values()]), start=1):
+        data = transfer.read_commit(VCS_DIR, commit_hash)
+        files = (
+            (path, load_file(entry).encode("utf-8"))
+            for path, entry in data["files"].items()
+        )
+        fastimport.write_commit(out, mark, data, marks.get(data.get("parent")), files)
+        marks[commit_hash] = f":{mark}"
+
+    if head:
+        fastimport.write_head(out, marks[head])
+    for name, branch_head in branches.items():
+        if branch_head:
+            fastimport.write_branch(out, name, marks[branch_head])
+
+
+def fast_import(stream):
+    """Reads a fast-export stream from stream (a binary stream). Commits are
+    written as they are read and the refs are only updated once the whole
+    stream has been imported, so a failed import leaves HEAD untouched."""
+    if not os.path.exists(HEAD_FILE):
+        print("Repository not initialised.")
+        return
+
+    settings = load_config()
+    # Writes are published, and synced, in batches of commits. Nothing
+    # points at them until the refs move at the end.
+    batch_size = settings["fsync_batch_size"]
+    marks = {}
+    head = None
+    branches = {}
+
+    def resolve(ref):
+        if ref.startswith(":"):
+            if ref not in marks:
+                raise ValueError(f"Unknown mark {ref}")
+            return marks[ref]
+        if not transfer.has_commit(VCS_DIR, ref):
+            raise ValueError(f"Unknown commit {ref}")
+        return ref
+
+    # The writer discards unpublished files on any error
+    with BatchWriter(settings["durability"]) as writer:
+        try:
+            for kind, record in fastimport.read_records(stream):
+                match kind:
+                    case "commit":
+                        commit_data = {
+                            "timestamp": record["timestamp"],
+                            "message": record["message"],
+                            "files": {
+                                path: store_content(content, settings, writer)
+                                for path, content in record["files"]
+                            },
+                            "parent": resolve(record["parent"]) if record["parent"] else None
+                        }
+                        marks[record["mark"]] = write_commit(commit_data, writer)
+                        if len(marks) % batch_size == 0:
+                            writer.flush()
+                    case "head":
+                        head = resolve(record)
+                    case "branch":
+                        name, ref = record
+                        branches[name] = resolve(ref)
+
+        except (ValueError, UnicodeDecodeError) as error:
+            writer.abort()
+            print(f"Import failed: {error}")
+            return
+
+    previous = {name: refs.resolve(VCS_DIR, name) for name in branches}
+    try:
+        refs.pack(VCS_DIR, branches)
+    except refs.RefError as error:
+        print(f"Import failed: {error}")
+        return
+
+    try:
+        if head is not None:
+            atomic_write(HEAD_FILE, head, durable=settings["durability"] != "none")
+    except Exception:
+        # Put the branches back so the refs and HEAD stay consistent
+        refs.pack(VCS_DIR, {name: commit for name, commit in previous.items() if commit})
+        for name, commit in previous.items():
+            if commit is None:
+                refs.delete(VCS_DIR, name)
+        raise
+
+    print(f"Imported {len(marks)} commits.")
+
+
+def grep(pattern, all_history=False, jobs=None):
+    """Searches committed files for pattern. Identical content is searched
+    only once, in a process pool, and matches are printed as they arrive."""
+    if not os.path.exists(HEAD_FILE):
+        print("Repository not initialised.")
+        return
+
+    try:
+        re.compile(pattern)
+    except re.error as error:
+        print(f"Invalid pattern: {error}")
+        return
+
+    head = transfer.read_head(VCS_DIR)
+    if not head:
+        print("No commits to search.")
+        return
 
-    print(f"Created branch '{branch_name}'.")
\ No newline at end of file
+    if all_history:
+        commits = reversed(_history([head, *refs.list_refs(VCS_DIR).values()]))
+    else:
+        commits = [head]
+
+    def print_matches(locations, matches):
+        for commit_hash, path in locations:
+            prefix = f"{commit_hash[:7]}:{path}" if all_history else path
+            for number, line in matches:
+                print(f"{prefix}:{number}:{line}")
+
+    locations = {}
+    results = {}
+    finished = queue.SimpleQueue()
+
+    def collect(block):
+        # Prints every search that has finished so far
+        while True:
+            try:
+                key, future = finished.get(block=block)
+            except queue.Empty:
+                return
+            results[key] = future.result()
+            print_matches(locations.pop(key), results[key])
+            block = False
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for commit_hash in commits:
+            data = transfer.read_commit(VCS_DIR, commit_hash)
+
+            for path, entry in data["files"].items():
+                key = search.blob_key(entry)
+
+                if key in results:
+                    print_matches([(commit_hash, path)], results[key])
+                elif key in locations:
+                    locations[key].append((commit_hash, path))
+                else:
+                    locations[key] = [(commit_hash, path)]
+                    future = pool.submit(search.search_entry, pattern, entry, OBJECTS_DIR)
+                    future.add_done_callback(lambda done, key=key: finished.put((key, done)))
+
+            collect(block=False)
+
+        while locations:
+            collect(block=True)
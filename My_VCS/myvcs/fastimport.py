@@ -0,0 +1,100 @@
+# The fast-export stream is line oriented. Each commit is written oldest
+# first as a record like:
+#
+#     commit :2
+#     timestamp 1714380000.123
+#     parent :1
+#     message 14
+#     Second commit
+#     file 12 notes/todo.txt
+#     file content
+#     end
+#
+# Payloads are prefixed with their length in bytes and followed by a newline,
+# so they may contain anything. A parent is either a mark (":1") or the hash
+# of a commit that already exists in the importing repository. The stream
+# ends with the refs to set once every commit has been written:
+#
+#     head :2
+#     branch feature :1
+
+
+def write_commit(out, mark, data, parent, files):
+    """Writes a commit record. files is an iterable of (path, bytes)"""
+    message = data["message"].encode("utf-8")
+
+    out.write(f"commit :{mark}\n".encode())
+    out.write(f"timestamp {data['timestamp']!r}\n".encode())
+    if parent:
+        out.write(f"parent {parent}\n".encode())
+    out.write(f"message {len(message)}\n".encode())
+    out.write(message + b"\n")
+
+    for path, content in files:
+        out.write(f"file {len(content)} {path}\n".encode("utf-8"))
+        out.write(content + b"\n")
+
+    out.write(b"end\n")
+
+
+def write_head(out, ref):
+    out.write(f"head {ref}\n".encode())
+
+
+def write_branch(out, name, ref):
+    out.write(f"branch {name} {ref}\n".encode("utf-8"))
+
+
+def _read_data(stream, size):
+    data = stream.read(size)
+    if len(data) != size or stream.read(1) != b"\n":
+        raise ValueError("Unexpected end of stream")
+    return data
+
+
+def _read_commit(stream, mark):
+    record = {"mark": mark, "parent": None, "files": []}
+
+    for line in iter(stream.readline, b""):
+        keyword, _, rest = line.rstrip(b"\n").decode("utf-8").partition(" ")
+
+        match keyword:
+            case "timestamp":
+                record["timestamp"] = float(rest)
+            case "parent":
+                record["parent"] = rest
+            case "message":
+                record["message"] = _read_data(stream, int(rest)).decode("utf-8")
+            case "file":
+                size, _, path = rest.partition(" ")
+                record["files"].append((path, _read_data(stream, int(size))))
+            case "end":
+                if "timestamp" not in record or "message" not in record:
+                    raise ValueError(f"Commit {mark} is missing a timestamp or message")
+                return record
+            case _:
+                raise ValueError(f"Unknown command in commit {mark}: {keyword}")
+
+    raise ValueError("Unexpected end of stream")
+
+
+def read_records(stream):
+    """Yields the records of a stream one at a time, so only a single commit
+    is held in memory. Records are ("commit", record), ("head", ref) and
+    ("branch", (name, ref))."""
+    for line in iter(stream.readline, b""):
+        line = line.rstrip(b"\n").decode("utf-8")
+        if not line:
+            continue
+
+        keyword, _, rest = line.partition(" ")
+        match keyword:
+            case "commit":
+                yield "commit", _read_commit(stream, rest)
+            case "head":
+                yield "head", rest
+            case "branch":
+                name, _, ref = rest.rpartition(" ")
+                yield "branch", (name, ref)
+            case _:
+                raise ValueError(f"Unknown command: {keyword}")
@@ -0,0 +1,37 @@
+import os
+import hashlib
+
+
+def hash_object(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def object_path(objects_dir, object_hash):
+    # Fan objects out over 256 directories so no single directory gets huge
+    return os.path.join(objects_dir, object_hash[:2], object_hash[2:])
+
+
+def has_object(objects_dir, object_hash):
+    return os.path.exists(object_path(objects_dir, object_hash))
+
+
+def write_object(objects_dir, data, writer):
+    """Stores data as a content-addressed object through writer (a
+    utils.BatchWriter) and returns its hash. Objects that already exist are
+    not written again."""
+    object_hash = hash_object(data)
+    writer.write(object_path(objects_dir, object_hash), data)
+    return object_hash
+
+
+def read_object(objects_dir, object_hash):
+    with open(object_path(objects_dir, object_hash), "rb") as f:
+        return f.read()
+
+
+def read_entry(objects_dir, entry):
+    """Returns the text of a commit file entry, which is either the content
+    itself or a dict listing the chunk objects it was split into"""
+    if isinstance(entry, dict):
+        return b"".join(read_object(objects_dir, h) for h in entry["chunks"]).decode("utf-8")
+    return entry
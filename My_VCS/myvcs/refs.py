@@ -0,0 +1,239 @@
+import os
+from contextlib import contextmanager
+
+# Branches live in two places: packed-refs, one sorted "<hash> <name>" line
+# per branch, and loose files under branches/ that override the packed
+# value. New and updated branches are written loose; pack() folds them back
+# into packed-refs so that repositories with thousands of branches need a
+# single file read to list or resolve them. The branches of the remote as
+# of the last fetch are kept apart, in remote-refs, in the packed format.
+
+
+class RefError(Exception):
+    pass
+
+
+def _loose_dir(vcs_dir):
+    return os.path.join(vcs_dir, "branches")
+
+
+def _packed_file(vcs_dir):
+    return os.path.join(vcs_dir, "packed-refs")
+
+
+def _remote_file(vcs_dir):
+    return os.path.join(vcs_dir, "remote-refs")
+
+
+def check_name(name):
+    parts = name.split("/")
+    if (not name or name.endswith(".lock") or any(c.isspace() for c in name)
+            or any(part in ("", ".", "..") for part in parts)):
+        raise RefError(f"'{name}' is not a valid branch name")
+
+
+@contextmanager
+def _locked(path):
+    """Takes path.lock, yields it for writing and renames it over path on
+    success. Readers never see a partially written ref."""
+    lock_path = path + ".lock"
+
+    for attempt in range(2):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            break
+        except FileExistsError:
+            raise RefError(f"Unable to lock {path}: another update is in progress")
+        except FileNotFoundError:
+            # A pack or delete pruned the directory in between
+            if attempt:
+                raise
+
+    try:
+        with os.fdopen(fd, "w") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(lock_path, path)
+    except BaseException:
+        os.remove(lock_path)
+        raise
+
+
+def _read_ref_file(path):
+    refs = {}
+    if not os.path.exists(path):
+        return refs
+
+    with open(path) as f:
+        for line in f:
+            commit_hash, _, name = line.rstrip("\n").partition(" ")
+            if name:
+                refs[name] = commit_hash
+    return refs
+
+
+def read_packed(vcs_dir):
+    return _read_ref_file(_packed_file(vcs_dir))
+
+
+def _write_packed(f, packed):
+    f.writelines(f"{packed[name]} {name}\n" for name in sorted(packed))
+
+
+def _read_loose(vcs_dir):
+    loose = {}
+    root = _loose_dir(vcs_dir)
+
+    for directory, _, files in os.walk(root):
+        for file_name in files:
+            if file_name.endswith(".lock"):
+                continue
+            path = os.path.join(directory, file_name)
+            with open(path) as f:
+                loose[os.path.relpath(path, root).replace(os.sep, "/")] = f.read().strip()
+    return loose
+
+
+def _lock_loose(vcs_dir):
+    """Takes the lock of every loose branch that is not being updated and
+    returns their values by name. Branches whose lock is held elsewhere are
+    left out and stay loose."""
+    locked = {}
+    root = _loose_dir(vcs_dir)
+
+    try:
+        for directory, _, files in os.walk(root):
+            for file_name in files:
+                if file_name.endswith(".lock"):
+                    continue
+                path = os.path.join(directory, file_name)
+                try:
+                    fd = os.open(path + ".lock", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+                except FileExistsError:
+                    continue
+                os.close(fd)
+
+                name = os.path.relpath(path, root).replace(os.sep, "/")
+                try:
+                    with open(path) as f:
+                        locked[name] = f.read().strip()
+                except FileNotFoundError:
+                    # Deleted since the walk listed it
+                    os.remove(path + ".lock")
+    except BaseException:
+        _unlock_loose(vcs_dir, locked)
+        raise
+    return locked
+
+
+def _unlock_loose(vcs_dir, names):
+    for name in names:
+        os.remove(os.path.join(_loose_dir(vcs_dir), name) + ".lock")
+
+
+def _prune(vcs_dir):
+    """Removes directories under branches/ that no longer hold any ref, so
+    a branch can later take the name of one"""
+    root = _loose_dir(vcs_dir)
+    for directory, _, _ in os.walk(root, topdown=False):
+        if directory != root:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass  # Not empty
+
+
+def resolve(vcs_dir, name):
+    """Returns the commit a branch points at, or None if it does not exist"""
+    loose = os.path.join(_loose_dir(vcs_dir), name)
+    if os.path.isfile(loose):
+        with open(loose) as f:
+            return f.read().strip()
+    return read_packed(vcs_dir).get(name)
+
+
+def list_refs(vcs_dir):
+    refs = read_packed(vcs_dir)
+    refs.update(_read_loose(vcs_dir))
+    return dict(sorted(refs.items()))
+
+
+def update(vcs_dir, name, commit_hash, create=False, expected=None):
+    """Points a branch at commit_hash. With create, fails if it already
+    exists; with expected, fails unless it still points there. Both checks
+    run under the branch's lock."""
+    check_name(name)
+
+    with _locked(os.path.join(_loose_dir(vcs_dir), name)) as f:
+        current = resolve(vcs_dir, name)
+        if create and current is not None:
+            raise RefError(f"Branch '{name}' already exists")
+        if expected is not None and current != expected:
+            raise RefError(f"Branch '{name}' was updated by someone else")
+        f.write(commit_hash)
+
+
+def delete(vcs_dir, name):
+    loose = os.path.join(_loose_dir(vcs_dir), name)
+    packed = read_packed(vcs_dir)
+
+    if name not in packed and not os.path.isfile(loose):
+        raise RefError(f"Branch '{name}' does not exist")
+
+    # Drop the packed value first so the branch never reappears from it
+    if name in packed:
+        with _locked(_packed_file(vcs_dir)) as f:
+            packed = read_packed(vcs_dir)
+            packed.pop(name, None)
+            _write_packed(f, packed)
+
+    if os.path.isfile(loose):
+        os.remove(loose)
+        _prune(vcs_dir)
+
+
+def pack(vcs_dir, updates=None):
+    """Moves every loose branch, plus any updates given as a name -> hash
+    mapping, into packed-refs in a single write"""
+    updates = updates or {}
+    for name in updates:
+        check_name(name)
+
+    loose = {}
+    try:
+        with _locked(_packed_file(vcs_dir)) as f:
+            packed = read_packed(vcs_dir)
+            # Loose branches are locked while they move: an update made
+            # meanwhile fails instead of being lost, and a branch already
+            # being updated is skipped and stays loose
+            loose = _lock_loose(vcs_dir)
+            packed.update(loose)
+            packed.update(updates)
+            _write_packed(f, packed)
+
+        # packed-refs now holds every locked value; a loose file is only
+        # dropped if it still has the value that was packed
+        for name, commit_hash in loose.items():
+            path = os.path.join(_loose_dir(vcs_dir), name)
+            with open(path) as f:
+                unchanged = f.read().strip() == commit_hash
+            if unchanged:
+                os.remove(path)
+    finally:
+        _unlock_loose(vcs_dir, loose)
+
+    _prune(vcs_dir)
+
+
+def read_remote(vcs_dir):
+    """Returns the remote's branches as of the last fetch"""
+    return _read_ref_file(_remote_file(vcs_dir))
+
+
+def write_remote(vcs_dir, remote_refs):
+    """Replaces the remote-tracking branches with remote_refs, a name ->
+    hash mapping, so branches deleted on the remote disappear too"""
+    with _locked(_remote_file(vcs_dir)) as f:
+        _write_packed(f, remote_refs)
@@ -0,0 +1,23 @@
+import re
+import hashlib
+
+from myvcs import objects
+
+
+def blob_key(entry):
+    """Identifies a commit entry's content without reading chunk objects"""
+    if isinstance(entry, dict):
+        return "chunks:" + hashlib.sha1(" ".join(entry["chunks"]).encode()).hexdigest()
+    return "blob:" + hashlib.sha1(entry.encode("utf-8")).hexdigest()
+
+
+def search_entry(pattern, entry, objects_dir):
+    """Returns (line number, line) for every line of the entry matching
+    pattern. Runs in a worker process, so chunked content is read there."""
+    content = objects.read_entry(objects_dir, entry)
+    regex = re.compile(pattern)
+    return [
+        (number, line)
+        for number, line in enumerate(content.splitlines(), start=1)
+        if regex.search(line)
+    ]
@@ -0,0 +1,49 @@
+import os
+from fnmatch import fnmatchcase
+
+# A sparse checkout is a list of patterns, one per line. A pattern ending in
+# "/" selects everything below that directory; any other pattern is a glob
+# matched against the whole path. Without patterns every path is selected.
+
+
+def _patterns_file(vcs_dir):
+    return os.path.join(vcs_dir, "sparse-checkout")
+
+
+def load_patterns(vcs_dir):
+    path = _patterns_file(vcs_dir)
+    if not os.path.exists(path):
+        return []
+
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def save_patterns(vcs_dir, patterns):
+    path = _patterns_file(vcs_dir)
+    if not patterns:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+
+    with open(path, "w") as f:
+        f.writelines(f"{pattern}\n" for pattern in patterns)
+
+
+def make_matcher(patterns):
+    """Returns a function telling whether a path is part of the checkout"""
+    if not patterns:
+        return lambda path: True
+
+    cones = tuple(pattern for pattern in patterns if pattern.endswith("/"))
+    globs = [pattern for pattern in patterns if not pattern.endswith("/")]
+
+    def matches(path):
+        path = os.path.normpath(path).replace(os.sep, "/")
+        return path.startswith(cones) or any(fnmatchcase(path, glob) for glob in globs)
+
+    return matches
+
+
+def load_matcher(vcs_dir):
+    return make_matcher(load_patterns(vcs_dir))
@@ -0,0 +1,97 @@
+import os
+import json
+import difflib
+
+from myvcs import objects
+from myvcs.transfer import read_commit
+from myvcs.utils import atomic_write
+
+MAX_BAR_WIDTH = 40
+
+
+def _cache_path(vcs_dir, commit_hash):
+    return os.path.join(vcs_dir, "cache", "stat", commit_hash)
+
+
+def count_changes(old_text, new_text):
+    """Returns the number of lines added and removed between two texts"""
+    old_lines = old_text.splitlines()
+    new_lines = new_text.splitlines()
+
+    # Edits are usually small, so the common head and tail are trimmed
+    # before the quadratic matcher sees the lines.
+    start = 0
+    limit = min(len(old_lines), len(new_lines))
+    while start < limit and old_lines[start] == new_lines[start]:
+        start += 1
+
+    end = 0
+    while end < limit - start and old_lines[-1 - end] == new_lines[-1 - end]:
+        end += 1
+
+    old_lines = old_lines[start:len(old_lines) - end]
+    new_lines = new_lines[start:len(new_lines) - end]
+
+    added = removed = 0
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            removed += i2 - i1
+            added += j2 - j1
+    return added, removed
+
+
+def commit_stat(vcs_dir, commit_hash):
+    """Returns [path, added, removed] for every file a commit changed
+    compared with its parent. Entries are compared first, which for chunked
+    files means comparing chunk lists, so only changed files are read and
+    diffed. Commits never change, so results are cached per commit."""
+    cache_path = _cache_path(vcs_dir, commit_hash)
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return json.load(f)
+
+    data = read_commit(vcs_dir, commit_hash)
+    parent_files = read_commit(vcs_dir, data["parent"])["files"] if data.get("parent") else {}
+    objects_dir = os.path.join(vcs_dir, "objects")
+
+    stat = []
+    for path in sorted(data["files"]):
+        entry = data["files"][path]
+        old_entry = parent_files.get(path)
+        if old_entry == entry:
+            continue
+
+        old_text = objects.read_entry(objects_dir, old_entry) if old_entry is not None else ""
+        added, removed = count_changes(old_text, objects.read_entry(objects_dir, entry))
+        stat.append([path, added, removed])
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    atomic_write(cache_path, json.dumps(stat), durable=False)
+    return stat
+
+
+def _plural(count, word):
+    return f"{count} {word}" if count == 1 else f"{count} {word}s"
+
+
+def format_stat(stat):
+    if not stat:
+        return " 0 files changed"
+
+    width = max(len(path) for path, _, _ in stat)
+    largest = max(added + removed for _, added, removed in stat)
+    scale = min(1, MAX_BAR_WIDTH / largest) if largest else 1
+
+    lines = []
+    for path, added, removed in stat:
+        bar = "+" * round(added * scale) + "-" * round(removed * scale)
+        lines.append(f" {path.ljust(width)} | {added + removed} {bar}".rstrip())
+
+    insertions = sum(added for _, added, _ in stat)
+    deletions = sum(removed for _, _, removed in stat)
+    lines.append(
+        f" {_plural(len(stat), 'file')} changed, "
+        f"{_plural(insertions, 'insertion')}(+), {_plural(deletions, 'deletion')}(-)"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import tempfile
+
+from myvcs import objects
+
+
+def _commit_path(vcs_dir, commit_hash):
+    return os.path.join(vcs_dir, "commits", commit_hash)
+
+
+def read_head(vcs_dir):
+    head_file = os.path.join(vcs_dir, "HEAD")
+    if not os.path.exists(head_file):
+        return ""
+
+    with open(head_file) as f:
+        return f.read().strip()
+
+
+def read_commit(vcs_dir, commit_hash):
+    with open(_commit_path(vcs_dir, commit_hash)) as f:
+        return json.load(f)
+
+
+def read_tree(vcs_dir, commit_hash):
+    """Returns every file at a commit. Commits only record the files staged
+    for them, so the tree is the newest entry of each path over the commit
+    and its ancestors."""
+    files = {}
+    while commit_hash:
+        data = read_commit(vcs_dir, commit_hash)
+        for path, entry in data["files"].items():
+            files.setdefault(path, entry)
+        commit_hash = data.get("parent")
+    return files
+
+
+def has_commit(vcs_dir, commit_hash):
+    return os.path.exists(_commit_path(vcs_dir, commit_hash))
+
+
+def referenced_objects(commit_data):
+    """Returns the hashes of the objects a commit's files point to"""
+    for entry in commit_data["files"].values():
+        if isinstance(entry, dict):
+            yield from entry["chunks"]
+
+
+def missing_commits(source_vcs, dest_vcs, head):
+    """Walks the history of head in the source repository until it reaches a
+    commit the destination already has, and returns the commits in between
+    oldest first. A repository always holds the ancestors of its commits,
+    so the walk only covers history the destination lacks."""
+    missing = []
+    while head and not has_commit(dest_vcs, head):
+        missing.append(head)
+        head = read_commit(source_vcs, head).get("parent")
+
+    missing.reverse()
+    return missing
+
+
+def is_ancestor(vcs_dir, ancestor, head):
+    while head:
+        if head == ancestor:
+            return True
+        head = read_commit(vcs_dir, head).get("parent")
+    return False
+
+
+def _same_filesystem(source_vcs, dest_vcs):
+    return os.stat(source_vcs).st_dev == os.stat(dest_vcs).st_dev
+
+
+def _copy(source, destination, link):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if link:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    # Copy under a unique temporary name so a partial copy is never mistaken
+    # for a complete object, and concurrent copies never share a file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f, open(source, "rb") as src:
+            shutil.copyfileobj(src, f)
+        shutil.copystat(source, temp_path)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def transfer(source_vcs, dest_vcs, heads):
+    """Copies every commit reachable from heads, along with the objects they
+    reference, that dest_vcs does not have yet. Objects are hardlinked when
+    both repositories live on the same filesystem.
+    Returns the number of commits and objects transferred."""
+    link = _same_filesystem(source_vcs, dest_vcs)
+    source_objects = os.path.join(source_vcs, "objects")
+    dest_objects = os.path.join(dest_vcs, "objects")
+
+    commit_count = 0
+    object_count = 0
+
+    for head in heads:
+        for commit_hash in missing_commits(source_vcs, dest_vcs, head):
+            # Objects go first and commits oldest first, so an interrupted
+            # transfer never leaves a commit without its data or ancestors.
+            for object_hash in referenced_objects(read_commit(source_vcs, commit_hash)):
+                if objects.has_object(dest_objects, object_hash):
+                    continue
+                _copy(
+                    objects.object_path(source_objects, object_hash),
+                    objects.object_path(dest_objects, object_hash),
+                    link
+                )
+                object_count += 1
+
+            _copy(_commit_path(source_vcs, commit_hash), _commit_path(dest_vcs, commit_hash), link)
+            commit_count += 1
+
+    return commit_count, object_count
@@ -0,0 +1,118 @@
+import os
+import tempfile
+
+# "full" syncs every file of a write batch before anything points at it,
+# "batch" syncs a whole batch at once, which also lets bulk operations such
+# as fast-import sync once every few hundred commits, and "none" never
+# syncs, leaving durability to the operating system.
+DURABILITY_MODES = ("full", "batch", "none")
+
+
+def fsync_dir(path):
+    """Makes renames inside a directory durable"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _temp_file(path):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    return tempfile.mkstemp(dir=directory, prefix=".tmp-")
+
+
+def atomic_write(path, data, durable=True):
+    """Replaces path with data so that readers see either the old or the new
+    content, never a partial write"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    fd, temp_path = _temp_file(path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    if durable:
+        fsync_dir(os.path.dirname(path) or ".")
+
+
+class BatchWriter:
+    """Writes immutable files to temporary names and only moves them into
+    place on flush(), after syncing their data. Each directory is synced
+    once per flush rather than once per file. Used as a context manager it
+    flushes on success and discards the temporary files on error."""
+
+    def __init__(self, durability="full"):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.durability = durability
+        self.pending = {}
+
+    def exists(self, path):
+        return path in self.pending or os.path.exists(path)
+
+    def write(self, path, data):
+        if self.exists(path):
+            return
+
+        fd, temp_path = _temp_file(path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.pending[path] = temp_path
+
+    def flush(self):
+        # "full" syncs each file and directory on its own. "batch" makes do
+        # with one system-wide sync before the renames and one after,
+        # however many files there are.
+        batched = self.durability == "batch" and hasattr(os, "sync")
+        per_file = self.durability == "full" or (self.durability == "batch" and not batched)
+
+        # Sync every file first so that the kernel can write them back
+        # together, then publish them with renames.
+        if per_file:
+            for temp_path in self.pending.values():
+                fd = os.open(temp_path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        elif batched and self.pending:
+            os.sync()
+
+        directories = set()
+        for path, temp_path in self.pending.items():
+            os.replace(temp_path, path)
+            directories.add(os.path.dirname(path) or ".")
+
+        if per_file:
+            for directory in directories:
+                fsync_dir(directory)
+        elif batched and self.pending:
+            os.sync()
+
+        self.pending.clear()
+
+    def abort(self):
+        for temp_path in self.pending.values():
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.abort()
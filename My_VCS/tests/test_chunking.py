@@ -0,0 +1,59 @@
+import io
+import random
+import pytest
+from unittest.mock import patch
+from myvcs import chunking
+from myvcs.chunking import chunk_boundaries, read_chunks, split_chunks
+
+
+@pytest.fixture
+def data():
+    return random.Random(42).randbytes(500_000)
+
+
+def test_chunks_reassemble(data):
+    """Test that the chunks cover the data exactly"""
+    assert b"".join(split_chunks(data)) == data
+
+
+def test_chunk_sizes_respect_limits(data):
+    """Test that every chunk but the last lies within the size limits"""
+    chunks = split_chunks(data, 1024, 4096, 16384)
+
+    for chunk in chunks[:-1]:
+        assert 1024 <= len(chunk) <= 16384
+
+
+def test_insertion_only_changes_nearby_chunks(data):
+    """Test that boundaries resynchronise after an insertion"""
+    edited = data[:250_000] + b"inserted bytes" + data[250_000:]
+
+    before = set(split_chunks(data))
+    after = split_chunks(edited)
+
+    new_chunks = [chunk for chunk in after if chunk not in before]
+    assert len(new_chunks) <= 2
+
+
+def test_invalid_sizes():
+    """Test that inconsistent chunk sizes are rejected"""
+    with pytest.raises(ValueError):
+        list(chunk_boundaries(b"data", 4096, 1024, 8192))
+
+
+def test_vectorized_boundaries_match_plain_loop(data):
+    """Test that the NumPy hashes cut exactly where the plain loop does"""
+    pytest.importorskip("numpy")
+    assert chunking._boundary_offsets(data, chunking._boundary_mask(4096)) is not None
+
+    with patch('myvcs.chunking._boundary_offsets', return_value=None):
+        expected = list(chunk_boundaries(data, 1024, 4096, 16384))
+
+    assert list(chunk_boundaries(data, 1024, 4096, 16384)) == expected
+
+
+def test_read_chunks_streams_the_same_chunks(data):
+    """Test that reading block by block gives the chunks of the whole data"""
+    for block_size in (1000, 20_000, 1 << 20):
+        chunks = list(read_chunks(io.BytesIO(data), block_size=block_size))
+        assert chunks == split_chunks(data)
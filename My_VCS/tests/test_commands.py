@@ -7,6 +7,8 @@ import pytest
 from io import StringIO
 from unittest.mock import patch, mock_open
 from myvcs import commands
+from myvcs import refs
+from myvcs import stats
 
 
 @pytest.fixture
@@ -289,4 +291,697 @@ def test_diff_no_commits(temp_dir):
     with patch('sys.stdout', new=StringIO()) as fake_out:
         commands.diff("test_file.txt")
 
-        assert "No commits to diff against" in fake_out.getvalue()
\ No newline at end of file
+        assert "No commits to diff against" in fake_out.getvalue()
+
+def test_config_set_and_get(temp_dir):
+    """Test that config values are stored with their JSON types"""
+    commands.init()
+
+    with patch('sys.stdout', new=StringIO()):
+        commands.config("chunking", "true")
+        commands.config("chunk_threshold", "4096")
+
+    settings = commands.load_config()
+    assert settings["chunking"] is True
+    assert settings["chunk_threshold"] == 4096
+    assert settings["chunk_avg_size"] == commands.DEFAULT_CONFIG["chunk_avg_size"]
+
+
+def test_commit_chunks_large_file(temp_dir):
+    """Test that large files are stored as shared chunk objects"""
+    commands.init()
+    with patch('sys.stdout', new=StringIO()):
+        commands.config("chunking", "true")
+        commands.config("chunk_threshold", "1024")
+
+    rows = [f"{i},value-{i * 7919 % 10007}\n" for i in range(20000)]
+    with open("data.csv", "w") as f:
+        f.writelines(rows)
+
+    with patch('sys.stdout', new=StringIO()):
+        commands.add("data.csv")
+        commands.commit("First snapshot")
+
+    with open(commands.HEAD_FILE) as f:
+        first = f.read().strip()
+
+    rows[10000] = "10000,edited\n"
+    with open("data.csv", "w") as f:
+        f.writelines(rows)
+
+    with patch('sys.stdout', new=StringIO()):
+        commands.add("data.csv")
+        commands.commit("Second snapshot")
+
+    with open(commands.HEAD_FILE) as f:
+        second = f.read().strip()
+
+    with open(os.path.join(commands.COMMITS_DIR, first)) as f:
+        first_entry = json.load(f)["files"]["data.csv"]
+    with open(os.path.join(commands.COMMITS_DIR, second)) as f:
+        second_entry = json.load(f)["files"]["data.csv"]
+
+    assert len(first_entry["chunks"]) > 10
+    changed = set(second_entry["chunks"]) - set(first_entry["chunks"])
+    assert 0 < len(changed) <= 2
+    assert commands.load_file(second_entry) == "".join(rows)
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.diff("data.csv")
+        assert "No changes" in fake_out.getvalue()
+
+
+def _commit_file(path, content, message):
+    with open(path, "w") as f:
+        f.write(content)
+    commands.add(path)
+    commands.commit(message)
+
+
+def test_clone_copies_history_and_files(temp_dir):
+    """Test cloning a repository into a new directory"""
+    os.makedirs("origin")
+    os.chdir("origin")
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("another_file.txt", "more content", "First commit")
+        _commit_file("test_file.txt", "first", "Second commit")
+        _commit_file("test_file.txt", "second", "Third commit")
+        commands.branch("feature")
+    os.chdir(temp_dir)
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.clone("origin", "copy")
+        assert "3 commits" in fake_out.getvalue()
+
+    head = open(os.path.join("origin", commands.HEAD_FILE)).read()
+    assert open(os.path.join("copy", commands.HEAD_FILE)).read() == head
+    assert open(os.path.join("copy", "test_file.txt")).read() == "second"
+    # Committed before the latest commit, which does not list it
+    assert open(os.path.join("copy", "another_file.txt")).read() == "more content"
+    assert refs.resolve(os.path.join("copy", commands.VCS_DIR), "feature") is not None
+
+    # Same filesystem, so commits are hardlinked rather than copied
+    source_stat = os.stat(os.path.join("origin", commands.COMMITS_DIR, head))
+    clone_stat = os.stat(os.path.join("copy", commands.COMMITS_DIR, head))
+    assert source_stat.st_ino == clone_stat.st_ino
+
+
+def test_object_copy_uses_unique_temp_files(temp_dir):
+    """Test that copies go through unique temporary names cleaned up on error"""
+    from myvcs import transfer
+    with open("source", "wb") as f:
+        f.write(b"data")
+    os.makedirs("objects")
+    open(os.path.join("objects", "abc.tmp"), "w").close()
+
+    transfer._copy("source", os.path.join("objects", "abc"), link=False)
+    assert open(os.path.join("objects", "abc"), "rb").read() == b"data"
+
+    with patch('myvcs.transfer.shutil.copyfileobj', side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            transfer._copy("source", os.path.join("objects", "def"), link=False)
+
+    assert sorted(os.listdir("objects")) == ["abc", "abc.tmp"]
+
+
+def test_fetch_transfers_only_new_commits(temp_dir):
+    """Test that fetch only copies history the local repository lacks"""
+    os.makedirs("origin")
+    os.chdir("origin")
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "first", "First commit")
+    os.chdir(temp_dir)
+
+    with patch('sys.stdout', new=StringIO()):
+        commands.clone("origin", "copy")
+
+    os.chdir("origin")
+    with patch('sys.stdout', new=StringIO()):
+        _commit_file("test_file.txt", "second", "Second commit")
+        commands.branch("topic")
+        commands.switch("topic")
+        _commit_file("another_file.txt", "topic", "Topic commit")
+        commands.switch("main")
+    topic_head = refs.resolve(commands.VCS_DIR, "topic")
+    os.chdir(os.path.join(temp_dir, "copy"))
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.fetch()
+        assert "Fetched 2 commits" in fake_out.getvalue()
+
+    remote_head = open(os.path.join(temp_dir, "origin", commands.HEAD_FILE)).read()
+    assert open(commands.FETCH_HEAD_FILE).read() == remote_head
+    assert refs.read_remote(commands.VCS_DIR) == {"main": remote_head, "topic": topic_head}
+    assert commands._resolve_commit("remote/topic") == topic_head
+
+
+def test_push_fast_forward_and_rejection(temp_dir):
+    """Test pushing new commits and refusing to overwrite diverged history"""
+    os.makedirs("origin")
+    os.chdir("origin")
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "first", "First commit")
+    os.chdir(temp_dir)
+
+    with patch('sys.stdout', new=StringIO()):
+        commands.clone("origin", "copy")
+
+    os.chdir("copy")
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        _commit_file("test_file.txt", "local", "Local commit")
+        commands.push()
+        assert "Pushed 1 commits" in fake_out.getvalue()
+
+    local_head = open(commands.HEAD_FILE).read()
+    assert open(os.path.join(temp_dir, "origin", commands.HEAD_FILE)).read() == local_head
+    assert refs.resolve(os.path.join(temp_dir, "origin", commands.VCS_DIR), "main") == local_head
+    # main is checked out in origin, so its working tree follows
+    assert open(os.path.join(temp_dir, "origin", "test_file.txt")).read() == "local"
+
+    os.chdir(os.path.join(temp_dir, "origin"))
+    with patch('sys.stdout', new=StringIO()):
+        _commit_file("test_file.txt", "remote", "Remote commit")
+    os.chdir(os.path.join(temp_dir, "copy"))
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        _commit_file("test_file.txt", "diverged", "Diverged commit")
+        commands.push()
+        assert "Push rejected" in fake_out.getvalue()
+
+
+def test_push_refuses_to_overwrite_remote_changes(temp_dir):
+    """Test that a push never clobbers edits in the remote's working tree,
+    and that other branches are pushed without touching it"""
+    os.makedirs("origin")
+    os.chdir("origin")
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "first", "First commit")
+    origin_vcs = os.path.join(temp_dir, "origin", commands.VCS_DIR)
+    origin_head = open(commands.HEAD_FILE).read()
+    os.chdir(temp_dir)
+
+    with patch('sys.stdout', new=StringIO()):
+        commands.clone("origin", "copy")
+
+    with open(os.path.join("origin", "test_file.txt"), "w") as f:
+        f.write("unsaved work")
+
+    os.chdir("copy")
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        _commit_file("test_file.txt", "local", "Local commit")
+        commands.push()
+        assert "Push rejected" in fake_out.getvalue()
+
+    assert refs.resolve(origin_vcs, "main") == origin_head
+    assert open(os.path.join(temp_dir, "origin", "test_file.txt")).read() == "unsaved work"
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.branch("feature")
+        commands.switch("feature")
+        commands.push()
+        assert "Pushed" in fake_out.getvalue()
+
+    assert refs.resolve(origin_vcs, "feature") == open(commands.HEAD_FILE).read()
+    assert open(os.path.join(origin_vcs, "HEAD")).read() == origin_head
+
+
+def test_fast_export_import_round_trip(temp_dir):
+    """Test that importing an exported history reproduces the same commits"""
+    from io import BytesIO
+
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "first\n", "First commit")
+        commands.branch("feature")
+        _commit_file("another_file.txt", "line with\nnewlines\n", "Second commit")
+
+    head = open(commands.HEAD_FILE).read()
+    stream = BytesIO()
+    commands.fast_export(stream)
+
+    os.makedirs("imported")
+    os.chdir("imported")
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.init()
+        commands.fast_import(BytesIO(stream.getvalue()))
+        assert "Imported 2 commits" in fake_out.getvalue()
+
+    assert open(commands.HEAD_FILE).read() == head
+    feature = refs.resolve(os.path.join(temp_dir, commands.VCS_DIR), "feature")
+    assert refs.resolve(commands.VCS_DIR, "feature") == feature
+
+
+def test_fast_import_failure_keeps_head(temp_dir):
+    """Test that a truncated stream does not move HEAD"""
+    from io import BytesIO
+
+    commands.init()
+    stream = BytesIO(b"commit :1\ntimestamp 1.0\nmessage 20\ntoo short")
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.fast_import(stream)
+        assert "Import failed" in fake_out.getvalue()
+
+    assert open(commands.HEAD_FILE).read() == ""
+
+
+def _export_two_commits():
+    from io import BytesIO
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "first\n", "First commit")
+        commands.branch("feature")
+        _commit_file("test_file.txt", "second\n", "Second commit")
+    stream = BytesIO()
+    commands.fast_export(stream)
+    os.makedirs("imported")
+    os.chdir("imported")
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+    return BytesIO(stream.getvalue())
+
+
+def test_fast_import_publishes_in_batches(temp_dir):
+    """Test that commits are flushed in batches, not one by one"""
+    from myvcs.utils import BatchWriter
+    stream = _export_two_commits()
+
+    with patch.object(BatchWriter, 'flush', autospec=True, side_effect=BatchWriter.flush) as mock_flush:
+        with patch('sys.stdout', new=StringIO()):
+            commands.fast_import(stream)
+
+    assert mock_flush.call_count == 1
+    assert refs.resolve(commands.VCS_DIR, "feature") is not None
+
+
+def test_fast_import_cleans_up_after_unexpected_errors(temp_dir):
+    """Test that an I/O error mid-stream leaves no files and no ref changes"""
+    stream = _export_two_commits()
+    store_content = commands.store_content
+    calls = []
+
+    def fail_second(content, settings, writer):
+        calls.append(content)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        return store_content(content, settings, writer)
+
+    with patch('myvcs.commands.store_content', side_effect=fail_second):
+        with pytest.raises(OSError):
+            commands.fast_import(stream)
+
+    assert os.listdir(commands.COMMITS_DIR) == []
+    assert open(commands.HEAD_FILE).read() == ""
+    assert refs.list_refs(commands.VCS_DIR) == {}
+
+
+def test_fast_import_restores_branches_when_head_update_fails(temp_dir):
+    """Test that branches are put back if HEAD cannot be moved"""
+    stream = _export_two_commits()
+    refs.update(commands.VCS_DIR, "main", "0" * 40)
+
+    with patch('myvcs.commands.atomic_write', side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            with patch('sys.stdout', new=StringIO()):
+                commands.fast_import(stream)
+
+    assert refs.list_refs(commands.VCS_DIR) == {"main": "0" * 40}
+
+
+def test_grep_head(temp_dir):
+    """Test searching the files of the latest commit"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "alpha\nneedle one\n", "First commit")
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.grep("needle")
+        assert fake_out.getvalue() == "test_file.txt:2:needle one\n"
+
+
+def test_grep_all_history_searches_each_blob_once(temp_dir):
+    """Test that history search reports every commit but scans shared content once"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "needle\n", "First commit")
+        _commit_file("test_file.txt", "no match\n", "Second commit")
+        _commit_file("test_file.txt", "needle\n", "Third commit")
+
+    with patch('myvcs.commands.ProcessPoolExecutor') as mock_pool_class:
+        from concurrent.futures import ThreadPoolExecutor
+        pool = ThreadPoolExecutor(max_workers=2)
+        mock_pool_class.return_value = pool
+        with patch.object(pool, 'submit', wraps=pool.submit) as mock_submit:
+            with patch('sys.stdout', new=StringIO()) as fake_out:
+                commands.grep("needle", all_history=True)
+
+    lines = fake_out.getvalue().splitlines()
+    assert len(lines) == 2
+    assert all(line.endswith(":test_file.txt:1:needle") for line in lines)
+    assert mock_submit.call_count == 2
+
+
+def test_commit_advances_current_branch(temp_dir):
+    """Test that commits move the branch HEAD is on"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "first", "First commit")
+
+    head = open(commands.HEAD_FILE).read()
+    assert refs.resolve(commands.VCS_DIR, "main") == head
+
+
+def test_branch_list_delete_and_switch(temp_dir):
+    """Test listing, switching and deleting branches"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "first", "First commit")
+        commands.branch("feature")
+        _commit_file("test_file.txt", "second", "Second commit")
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.list_branches()
+        assert fake_out.getvalue() == "  feature\n* main\n"
+
+    with patch('sys.stdout', new=StringIO()):
+        commands.switch("feature")
+
+    assert open("test_file.txt").read() == "first"
+    assert commands.current_branch() == "feature"
+    assert open(commands.HEAD_FILE).read() == refs.resolve(commands.VCS_DIR, "feature")
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.delete_branch("feature")
+        assert "Cannot delete the current branch" in fake_out.getvalue()
+
+        commands.delete_branch("main")
+        assert "Deleted branch 'main'" in fake_out.getvalue()
+
+    assert refs.resolve(commands.VCS_DIR, "main") is None
+
+
+def test_switch_removes_files_missing_from_target(temp_dir):
+    """Test that files only the old branch tracks are removed on switch"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "first", "First commit")
+        commands.branch("feature")
+        os.makedirs("docs")
+        _commit_file(os.path.join("docs", "extra.txt"), "extra", "Second commit")
+
+        commands.switch("feature")
+
+    assert not os.path.exists("docs")
+    assert open(commands.BRANCH_FILE).read() == "feature"
+
+    with patch('sys.stdout', new=StringIO()):
+        commands.switch("main")
+
+    assert open(os.path.join("docs", "extra.txt")).read() == "extra"
+
+
+def test_switch_keeps_files_of_earlier_commits(temp_dir):
+    """Test that switching between multi-commit branches restores whole trees"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("a.txt", "a", "First commit")
+        commands.branch("feat")
+        commands.switch("feat")
+        _commit_file("b.txt", "b", "Second commit")
+        _commit_file("c.txt", "c", "Third commit")
+
+        commands.switch("main")
+
+    assert open("a.txt").read() == "a"
+    assert not os.path.exists("b.txt") and not os.path.exists("c.txt")
+
+    with patch('sys.stdout', new=StringIO()):
+        commands.switch("feat")
+
+    assert [open(name).read() for name in ("a.txt", "b.txt", "c.txt")] == ["a", "b", "c"]
+
+
+def test_switch_refuses_with_unstaged_changes(temp_dir):
+    """Test that switching never overwrites edits that are not committed"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "first", "First commit")
+        commands.branch("feature")
+        _commit_file("test_file.txt", "second", "Second commit")
+
+    head = open(commands.HEAD_FILE).read()
+    with open("test_file.txt", "w") as f:
+        f.write("unsaved work")
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.switch("feature")
+        assert "would be overwritten" in fake_out.getvalue()
+        assert "test_file.txt" in fake_out.getvalue()
+
+    assert open("test_file.txt").read() == "unsaved work"
+    assert open(commands.HEAD_FILE).read() == head
+    assert commands.current_branch() == "main"
+
+
+def test_packed_refs_with_loose_overrides(temp_dir):
+    """Test that loose refs override packed ones and deletion covers both"""
+    commands.init()
+    vcs_dir = commands.VCS_DIR
+
+    refs.pack(vcs_dir, {f"ci/build-{i}": f"{i:040x}" for i in range(1000)})
+    assert not os.path.exists(os.path.join(vcs_dir, "branches", "ci"))
+    assert refs.resolve(vcs_dir, "ci/build-7") == f"{7:040x}"
+
+    refs.update(vcs_dir, "ci/build-7", "f" * 40)
+    assert refs.resolve(vcs_dir, "ci/build-7") == "f" * 40
+    assert len(refs.list_refs(vcs_dir)) == 1000
+
+    refs.delete(vcs_dir, "ci/build-7")
+    assert refs.resolve(vcs_dir, "ci/build-7") is None
+    assert "ci/build-7" not in refs.read_packed(vcs_dir)
+
+    with pytest.raises(refs.RefError):
+        refs.update(vcs_dir, "ci/build-8", "0" * 40, create=True)
+
+
+def test_ref_update_fails_while_locked(temp_dir):
+    """Test that a held lock file blocks concurrent ref updates"""
+    commands.init()
+    os.makedirs(os.path.join(commands.VCS_DIR, "branches"), exist_ok=True)
+    open(os.path.join(commands.VCS_DIR, "branches", "main.lock"), "w").close()
+
+    with pytest.raises(refs.RefError):
+        refs.update(commands.VCS_DIR, "main", "0" * 40)
+
+
+def test_pack_prunes_directories_of_packed_refs(temp_dir):
+    """Test that a branch can take the name of a directory emptied by pack"""
+    commands.init()
+    vcs_dir = commands.VCS_DIR
+
+    refs.update(vcs_dir, "feature/x", "a" * 40)
+    refs.pack(vcs_dir)
+    assert not os.path.exists(os.path.join(vcs_dir, "branches", "feature"))
+
+    refs.update(vcs_dir, "feature", "b" * 40)
+    assert refs.resolve(vcs_dir, "feature") == "b" * 40
+    assert refs.resolve(vcs_dir, "feature/x") == "a" * 40
+
+
+def test_pack_skips_refs_being_updated(temp_dir):
+    """Test that pack leaves a loose ref alone while its lock is held"""
+    commands.init()
+    vcs_dir = commands.VCS_DIR
+    branches = os.path.join(vcs_dir, "branches")
+
+    refs.update(vcs_dir, "main", "a" * 40)
+    refs.update(vcs_dir, "topic", "b" * 40)
+    open(os.path.join(branches, "topic.lock"), "w").close()
+
+    refs.pack(vcs_dir)
+
+    assert refs.read_packed(vcs_dir) == {"main": "a" * 40}
+    assert open(os.path.join(branches, "topic")).read() == "b" * 40
+    assert os.path.exists(os.path.join(branches, "topic.lock"))
+    assert not os.path.exists(os.path.join(branches, "main.lock"))
+
+
+def test_pack_keeps_loose_ref_changed_while_packing(temp_dir):
+    """Test that a loose ref rewritten during the pack is not removed"""
+    commands.init()
+    vcs_dir = commands.VCS_DIR
+    path = os.path.join(vcs_dir, "branches", "main")
+    refs.update(vcs_dir, "main", "a" * 40)
+
+    write_packed = refs._write_packed
+
+    def rewrite_during_pack(f, packed):
+        with open(path, "w") as loose:
+            loose.write("c" * 40)
+        write_packed(f, packed)
+
+    with patch('myvcs.refs._write_packed', side_effect=rewrite_during_pack):
+        refs.pack(vcs_dir)
+
+    assert refs.read_packed(vcs_dir) == {"main": "a" * 40}
+    assert refs.resolve(vcs_dir, "main") == "c" * 40
+
+
+def test_commit_crash_before_head_update(temp_dir):
+    """Test that HEAD and the index survive a crash while moving HEAD"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        commands.add("test_file.txt")
+
+    with patch('myvcs.commands.atomic_write', side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            commands.commit("Interrupted commit")
+
+    assert open(commands.HEAD_FILE).read() == ""
+    with open(commands.INDEX_FILE) as f:
+        assert json.load(f) == ["test_file.txt"]
+
+    # The commit itself was written completely and can be referenced later
+    for name in os.listdir(commands.COMMITS_DIR):
+        with open(os.path.join(commands.COMMITS_DIR, name)) as f:
+            assert json.load(f)["message"] == "Interrupted commit"
+
+
+def test_config_rejects_unknown_durability(temp_dir):
+    """Test that only known durability modes can be configured"""
+    commands.init()
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.config("durability", "sometimes")
+        assert "durability must be one of" in fake_out.getvalue()
+
+    assert commands.load_config()["durability"] == "full"
+
+
+def _commit_tree(files, message):
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        commands.add(path)
+    commands.commit(message)
+
+
+def test_sparse_clone_skips_unselected_files(temp_dir):
+    """Test that a sparse clone only reads and writes the selected cone"""
+    os.makedirs("origin")
+    os.chdir("origin")
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_tree({"app/main.py": "print()", "data/big.csv": "1,2"}, "Initial commit")
+    os.chdir(temp_dir)
+
+    with patch('myvcs.commands.load_file', wraps=commands.load_file) as mock_load:
+        with patch('sys.stdout', new=StringIO()):
+            commands.clone("origin", "copy", ["app/"])
+
+        loaded = [call.args[0] for call in mock_load.call_args_list]
+        assert loaded == ["print()"]
+
+    assert os.path.exists(os.path.join("copy", "app", "main.py"))
+    assert not os.path.exists(os.path.join("copy", "data"))
+
+
+def test_sparse_checkout_limits_add_diff_and_status(temp_dir):
+    """Test that add, diff and status ignore paths outside the sparse checkout"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_tree({"app/main.py": "print()", "data/big.csv": "1,2"}, "Initial commit")
+        commands.sparse_checkout("set", ["app/"])
+
+    assert not os.path.exists(os.path.join("data", "big.csv"))
+
+    with open(os.path.join("app", "main.py"), "w") as f:
+        f.write("print('changed')")
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.status()
+        output = fake_out.getvalue()
+        assert "modified: app/main.py" in output
+        assert "big.csv" not in output
+
+    os.makedirs("data", exist_ok=True)
+    with open(os.path.join("data", "big.csv"), "w") as f:
+        f.write("3,4")
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.add("data/big.csv")
+        commands.diff("data/big.csv")
+        assert "data/big.csv is outside the sparse checkout\n" in fake_out.getvalue()
+        assert "data/big.csv is outside the sparse checkout.\n" in fake_out.getvalue()
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.sparse_checkout("disable")
+        assert "Warning: keeping" not in fake_out.getvalue()
+
+    # Re-selecting data/ keeps the locally modified copy of big.csv
+    assert open(os.path.join("data", "big.csv")).read() == "3,4"
+
+
+def test_log_stat(temp_dir):
+    """Test per-commit change summaries in the log"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "one\ntwo\nthree\n", "First commit")
+        _commit_tree({"test_file.txt": "one\n2\nthree\nfour\n", "another_file.txt": "more content"}, "Second commit")
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.log(stat=True)
+        output = fake_out.getvalue()
+
+    assert " test_file.txt    | 3 ++-" in output
+    assert " another_file.txt | 1 +" in output
+    assert "2 files changed, 3 insertions(+), 1 deletion(-)" in output
+    assert "1 file changed, 3 insertions(+), 0 deletions(-)" in output
+
+
+def test_stat_is_cached_and_skips_unchanged_files(temp_dir):
+    """Test that unchanged entries are not read and results are cached"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_tree({"test_file.txt": "same", "another_file.txt": "old"}, "First commit")
+        _commit_tree({"test_file.txt": "same", "another_file.txt": "new"}, "Second commit")
+
+    head = open(commands.HEAD_FILE).read()
+
+    with patch('myvcs.stats.count_changes', wraps=stats.count_changes) as mock_count:
+        assert stats.commit_stat(commands.VCS_DIR, head) == [["another_file.txt", 1, 1]]
+        assert stats.commit_stat(commands.VCS_DIR, head) == [["another_file.txt", 1, 1]]
+        mock_count.assert_called_once_with("old", "new")
+
+
+def test_show_commit_diff(temp_dir):
+    """Test showing the changes made by a commit"""
+    with patch('sys.stdout', new=StringIO()):
+        commands.init()
+        _commit_file("test_file.txt", "before\n", "First commit")
+        _commit_file("test_file.txt", "after\n", "Second commit")
+
+    with patch('sys.stdout', new=StringIO()) as fake_out:
+        commands.show("main")
+        output = fake_out.getvalue()
+
+    assert "Message: Second commit" in output
+    assert "-before" in output
+    assert "+after" in output
+
+
+def test_grep_rejects_non_positive_jobs(temp_dir):
+    """Test that --jobs below 1 is a usage error, not a crash"""
+    from myvcs import cli
+    for jobs in ("0", "-2"):
+        with patch('sys.argv', ["myvcs", "grep", "needle", "-j", jobs]):
+            with patch('sys.stderr', new=StringIO()) as fake_err:
+                with pytest.raises(SystemExit) as exit_info:
+                    cli.main()
+        assert exit_info.value.code == 2
+        assert "must be at least 1" in fake_err.getvalue()
@@ -0,0 +1,72 @@
+import os
+import pytest
+from unittest.mock import patch
+from myvcs.utils import BatchWriter, atomic_write
+
+
+def test_batch_writer_publishes_on_flush(tmp_path):
+    """Test that batched files only appear once the batch is flushed"""
+    target = tmp_path / "objects" / "ab" / "cdef"
+    writer = BatchWriter("full")
+
+    writer.write(str(target), b"data")
+    assert not target.exists()
+    assert writer.exists(str(target))
+
+    with patch('myvcs.utils.fsync_dir') as mock_fsync_dir:
+        writer.flush()
+        mock_fsync_dir.assert_called_once_with(str(target.parent))
+
+    assert target.read_bytes() == b"data"
+    assert os.listdir(target.parent) == ["cdef"]
+
+
+def test_batch_writer_syncs_once_per_batch(tmp_path):
+    """Test that "batch" syncs a batch as a whole and "full" every file"""
+    paths = [str(tmp_path / name) for name in ("a", "b", "c")]
+
+    writer = BatchWriter("batch")
+    for path in paths:
+        writer.write(path, b"data")
+    with patch('myvcs.utils.os.fsync') as mock_fsync, patch('myvcs.utils.os.sync') as mock_sync:
+        writer.flush()
+    mock_fsync.assert_not_called()
+    assert mock_sync.call_count == 2
+
+    writer = BatchWriter("full")
+    for path in paths:
+        writer.write(path + ".full", b"data")
+    with patch('myvcs.utils.os.fsync') as mock_fsync, patch('myvcs.utils.os.sync') as mock_sync:
+        writer.flush()
+    # One per file plus one for their directory
+    assert mock_fsync.call_count == 4
+    mock_sync.assert_not_called()
+
+
+def test_batch_writer_discards_on_error(tmp_path):
+    """Test that a failed batch leaves no files behind"""
+    target = tmp_path / "commit"
+
+    with pytest.raises(RuntimeError):
+        with BatchWriter("none") as writer:
+            writer.write(str(target), b"partial")
+            raise RuntimeError("crash")
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_batch_writer_rejects_unknown_mode():
+    """Test that unknown durability modes are rejected"""
+    with pytest.raises(ValueError):
+        BatchWriter("sometimes")
+
+
+def test_atomic_write_replaces_content(tmp_path):
+    """Test that atomic_write replaces the file and cleans up its temp file"""
+    target = tmp_path / "HEAD"
+    target.write_text("old")
+
+    atomic_write(str(target), "new")
+
+    assert target.read_text() == "new"
+    assert os.listdir(tmp_path) == ["HEAD"]